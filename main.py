@@ -10,12 +10,13 @@ if __name__ == '__main__':
     logger = set_logger()
     explorer_flag = False   # explorer开关
     conversion_flag = False # conversion开关
+    resume_flag = False     # 从 doc/utg 中的探索日志恢复上次中断的探索
 
-    if explorer_flag or not os.listdir('doc/utg'):
+    if explorer_flag or resume_flag or not os.listdir('doc/utg'):
         logger.info('Start exploring...')
         dlg_wrapper = get_wrapper_object(weixin_title)
         handle = dlg_wrapper.element_info.handle
-        expl = explorer.Explorer(handle, 'doc/utg')
+        expl = explorer.Explorer(handle, 'doc/utg', resume=resume_flag)
         expl.explore()
 
     if conversion_flag or not os.path.exists('doc/appdoc.yaml'):
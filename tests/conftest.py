@@ -0,0 +1,14 @@
+import os
+
+import pytest
+
+import utils.classifier as classifier
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(autouse=True)
+def offline_env(monkeypatch):
+    """测试数据 (doc/utg、script) 按仓库根目录的相对路径读取；动态控件判断不调用大模型，标题不全相同即视为动态"""
+    monkeypatch.chdir(REPO_ROOT)
+    monkeypatch.setattr(classifier, "analyze_control_texts", lambda texts: len(set(texts)) > 1)
@@ -0,0 +1,198 @@
+"""离线单元测试 (界面采集：列表滚动、稳定检测、控件快照、并行/差量采集与采集裁剪策略)，不需要启动微信"""
+
+
+def test_list_scroller():
+    """用模拟的虚拟化列表测试自适应滚动器：条目完整、不重复，且到达边缘后立即停止"""
+    from utils.replay import VirtualListWrapper
+    from utils.scroller import ListScroller
+
+    items = [f'联系人{i % 37}' for i in range(500)]  # 含重复标题的长列表
+    for supports_home in (True, False):
+        list_ctrl = VirtualListWrapper(items, page_size=10, supports_home=supports_home)
+        list_ctrl.top_index = 123
+        scroller = ListScroller(list_ctrl)
+        assert scroller.scroll_to_edge('top')
+        assert list_ctrl.top_index == 0
+        collected = [child.window_text() for child in scroller.iter_new_items()]
+        assert collected == items
+        assert scroller.stats['keystrokes'] <= 2 * len(items) // 10 + 4
+        print(supports_home, scroller.stats)
+
+    # 整页重复的标题：由 ScrollPattern 的滚动位置判断是否到达底部与新露出的条目
+    for items in (['a', 'b'] * 50, [f'x{i % 5}' for i in range(100)], ['好的'] * 30 + [f'消息{i}' for i in range(30)],
+                  ['好的'] * 25, ['好的'] * 5):
+        list_ctrl = VirtualListWrapper(items, page_size=10, supports_home=False)
+        list_ctrl.top_index = list_ctrl.max_top_index
+        scroller = ListScroller(list_ctrl)
+        assert scroller.scroll_to_edge('top') and list_ctrl.top_index == 0
+        assert [child.window_text() for child in scroller.iter_new_items()] == items
+        assert scroller.stats['seconds'] > 0
+    list_ctrl = VirtualListWrapper(['好的'] * 30 + ['收到'] * 10, page_size=10, supports_scroll=False)
+    scroller = ListScroller(list_ctrl)
+    for child in scroller.iter_new_items():   # 调用方提前结束迭代时同样记录耗时
+        break
+    assert scroller.stats['items'] == 1 and scroller.stats['seconds'] > 0
+
+def test_settle_detector():
+    """用按脚本延迟变化的模拟窗口测试界面稳定检测：界面不变时立即返回，持续变化时等到最终状态"""
+    from utils.replay import ReplayBackend, ScriptedWindow, wrapper_from_xml
+    from utils.settle import SettleDetector, window_fingerprint
+
+    backend = ReplayBackend()
+    roots = [wrapper_from_xml(f'doc/utg/state{i}.xml', backend) for i in range(4)]
+    window = ScriptedWindow(roots[0])
+    detector = SettleDetector(timeout=1.0, interval=0.05)
+    fingerprint = lambda: window_fingerprint(window)
+
+    _, elapsed = detector.wait(fingerprint)  # 界面无变化
+    assert elapsed < 0.1
+
+    window.schedule([(0.04, roots[1]), (0.08, roots[2]), (0.12, roots[3])])  # 慢速面板，分阶段加载
+    final, elapsed = detector.wait(fingerprint)
+    assert final == window_fingerprint(window) and window.current_root() is roots[3]
+    assert 0.12 <= elapsed < 0.3
+
+    window.schedule([(0.02 * i, roots[i % 4]) for i in range(1, 100)])  # 一直变化，达到等待上限
+    _, elapsed = detector.wait(fingerprint)
+    assert detector.timeouts == 1 and elapsed >= 1.0
+    print(detector.summary())
+
+def test_control_snapshot():
+    """批量属性读取：快照属性与逐个读取一致，导出时每个节点只需一次UIA调用"""
+    import xml.etree.ElementTree as ET
+    import utils.classifier as classifier
+    from utils.control_snapshot import read_props, snapshot_control
+    from utils.gui_tree_exporter import control_info_to_xml
+    from utils.replay import ReplayBackend, wrapper_from_xml
+
+    analyze_control_texts = classifier.analyze_control_texts
+    analyzed = []
+    classifier.analyze_control_texts = lambda texts: analyzed.append(texts) or len(set(texts)) > 1  # 不调用大模型
+    try:
+        backend = ReplayBackend()
+        root = wrapper_from_xml('doc/utg/state0.xml', backend)
+        for child, live in zip(snapshot_control(root).children(), root.children()):
+            expected = read_props(live)
+            assert {key: child.props[key] for key in expected} == expected
+        backend.reset()
+        elem = control_info_to_xml(root, llm_trigger=False)
+        nodes = len(list(elem.iter()))
+        assert nodes == len(list(ET.parse('doc/utg/state0.xml').getroot().iter()))
+        assert backend.total_calls == backend.calls["build_cache"] == nodes + 1
+    finally:
+        classifier.analyze_control_texts = analyze_control_texts
+
+def test_parallel_capture():
+    """并行采集子树：结果与串行采集完全一致，后端不支持多线程时退回串行"""
+    import os
+    import tempfile
+    import utils.classifier as classifier
+    from utils.gui_tree_exporter import export_gui_xml_structure
+    from utils.replay import ReplayBackend, wrapper_from_xml
+
+    analyze_control_texts = classifier.analyze_control_texts
+    analyzed = []
+    classifier.analyze_control_texts = lambda texts: analyzed.append(texts) or len(set(texts)) > 1  # 不调用大模型
+    try:
+        with tempfile.TemporaryDirectory() as output_dir:
+            exported = []
+            for workers, thread_safe in ((1, True), (8, True), (8, False)):
+                backend = ReplayBackend(latency=0.001)
+                backend.thread_safe = thread_safe
+                root = wrapper_from_xml('doc/utg/state4.xml', backend)
+                xml_path = export_gui_xml_structure(root, os.path.join(output_dir, f"{workers}_{thread_safe}"),
+                                                    state_num=4, max_workers=workers)
+                with open(xml_path, 'rb') as f:
+                    exported.append(f.read())
+            assert exported[0] == exported[1] == exported[2]
+    finally:
+        classifier.analyze_control_texts = analyze_control_texts
+
+def test_incremental_capture():
+    """差量采集：界面切换后复用未变化的子树，结果与完整采集一致，读取次数相同而动态控件判断更少；之前为空的容器被填充后重新采集"""
+    import os
+    import tempfile
+    import xml.etree.ElementTree as ET
+    import utils.classifier as classifier
+    from utils.gui_tree_exporter import export_gui_xml_structure
+    from utils.replay import ReplayBackend, ReplayApp, wrapper_from_xml
+
+    analyze_control_texts = classifier.analyze_control_texts
+    analyzed = []
+    classifier.analyze_control_texts = lambda texts: analyzed.append(texts) or len(set(texts)) > 1  # 不调用大模型
+    try:
+        with tempfile.TemporaryDirectory() as output_dir:
+            backend = ReplayBackend()
+            app = ReplayApp('doc/utg', backend=backend)
+            previous = ET.parse(export_gui_xml_structure(app.window, os.path.join(output_dir, "prev"), max_workers=1))
+            for state_num in (0, 2):  # 界面不变、切换到另一主界面
+                app.main_state = state_num
+                exported = []
+                for name, kwargs in (("full", dict(max_workers=1)), ("incremental", dict(max_workers=1, previous=previous.getroot())),
+                                     ("parallel", dict(max_workers=4, previous=previous.getroot()))):
+                    backend.reset()
+                    classifier.clear_group_semantics_cache()
+                    analyzed.clear()
+                    xml_path = export_gui_xml_structure(app.window, os.path.join(output_dir, name), state_num=state_num, **kwargs)
+                    with open(xml_path, 'rb') as f:
+                        exported.append((f.read(), backend.total_calls, len(analyzed)))
+                assert exported[0][0] == exported[1][0] == exported[2][0]
+                assert exported[0][1] == exported[1][1] == exported[2][1]   # 每个节点仍读取一次，省下的是动态控件判断
+                assert exported[1][2] == exported[2][2] <= exported[0][2]
+                print(state_num, [(calls, groups) for _, calls, groups in exported])
+
+            for state_num in (0, 2, 7, 16):  # 上一快照中某个容器为空 (动作后才填充)
+                window = wrapper_from_xml(f'doc/utg/state{state_num}.xml', ReplayBackend())
+                emptied = ET.parse(export_gui_xml_structure(window, os.path.join(output_dir, "before"), max_workers=1)).getroot()
+                container = next(elem for elem in emptied if len(elem))
+                for child in list(container):
+                    container.remove(child)
+                exported = []
+                for name, kwargs in (("full", dict(max_workers=1)), ("incremental", dict(max_workers=1, previous=emptied)),
+                                     ("parallel", dict(max_workers=4, previous=emptied))):
+                    xml_path = export_gui_xml_structure(window, os.path.join(output_dir, f"filled_{name}"),
+                                                        state_num=state_num, **kwargs)
+                    with open(xml_path, 'rb') as f:
+                        exported.append(f.read())
+                assert exported[0] == exported[1] == exported[2]
+    finally:
+        classifier.analyze_control_texts = analyze_control_texts
+
+def test_capture_policy():
+    """采集裁剪策略：串行、并行与差量采集结果一致，实时结构指纹与导出结果一致，裁剪后兄弟控件下标不变"""
+    import os
+    import tempfile
+    import xml.etree.ElementTree as ET
+    import utils.classifier as classifier
+    from utils.action_planner import plan_actions, resolve_control
+    from utils.capture_policy import OMITTED_TAG, CapturePolicy
+    from utils.explorer import live_state_fingerprint, state_fingerprint
+    from utils.gui_tree_exporter import export_gui_xml_structure
+    from utils.replay import ReplayBackend, wrapper_from_xml
+
+    analyze_control_texts = classifier.analyze_control_texts
+    analyzed = []
+    classifier.analyze_control_texts = lambda texts: analyzed.append(texts) or len(set(texts)) > 1  # 不调用大模型
+    try:
+        with tempfile.TemporaryDirectory() as output_dir:
+            for policy in ("compact", CapturePolicy(max_run=1, full_capture={"TitleBar"})):
+                root = wrapper_from_xml('doc/utg/state7.xml', ReplayBackend())
+                full = ET.parse(export_gui_xml_structure(root, os.path.join(output_dir, "full"), 7, max_workers=1))
+                exported = []
+                for name, kwargs in (("serial", dict(max_workers=1)), ("parallel", dict(max_workers=4)),
+                                     ("incremental", dict(max_workers=1, previous=full.getroot()))):
+                    xml_path = export_gui_xml_structure(root, os.path.join(output_dir, name), 7, policy=policy, **kwargs)
+                    with open(xml_path, 'rb') as f:
+                        exported.append(f.read())
+                assert exported[0] == exported[1] == exported[2]
+                pruned = ET.parse(xml_path)
+                assert pruned.getroot().find(f".//{OMITTED_TAG}") is not None
+                assert len(list(pruned.iter())) < len(list(full.iter()))
+                assert live_state_fingerprint(root, policy=policy) == state_fingerprint(pruned)
+                # 由裁剪后的快照规划的动作与完整快照中同一控件的标识与下标路径一致
+                full_plans = {planned["xpath"]: planned["index_path"] for planned in plan_actions(full, 7)}
+                for planned in plan_actions(pruned, 7):
+                    assert full_plans[planned["xpath"]] == planned["index_path"]
+                    assert resolve_control(wrapper_from_xml(xml_path), planned["index_path"], planned["tag"])
+    finally:
+        classifier.analyze_control_texts = analyze_control_texts
@@ -0,0 +1,275 @@
+"""离线单元测试 (探索：窗口登记、动作规划、状态比较与存储、探索日志、调度与动作结果缓存)，不需要启动微信"""
+
+
+def test_window_registry():
+    """顶层窗口注册表：动作期间新开的窗口记为由该动作打开，动作之外的变化与关闭的窗口不计入"""
+    from utils.window_registry import WindowRegistry
+
+    windows = [1]
+    registry = WindowRegistry([4242], list_windows=lambda: list(windows))
+    first, second = (0, '/Dialog/Button[@title="a"]', 'click', 'null'), (0, '/Dialog/Button[@title="b"]', 'click', 'null')
+    windows.append(2)   # 动作开始前出现的窗口
+    registry.begin_action(first)
+    windows.append(3)
+    assert registry.end_action() == ({3}, set())
+    assert registry.opened_by(2) is None and registry.opened_by(3) == first
+
+    registry.begin_action(second)
+    windows.remove(3)
+    windows.append(4)
+    assert registry.end_action() == ({4}, {3})
+    assert registry.opened_by(4) == second and registry.opened_by(3) is None
+    windows.append(5)   # 动作之外新开的窗口
+    assert registry.refresh() == ({5}, set()) and registry.opened_by(5) is None
+
+def test_action_planner():
+    """由状态快照规划动作：定位到的实时控件类型与快照一致，且每个动作只需少量UIA调用"""
+    import xml.etree.ElementTree as ET
+    import utils.classifier as classifier
+    from utils.action_planner import plan_actions, resolve_control
+    from utils.replay import ReplayBackend, wrapper_from_xml
+
+    analyze_control_texts = classifier.analyze_control_texts
+    analyzed = []
+    classifier.analyze_control_texts = lambda texts: analyzed.append(texts) or len(set(texts)) > 1  # 不调用大模型
+    classifier.clear_group_semantics_cache()
+    try:
+        for i in (0, 4, 18):
+            tree = ET.parse(f'doc/utg/state{i}.xml')
+            backend = ReplayBackend()
+            root = wrapper_from_xml(f'doc/utg/state{i}.xml', backend)
+            planned_actions = plan_actions(tree, i)
+            assert planned_actions and backend.total_calls == 0  # 规划阶段不访问界面
+            children_cache = {}
+            for planned in planned_actions:
+                ctrl = resolve_control(root, planned["index_path"], planned["tag"], children_cache)
+                assert ctrl.props["friendly_class_name"] == planned["tag"]
+                assert planned["xpath"].startswith(f"/{tree.getroot().tag}/")
+            assert backend.total_calls <= 4 * len(planned_actions)
+            print(i, len(planned_actions), backend.calls)
+    finally:
+        classifier.analyze_control_texts = analyze_control_texts
+        classifier.clear_group_semantics_cache()
+
+def test_state_similarity():
+    """近似重复状态：动态控件组的增减不改变结构相似度，协调器将近似重复的状态归入已有状态，恢复后别名仍然有效"""
+    import copy
+    import os
+    import tempfile
+    import xml.etree.ElementTree as ET
+    from utils.coordinator import ExplorationCoordinator
+    from utils.explorer import state_fingerprint
+    from utils.similarity import StateSimilarityIndex, jaccard, structure_shingles
+
+    states = {num: ET.parse(f'doc/utg/state{num}.xml') for num in (2, 6, 11, 16)}
+    shingles = {num: structure_shingles(state.getroot()) for num, state in states.items()}
+    assert jaccard(shingles[2], shingles[11]) >= 0.93 > jaccard(shingles[2], shingles[6])
+    # 动态列表多一个条目，结构指纹不同但 shingle 集合不变
+    longer = copy.deepcopy(states[16])
+    parent = next(elem for elem in longer.iter() if any(child.get('is_dynamic') == 'True' for child in elem))
+    parent.append(copy.deepcopy(next(child for child in parent if child.get('is_dynamic') == 'True')))
+    assert state_fingerprint(longer) != state_fingerprint(states[16])
+    assert structure_shingles(longer.getroot()) == shingles[16]
+
+    index = StateSimilarityIndex(0.93)
+    for num in (2, 6, 16):
+        index.add(num, shingles[num])
+    assert index.best_match(shingles[11])[0] == 2
+    assert index.best_match(structure_shingles(ET.Element('Dialog'))) is None
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        coordinator = ExplorationCoordinator(output_dir, similarity_threshold=0.93)
+        for num in (2, 6, 11):
+            captured_xml = os.path.join(output_dir, f'captured{num}.xml')
+            states[num].write(captured_xml)
+            coordinator.register_state(states[num], state_fingerprint(states[num]), captured_xml)
+        assert sorted(coordinator.visited_states) == [0, 1]
+        assert coordinator.state_fingerprints[state_fingerprint(states[11])] == 0
+        coordinator.journal.close()
+        resumed = ExplorationCoordinator(output_dir, resume=True, similarity_threshold=0.93)
+        assert resumed.match_state(state_fingerprint(states[11])) == 0
+        assert resumed.match_state('unknown', states[6]) == 1
+        resumed.journal.close()
+
+def test_state_store():
+    """差量存储：相似状态保存为编辑脚本，重建结果与原XML一致；跳转差异摘要给出变化的子树"""
+    import os
+    import shutil
+    import tempfile
+    import xml.etree.ElementTree as ET
+    from utils.state_store import StateStore, diff_summary, load_states
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        store = StateStore(output_dir, max_chain=2)
+        for state_num, source in enumerate((0, 2, 11, 6)):
+            captured_xml = os.path.join(output_dir, 'captured.xml')
+            shutil.copy(f'doc/utg/state{source}.xml', captured_xml)
+            store.save(state_num, ET.parse(captured_xml).getroot(), captured_xml)
+        assert store.bases == {0: None, 1: 0, 2: 1, 3: 1}  # 状态2的差量链已满，状态3以状态1为基准
+        assert os.path.getsize(store.path(2)) < 0.05 * os.path.getsize('doc/utg/state11.xml')
+        for state_num, root in load_states(output_dir).items():
+            source = ET.parse(f'doc/utg/state{(0, 2, 11, 6)[state_num]}.xml').getroot()
+            assert ET.tostring(root) == ET.tostring(source)
+
+    state2, state6 = ET.parse('doc/utg/state2.xml').getroot(), ET.parse('doc/utg/state6.xml').getroot()
+    assert diff_summary(state2, state6) == {"added": ['/Dialog/Dialog[@title="Weixin"]']}
+    assert diff_summary(state6, state2) == {"removed": ['/Dialog/Dialog[@title="Weixin"]']}
+    assert diff_summary(state2, state2) == {}
+
+def test_bounded_state_cache():
+    """已访问状态只在字节预算内保留解析后的树，被淘汰的状态访问时从磁盘重新读取"""
+    import os
+    import shutil
+    import tempfile
+    import xml.etree.ElementTree as ET
+    from utils.coordinator import ExplorationCoordinator
+    from utils.explorer import state_fingerprint
+    from utils.state_store import tree_bytes
+
+    states = {num: ET.parse(f'doc/utg/state{num}.xml') for num in (0, 6, 16)}
+    with tempfile.TemporaryDirectory() as output_dir:
+        coordinator = ExplorationCoordinator(output_dir, state_cache_bytes=tree_bytes(states[16].getroot()))
+        for num, state in states.items():
+            captured_xml = os.path.join(output_dir, 'captured.xml')
+            shutil.copy(f'doc/utg/state{num}.xml', captured_xml)
+            coordinator.register_state(state, state_fingerprint(state), captured_xml)
+        cache = coordinator.store.cache
+        assert sorted(coordinator.visited_states) == [0, 1, 2] and 0 in coordinator.visited_states
+        assert list(cache.entries) == [2] and cache.stats["evictions"] == 2
+        assert ET.tostring(coordinator.visited_states[0].getroot()) == ET.tostring(states[0].getroot())
+        assert list(cache.entries) == [0]  # 重新读取的状态0挤出了状态2
+        coordinator.journal.close()
+
+def test_exploration_journal():
+    """探索日志：崩溃留下的半行记录被丢弃，恢复后前沿与已完成动作正确，UTG.yaml 可由日志重新生成"""
+    import os
+    import tempfile
+    import yaml
+    from utils.journal import ExplorationJournal
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        journal = ExplorationJournal(output_dir)
+        for state_num in (0, 1):
+            xml_path = os.path.join(output_dir, f'state{state_num}.xml')
+            with open(xml_path, 'w', encoding='utf-8') as f:
+                f.write('<Dialog />')
+            journal.record_state(state_num, f'fp{state_num}', xml_path)
+        keys = [(0, '/Dialog/Button[0]', 'click', 'null'), (0, '/Dialog/Button[1]', 'click', 'null')]
+        journal.record_plan(0, keys)
+        journal.record_action(keys[0], 1)
+        transition = {"Action": "click", "Content": "null", "Control_Identifier": keys[0][1], "State": 0, "New_State_Num": 1}
+        journal.record_transition(transition)
+        journal.record_transition(transition)
+        journal.close()
+        with open(journal.path, 'a', encoding='utf-8') as f:
+            f.write('{"event": "action", "key": [0, "/Dia')  # 进程在写入过程中被杀
+
+        resumed = ExplorationJournal(output_dir, resume=True)
+        assert sorted(resumed.states) == [0, 1]
+        assert resumed.frontier() == {0: [keys[1]]}
+        assert not resumed.is_done(keys[0])  # 目标状态尚未探索完，恢复后需要重新进入
+        resumed.record_state_done(1)
+        assert resumed.is_done(keys[0])
+        with open(resumed.compact(), encoding='utf-8') as f:
+            assert yaml.safe_load(f)['transitions'] == [transition]
+        resumed.close()
+        reopened = ExplorationJournal(output_dir, resume=True)
+        assert reopened.completed_states == {1}
+        reopened.close()
+
+def test_frontier_scheduler():
+    """前沿调度：优先执行当前状态中新颖的动作，其次沿最短已知路径导航，无法到达时才重启"""
+    from utils.scheduler import FrontierScheduler
+
+    tab = lambda state: (state, '/Dialog/Toolbar/Button[@title="通讯录"]', 'click', 'null')
+    entry = lambda state, i: (state, f'/Dialog/GroupBox/Button[{i}]', 'click', 'null')
+    scheduler = FrontierScheduler(reset_cost=10)
+    scheduler.add_state(0, [tab(0), entry(0, 0), entry(0, 1)])
+    assert scheduler.next_action(0) == (tab(0), [], False)
+    scheduler.record(tab(0), 1)
+    scheduler.add_state(1, [tab(1), entry(1, 5)])
+    # 导航栏已在状态0执行过，状态1中的新控件优先
+    assert scheduler.next_action(1) == (entry(1, 5), [], False)
+    scheduler.record(entry(1, 5), 2)
+    scheduler.add_state(2, [])
+    # 状态2没有返回的路径，回到状态0的动作需要重启
+    assert scheduler.next_action(2) == (entry(0, 0), [], True)
+    assert scheduler.shortest_paths(0)[2] == [tab(0), entry(1, 5)]
+    scheduler.drop_state(0)
+    assert scheduler.next_action(2) == (tab(1), [tab(0)], True)
+    assert scheduler.pending() == 1
+
+def test_scheduler_claims():
+    """并行探索：已认领的动作不会分给其他 worker，其他 worker 发现的状态中的动作排在自己的之后"""
+    from utils.scheduler import FrontierScheduler
+
+    entry = lambda state, i: (state, f'/Dialog/GroupBox/Button[{i}]', 'click', 'null')
+    scheduler = FrontierScheduler(steal_cost=2)
+    scheduler.add_state(0, [entry(0, 0), entry(0, 1)])
+    assert scheduler.next_action(0, worker="w0")[0] == entry(0, 0)
+    assert scheduler.next_action(0, worker="w1")[0] == entry(0, 1)
+    assert scheduler.next_action(0, worker="w1") is None
+    scheduler.release(entry(0, 1))
+    scheduler.record(entry(0, 0), 1)
+    scheduler.add_state(1, [entry(1, 2), entry(1, 3)], owner="w0")
+    scheduler.record(entry(1, 3), 2)
+    scheduler.add_state(2, [entry(2, 4)], owner="w1")
+    # 同在状态1时，w0 执行自己发现的状态中的动作，w1 则多走一步回到自己发现的状态2
+    assert scheduler.next_action(1, worker="w1") == (entry(2, 4), [entry(1, 3)], False)
+    assert scheduler.next_action(1, worker="w0") == (entry(1, 2), [], False)
+    scheduler.release_worker("w1")
+    assert scheduler.claimed == {entry(1, 2): "w0"}
+
+def test_outcome_cache():
+    """动作结果缓存：同一区域的控件在两个状态中结果一致后预测其他状态，输入框的不同输入结果重复后预测其余输入"""
+    import xml.etree.ElementTree as ET
+    from utils.explorer import TEST_INPUTS
+    from utils.outcome_cache import OutcomeCache
+    from utils.scheduler import FrontierScheduler
+    from utils.state_store import element_xpaths
+
+    roots = {num: ET.parse(f'doc/utg/state{num}.xml').getroot() for num in (0, 2, 6)}
+    xpaths = list(element_xpaths(roots[0]).values())
+    setting = next(xpath for xpath in xpaths if xpath.endswith('tabbar_setting"]'))
+    search = next(xpath for xpath in xpaths if xpath.endswith('Edit[@name="搜索"]'))
+    keys = {num: [(num, setting, 'click', 'null')] + [(num, search, 'input', text) for text in TEST_INPUTS]
+            for num in roots}
+    cache = OutcomeCache()
+    for num, root in roots.items():
+        cache.add_state(num, root, keys[num])
+    assert cache.record(keys[0][0], 9) == [] and cache.predict(keys[2][0]) is None  # 只在一个状态中观察到
+    assert cache.record(keys[2][0], 9) == [keys[6][0]] and cache.predict(keys[6][0]) == 9
+    assert cache.record(keys[0][1], 0) == []
+    assert sorted(cache.record(keys[0][2], 0)) == sorted(keys[0][3:])  # 两种输入都停留在原状态
+    assert cache.predict(keys[0][4]) == 0 and cache.predict(keys[2][1]) is None
+
+    scheduler = FrontierScheduler()
+    scheduler.add_state(6, keys[6][:2])
+    scheduler.defer(keys[6][0])
+    assert scheduler.next_action(6)[0] == keys[6][1]  # 可预测的动作排在其他动作之后
+    scheduler.record(keys[6][0], 9, predicted=True)
+    assert 9 not in scheduler.shortest_paths(6)   # 预测的边不用于导航
+
+def test_spatial_index():
+    """控件几何索引：点查询与区域查询和逐个比较的结果一致，弹出框遮挡主窗口的控件时规划可见的点击位置"""
+    import xml.etree.ElementTree as ET
+    import numpy as np
+    from utils.action_planner import plan_actions
+    from utils.geometry import StateGeometry, rect_intersects, synthetic_geometry, tree_walk_at
+
+    rects, parents = synthetic_geometry(5000)
+    geometry = StateGeometry(rects, parents)
+    for x, y in [(0, 0), (517, 333), (1919, 1079), (960, 540)]:
+        assert geometry.elements_at(x, y) == tree_walk_at(rects, parents, x, y)
+    region = (300, 200, 700, 650)
+    assert geometry.query_region(region) == \
+        np.flatnonzero(geometry.visible & rect_intersects(geometry.clips, region)).tolist()
+
+    state = ET.parse('doc/utg/state15.xml')   # 搜索结果弹出框覆盖在收藏列表之上
+    geometry = StateGeometry.from_xml(state.getroot(), transparent=["Pane", "Dialog", "GroupBox"])
+    navbar = next(i for i, elem in enumerate(geometry.elements) if elem.attrib.get("auto_id") == "fav_navbar_list")
+    assert geometry.elements[geometry.occluder(navbar)].tag == "ListItem"
+    planned = {item["xpath"]: item for item in plan_actions(state, 15)}
+    navbar = next(item for xpath, item in planned.items() if xpath.endswith('"fav_navbar_list"]'))
+    assert navbar["click_point"] is not None and not navbar["hidden"]
+    assert all(item["click_point"] is None for xpath, item in planned.items() if 'Dialog[@title="Weixin"]' in xpath)
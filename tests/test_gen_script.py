@@ -0,0 +1,49 @@
+"""离线单元测试 (脚本批量生成)，不需要启动微信"""
+
+
+def test_batch_generation():
+    """批量生成：任务去重、失败任务重跑后每个任务只保留一条记录、已成功的任务不再请求"""
+    import json
+    import os
+    import tempfile
+    from utils.gen_script import UIScriptGenerator, get_task_id, load_batch_tasks
+
+    generator = UIScriptGenerator('doc/appdoc.yaml', 'doc/utg/UTG.yaml')
+    requested, failing = [], {'打开朋友圈'}
+
+    def fake_request(task, agent=None):
+        requested.append(task)
+        if task in failing:
+            raise RuntimeError('timeout')
+        return f"1. {task}", {'total_tokens': 1}
+    generator._request_script = fake_request
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        task_file, output_path = os.path.join(tmp_dir, 'tasks.txt'), os.path.join(tmp_dir, 'out', 'scripts.jsonl')
+        with open(task_file, 'w', encoding='utf-8') as f:
+            f.write("# 示例任务\n发送消息给  文件传输助手\n\n打开朋友圈\n发送消息给 文件传输助手\n")
+        assert load_batch_tasks(task_file) == [(2, '发送消息给 文件传输助手'), (4, '打开朋友圈'), (5, '发送消息给 文件传输助手')]
+        jsonl_file = os.path.join(tmp_dir, 'tasks.jsonl')
+        with open(jsonl_file, 'w', encoding='utf-8') as f:
+            f.write('{"task": "打开朋友圈"}\n{"task": ""}\n["打开通讯录"]\n{"task": "打开\n{"task": "打开收藏"}\n')
+        assert load_batch_tasks(jsonl_file) == [(1, '打开朋友圈'), (5, '打开收藏')]
+
+        stats = generator.generate_batch(task_file, output_path, max_workers=2)
+        assert stats == {"total": 3, "unique": 2, "skipped": 0, "succeeded": 1, "failed": 1}
+        with open(output_path, 'a', encoding='utf-8') as f:
+            f.write('{"task_id": "torn')  # 中断时写了一半的行
+
+        failing.clear()
+        requested.clear()
+        stats = generator.generate_batch(task_file, output_path, max_workers=2)
+        assert stats == {"total": 3, "unique": 2, "skipped": 1, "succeeded": 1, "failed": 0}
+        assert requested == ['打开朋友圈']
+        with open(output_path, encoding='utf-8') as f:
+            records = [json.loads(line) for line in f]
+        assert sorted(record['task_id'] for record in records) == \
+            sorted([get_task_id('打开朋友圈'), get_task_id('发送消息给 文件传输助手')])
+        assert all(record['status'] == 'ok' for record in records)
+        assert [record['lines'] for record in records if record['task'] != '打开朋友圈'] == [[2, 5]]
+
+        requested.clear()
+        assert generator.generate_batch(task_file, output_path)["skipped"] == 2 and requested == []
@@ -0,0 +1,292 @@
+"""离线单元测试 (知识库：增量索引、向量库、嵌入流水线、文档解析与常驻检索服务)，不需要启动微信"""
+
+
+def test_index_manifest():
+    """增量索引：旧版本(无版本号)清单对应的索引整体重新分块，旧的逐标量分块被删除"""
+    import json
+    import os
+    import tempfile
+    from langchain_core.embeddings import Embeddings
+    import utils.data_proc as data_proc
+
+    class FakeEmbeddings(Embeddings):
+        def __init__(self, *args, **kwargs):
+            pass
+        def embed_documents(self, texts):
+            return [[float(len(text)), 1.0] for text in texts]
+        def embed_query(self, text):
+            return [float(len(text)), 1.0]
+
+    lazy_embeddings, load_yaml, loader_version = \
+        data_proc.LazyHuggingFaceEmbeddings, data_proc.load_yaml_to_doc, data_proc.LOADER_VERSION
+    data_proc.LazyHuggingFaceEmbeddings = FakeEmbeddings
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            doc_dir, db_dir = os.path.join(tmp_dir, 'doc'), os.path.join(tmp_dir, 'db')
+            os.makedirs(doc_dir)
+            with open(os.path.join(doc_dir, 'appdoc.yaml'), 'w', encoding='utf-8') as f:
+                f.write("pages:\n- page_name: 主界面\n  summary: 聊天列表\n  controls:\n  - name: 搜索\n    description: 搜索框\n")
+            # 旧版本：逐标量分块，清单没有版本号
+            data_proc.LOADER_VERSION = 1
+            data_proc.load_yaml_to_doc = lambda path: list(data_proc.traverse_yaml(
+                data_proc.yaml.safe_load(open(path, encoding='utf-8')), file_path=path))
+            old_ids = set(data_proc.load_documents_to_chroma(doc_dir, db_dir, backend='numpy').get(include=[])['ids'])
+            manifest_path = os.path.join(db_dir, data_proc.MANIFEST_NAME)
+            with open(manifest_path, encoding='utf-8') as f:
+                legacy = json.load(f)["files"]
+            with open(manifest_path, 'w', encoding='utf-8') as f:
+                json.dump(legacy, f)
+            data_proc.LOADER_VERSION, data_proc.load_yaml_to_doc = loader_version, load_yaml
+            assert data_proc.load_index_manifest(db_dir) == {}
+
+            result = data_proc.load_documents_to_chroma(doc_dir, db_dir, backend='numpy').get(include=['metadatas'])
+            assert not old_ids & set(result['ids'])
+            assert sorted(metadata['doc_type'] for metadata in result['metadatas']) == ['control', 'page']
+            with open(manifest_path, encoding='utf-8') as f:
+                assert json.load(f)["version"] == loader_version
+            assert data_proc.load_documents_to_chroma(doc_dir, db_dir, backend='numpy').get(include=[])['ids'] == result['ids']
+    finally:
+        data_proc.LazyHuggingFaceEmbeddings, data_proc.load_yaml_to_doc, data_proc.LOADER_VERSION = \
+            lazy_embeddings, load_yaml, loader_version
+
+def test_numpy_vector_store():
+    """NumPy 向量库：增删与 upsert、过滤无命中时返回空结果、删除后清理过滤取值、聚类检索相对精确检索的召回率"""
+    import tempfile
+    import numpy as np
+    from utils.vector_store import NumpyVectorStore
+
+    store = NumpyVectorStore(None)
+    store.add_embeddings(['a', 'b', 'c'], [[1, 0], [0, 1], [1, 1]],
+                         [{'doc_type': 'page'}, {'doc_type': 'control', 'state': 3}, {'doc_type': 'page'}], ['1', '2', '3'])
+    store.add_embeddings(['a2'], [[1, 0.1]], [{'doc_type': 'page'}], ['1'])  # ID 已存在时覆盖
+    assert store.get(include=['documents']) == {'ids': ['2', '3', '1'], 'documents': ['b', 'c', 'a2']}
+    assert [store.get(include=[])['ids'][row] for row, _ in store.search_vectors([[1, 0]], k=2)[0]] == ['1', '3']
+    assert store.search_vectors([[1, 0], [0, 1]], k=2, filter={'doc_type': 'transition'}) == [[], []]
+
+    assert store.delete(['2']) and not store.delete(['missing'])
+    assert 'control' not in store._vocab['doc_type'] and store._vocab['state'] == {}
+    assert store.search_vectors([[0, 1]], filter={'doc_type': 'control'}) == [[]]
+    assert store.search_vectors([[0, 1]], filter={'state': 3}) == [[]]
+    store.add_embeddings(['d'], [[0, 1]], [{'doc_type': 'control'}], ['4'])  # 清理后的取值重新编号，不与现有取值冲突
+    assert [row for row, _ in store.search_vectors([[1, 0]], k=4, filter={'doc_type': 'page'})[0]] == [1, 0]
+    store.delete(['1', '3', '4'])
+    assert len(store) == 0 and store.search_vectors([[1, 0]], filter={'doc_type': 'page'}) == [[]]
+
+    first = store.add_embeddings(['e', 'f'], [[1, 0], [0, 1]])   # 未指定ID：删除后再添加不会覆盖已有文档
+    store.delete(first[:1])
+    second = store.add_embeddings(['g'], [[1, 1]])
+    assert store.get(include=['documents']) == {'ids': [first[1], second[0]], 'documents': ['f', 'g']}
+
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((16, 32)).astype(np.float32)
+    vectors = centers[rng.integers(0, 16, 4000)] + 0.3 * rng.standard_normal((4000, 32)).astype(np.float32)
+    queries = vectors[:20] + 0.05 * rng.standard_normal((20, 32)).astype(np.float32)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = NumpyVectorStore(None, persist_directory=tmp_dir, n_clusters=16, nprobe=4)
+        store.add_embeddings([str(i) for i in range(4000)], vectors, [{'tag': i % 2} for i in range(4000)])
+        store.save()
+        store = NumpyVectorStore(None, persist_directory=tmp_dir)
+        exact = store.search_vectors(queries, k=10, nprobe=16)
+        approx = store.search_vectors(queries, k=10)
+        assert np.mean([len({r for r, _ in a} & {r for r, _ in e}) / 10 for a, e in zip(approx, exact)]) >= 0.9
+        assert all(row % 2 == 1 for hits in store.search_vectors(queries, k=10, filter={'tag': 1}) for row, _ in hits)
+        assert store.search_vectors(queries[:2], filter={'tag': 2}) == [[], []]
+
+def test_dedup_embeddings():
+    """嵌入流水线：相同文本只计算一次、按 batch_size 分批、缓存不超过内存上限且按LRU淘汰"""
+    import threading
+    from langchain_core.embeddings import Embeddings
+    from utils.data_proc import DedupBatchEmbeddings, get_content_hash
+
+    class FakeEmbeddings(Embeddings):
+        def __init__(self):
+            self.calls, self.lock = [], threading.Lock()
+        def embed_documents(self, texts):
+            with self.lock:
+                self.calls.append(list(texts))
+            return [[float(len(text)), float(ord(text[0]))] for text in texts]
+        def embed_query(self, text):
+            return self.embed_documents([text])[0]
+
+    base = FakeEmbeddings()
+    embeddings = DedupBatchEmbeddings(base, batch_size=2, max_workers=2, max_cache_mb=1)
+    vectors = embeddings.embed_documents(['a', 'bb', 'a', 'ccc', 'bb', 'd'])
+    assert vectors == [[1.0, 97.0], [2.0, 98.0], [1.0, 97.0], [3.0, 99.0], [2.0, 98.0], [1.0, 100.0]]
+    assert sorted(text for call in base.calls for text in call) == ['a', 'bb', 'ccc', 'd']
+    assert all(len(call) <= 2 for call in base.calls)
+    vectors[0].append(0.0)  # 每个文档得到独立的向量副本
+    assert embeddings.embed_documents(['a', 'e']) == [[1.0, 97.0], [1.0, 101.0]] and base.calls[-1] == ['e']
+    assert embeddings.stats["documents"] == 8 and embeddings.stats["embedded"] == 5
+
+    embeddings.max_cache_bytes = 3 * 2 * 8   # 最多缓存3个二维向量
+    embeddings._cache.clear()
+    embeddings._cache_bytes = 0
+    embeddings.embed_documents(['a', 'bb', 'ccc'])
+    embeddings.embed_documents(['a', 'd'])   # 'a' 命中后移到队尾，淘汰最久未使用的 'bb'
+    assert embeddings._cache_bytes <= embeddings.max_cache_bytes
+    assert list(embeddings._cache) == [get_content_hash(text) for text in ('ccc', 'a', 'd')]
+
+    # 首次调用时多个批次并发计算，嵌入模型只加载一次
+    import time
+    import utils.data_proc as data_proc
+    loaded = []
+
+    class SlowModel(FakeEmbeddings):
+        def __init__(self, model_name):
+            time.sleep(0.05)
+            loaded.append(model_name)
+            super().__init__()
+
+    model_class, data_proc.HuggingFaceEmbeddings = data_proc.HuggingFaceEmbeddings, SlowModel
+    try:
+        lazy = DedupBatchEmbeddings(data_proc.LazyHuggingFaceEmbeddings('model'), batch_size=1, max_workers=4)
+        assert len(lazy.embed_documents(['a', 'b', 'c', 'd'])) == 4 and loaded == ['model']
+    finally:
+        data_proc.HuggingFaceEmbeddings = model_class
+
+def test_document_stream():
+    """文档解析：流式解析与完整解析得到相同的文档，文档ID与清单在重复索引时保持稳定，只有变化的文件重新计算向量"""
+    import os
+    import shutil
+    import tempfile
+    import xml.etree.ElementTree as ET
+    from langchain_core.embeddings import Embeddings
+    import utils.data_proc as data_proc
+
+    def full_parse(file_path):
+        """对照实现：完整解析后递归遍历"""
+        documents = []
+        def visit(elem, element_path):
+            if elem.tag not in {'GroupBox', 'Pane', 'QWidget', 'Custom', 'Panel'} and \
+                    any(attr in elem.attrib for attr in ['title', 'name']):
+                documents.append((elem.tag, elem.attrib.get('name', ''), element_path))
+            for index, child in enumerate(elem):
+                visit(child, f"{element_path}/{index}")
+        visit(ET.parse(file_path).getroot(), "0")
+        return documents
+
+    for state in (0, 7):
+        file_path = f'doc/utg/state{state}.xml'
+        streamed = list(data_proc.iter_xml_to_doc(file_path))
+        assert streamed and [(doc.metadata['tag'], doc.metadata['name'], doc.metadata['element_path'])
+                             for doc in streamed] == full_parse(file_path)
+        assert all(doc.metadata['content_hash'] == data_proc.get_content_hash(doc.page_content) for doc in streamed)
+
+    class CountingEmbeddings(Embeddings):
+        embedded = []
+        def __init__(self, *args, **kwargs):
+            pass
+        def embed_documents(self, texts):
+            self.embedded.extend(texts)
+            return [[float(len(text)), 1.0] for text in texts]
+        def embed_query(self, text):
+            return [float(len(text)), 1.0]
+
+    lazy_embeddings = data_proc.LazyHuggingFaceEmbeddings
+    data_proc.LazyHuggingFaceEmbeddings = CountingEmbeddings
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            doc_dir, db_dir = os.path.join(tmp_dir, 'doc'), os.path.join(tmp_dir, 'db')
+            os.makedirs(doc_dir)
+            for state in (0, 1):
+                shutil.copy(f'doc/utg/state{state}.xml', doc_dir)
+            ids = data_proc.load_documents_to_chroma(doc_dir, db_dir, backend='numpy').get(include=[])['ids']
+            assert 0 < len(CountingEmbeddings.embedded) <= len(ids)   # 相同内容只计算一次
+            state0_ids = data_proc.load_index_manifest(db_dir)['state0.xml']['ids']
+            CountingEmbeddings.embedded.clear()
+            assert data_proc.load_documents_to_chroma(doc_dir, db_dir, backend='numpy').get(include=[])['ids'] == ids
+            assert CountingEmbeddings.embedded == []
+
+            shutil.copy('doc/utg/state2.xml', os.path.join(doc_dir, 'state1.xml'))
+            data_proc.load_documents_to_chroma(doc_dir, db_dir, backend='numpy')
+            assert data_proc.load_index_manifest(db_dir)['state0.xml']['ids'] == state0_ids
+            changed = {doc.page_content for doc in data_proc.iter_xml_to_doc(os.path.join(doc_dir, 'state1.xml'))}
+            assert CountingEmbeddings.embedded and set(CountingEmbeddings.embedded) <= changed
+    finally:
+        data_proc.LazyHuggingFaceEmbeddings = lazy_embeddings
+
+def test_knowledge_retriever():
+    """常驻检索器：并发查询按查询编码方式合批计算向量，每个查询得到自己的结果，重复查询命中缓存；服务端错误返回 500"""
+    import json
+    import tempfile
+    import threading
+    import urllib.error
+    import urllib.request
+    from concurrent.futures import ThreadPoolExecutor
+    from http.server import ThreadingHTTPServer
+    from langchain_core.embeddings import Embeddings
+    import utils.data_proc as data_proc
+    from utils.retriever_service import KnowledgeRetriever, make_handler
+    from utils.vector_store import NumpyVectorStore
+
+    def keyword_vector(text):
+        return [float(word in text) for word in ('聊天', '通讯录', '收藏', '朋友圈')]
+
+    class KeywordEmbeddings(Embeddings):
+        def __init__(self):
+            self.calls = []
+        def embed_documents(self, texts):
+            raise AssertionError("queries must be embedded with the query encoding")
+        def embed_query(self, text):
+            self.calls.append(1)
+            return keyword_vector(text)
+
+    class BatchedKeywordEmbeddings(KeywordEmbeddings):
+        def embed_queries(self, texts):
+            self.calls.append(len(texts))
+            return [keyword_vector(text) for text in texts]
+
+    texts = ['聊天', '通讯录', '收藏', '朋友圈']
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = NumpyVectorStore(None, persist_directory=tmp_dir)
+        store.add_embeddings(texts, [keyword_vector(text) for text in texts], [{'doc_type': 'page'}] * 4)
+        store.save()
+
+        for embeddings in (KeywordEmbeddings(), BatchedKeywordEmbeddings()):
+            retriever = KnowledgeRetriever(tmp_dir, backend='numpy', k=1, embeddings=embeddings, batch_window=0.05)
+            queries = [f"打开{text}" for text in texts] * 4
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                results = list(executor.map(retriever.invoke, queries))
+            assert [docs[0].page_content for docs in results] == texts * 4
+            stats = retriever.get_stats()
+            assert stats["queries"] == 16 and sum(embeddings.calls) == stats["embedded"] <= 16
+            assert stats["batches"] < stats["queries"] - stats["cache_hits"]
+            if isinstance(embeddings, BatchedKeywordEmbeddings):
+                assert max(embeddings.calls) > 1
+
+        batches = retriever.get_stats()["batches"]
+        assert retriever.invoke('打开收藏')[0].page_content == '收藏' and retriever.get_stats()["batches"] == batches
+        assert retriever.invoke('打开收藏', filter={'doc_type': 'control'}) == []
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(retriever))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            def post(body):
+                request = urllib.request.Request(f"http://127.0.0.1:{server.server_port}/query", data=body)
+                try:
+                    with urllib.request.urlopen(request) as response:
+                        return response.status, json.loads(response.read())
+                except urllib.error.HTTPError as e:
+                    return e.code, json.loads(e.read())
+            status, docs = post(json.dumps({"query": "打开朋友圈"}).encode('utf-8'))
+            assert status == 200 and docs[0]["page_content"] == '朋友圈'
+            assert post(b'{"query": ')[0] == 400 and post(b'{"k": 1}')[0] == 400
+            embeddings.embed_queries = lambda texts: 1 / 0   # 嵌入模型出错
+            assert post(json.dumps({"query": "打开设置"}).encode('utf-8'))[0] == 500
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    class FakeModel(KeywordEmbeddings):
+        query_encode_kwargs = {}
+        def embed_documents(self, texts):
+            self.calls.append(len(texts))
+            return [keyword_vector(text) for text in texts]
+
+    lazy = data_proc.LazyHuggingFaceEmbeddings()
+    lazy._embeddings = FakeModel()
+    assert lazy.embed_queries(['打开收藏', '打开聊天']) == [keyword_vector('收藏'), keyword_vector('聊天')]
+    assert lazy._embeddings.calls == [2]     # 没有单独的查询编码参数时一次批量计算
+    lazy._embeddings.query_encode_kwargs = {"prompt": "query: "}
+    lazy.embed_queries(['打开收藏', '打开聊天'])
+    assert lazy._embeddings.calls == [2, 1, 1]
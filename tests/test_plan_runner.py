@@ -0,0 +1,95 @@
+"""离线单元测试 (控件定位与任务计划执行)，不需要启动微信"""
+
+
+def test_control_locator():
+    """编译后的控件标识逐层定位：UIA调用少于子树扫描，下标后移时重新定位到原控件，缓存命中只读取一次属性"""
+    from utils.locator import Locator, LocatorCache, parse_identifier, scan_resolve, shift_indices
+    from utils.replay import ReplayBackend, wrapper_from_xml
+    from utils.state_store import load_states
+
+    steps, _ = parse_identifier('/Dialog/GroupBox[2]/Button[@title="a/b \\"c\\""]')
+    assert [(step.tag, step.predicate, step.index) for step in steps] == \
+        [("Dialog", None, 0), ("GroupBox", None, 2), ("Button", ("title", 'a/b "c"'), None)]
+
+    state = load_states('doc/utg')[0]
+    identifier = '/Dialog/GroupBox[0]/Custom[0]/GroupBox[0]/Toolbar[@auto_id="main_tabbar"]/Button[@title="通讯录"]'
+    backend = ReplayBackend()
+    root = wrapper_from_xml(state, backend)
+    locator = Locator(identifier, state)
+    assert locator.resolve(root).wrapper is scan_resolve(root, locator)
+    backend.reset()
+    locator.resolve(root)
+    compiled_calls = backend.total_calls
+    backend.reset()
+    scan_resolve(root, locator)
+    assert compiled_calls < backend.total_calls
+
+    expected = locator.resolve_element(state).attrib["rect"]
+    shifted = wrapper_from_xml(shift_indices(state, locator), ReplayBackend())
+    assert str(locator.resolve(shifted).props["rect"]) == expected
+
+    cache = LocatorCache()
+    target = cache.resolve(identifier, root, scope=0)
+    backend.reset()
+    assert cache.resolve(identifier, root, scope=0) is target and backend.total_calls == 1
+    target.props["title"] = "已变化"    # 标题变化后缓存失效，按参照状态中的 name/class_name 重新定位
+    assert cache.resolve(identifier, root, scope=0, reference=state) is target
+    assert cache.stats["stale"] == 1 and cache.stats["relocations"] == 1
+
+    # 控件已不存在：每层 3 个同类兄弟、深度 9 的树中，重新定位的搜索代价有上限，不随层数指数增长
+    import time
+    import xml.etree.ElementTree as ET
+    tree = ET.Element("Dialog", {"rect": "(L0, T0, R10, B10)"})
+    level = [tree]
+    for _ in range(9):
+        level = [ET.SubElement(parent, "GroupBox", {"class_name": "Group", "rect": "(L0, T0, R10, B10)"})
+                 for parent in level for _ in range(3)]
+    target = ET.SubElement(tree[1][1][1][1][1][1][1][1][1], "Button", {"title": "x", "rect": "(L0, T0, R10, B10)"})
+    locator = Locator("/Dialog" + "/GroupBox[1]" * 9 + '/Button[@title="x"]', tree)
+    tree[1][1][1][1][1][1][1][1][1].remove(target)
+    backend = ReplayBackend()
+    start = time.perf_counter()
+    try:
+        locator.resolve(wrapper_from_xml(tree, backend))
+        assert False, "missing control should not be located"
+    except LookupError:
+        pass
+    assert time.perf_counter() - start < 1.0 and backend.calls["build_cache"] < 100
+
+def test_plan_runner():
+    """任务计划：由生成脚本编译出动作计划，在回放后端上执行两个任务，逐步以结构指纹校验到达的状态"""
+    import os
+    import tempfile
+    from utils.plan_runner import PlanRunner, compile_script, generate_task_utg, load_plan
+    from utils.replay import ReplayApp
+
+    script = """路径1:
+1. 在 微信主界面-搜索 输入 '文件传输助手'
+2. 点击 `会话.match('文件')`
+路径2:
+1. 点击 微信主界面-通讯录
+"""
+    plan = compile_script(script, [{'name': '微信主界面-搜索', 'xpath': '/Dialog/Edit[@name="搜索"]', 'dynamic': False}])
+    assert plan == [{"action": "input", "control": '/Dialog/Edit[@name="搜索"]', "text": "文件传输助手"},
+                    {"action": "select", "find": {"title": "会话"}, "match": "文件"}]
+    controls = [{'name': 'X', 'xpath': '/A/B[0]', 'description': ''},    # UIScriptGenerator.controls 的格式
+                {'name': '页面-条目', 'xpath': '/A/ListBox[0]/ListItem[0]', 'description': '', 'dynamic': True}]
+    assert compile_script("点击 `X.match('a')`\n点击 `条目.match('b')`", controls) == \
+        [{"action": "select", "control": "/A/B[0]", "match": "a"},
+         {"action": "select", "control": "/A/ListBox[0]", "match": "b"}]
+    assert compile_script(script + "```yaml\nsteps:\n- action: click\n  control: /Dialog/Button[0]\n```") == \
+        [{"action": "click", "control": "/Dialog/Button[0]"}]
+
+    with tempfile.TemporaryDirectory() as utg_dir:
+        pages = generate_task_utg(utg_dir)
+        for plan_path, final_state in (('script/task1.yaml', pages["chat_file_transfer"]), ('script/task2.yaml', pages["history"])):
+            app = ReplayApp(utg_dir)
+            runner = PlanRunner(app.window, utg_dir, list_windows=lambda: app.desktop.find_windows(process=app.process_id),
+                                connect_window=app.desktop.window)
+            report = runner.run(load_plan(plan_path), trace_path=os.path.join(utg_dir, 'trace.yaml'))
+            assert report["status"] == "ok" and report["initial_state"] == 0 and report["final_state"] == final_state
+            assert all(record["expect"] is not None for record in report["steps"])
+        app.reset()
+        report = runner.run(load_plan('script/task2.yaml')[:1] + [{"action": "assert_state", "expect": pages["history"]}])
+        assert report["status"] == "failed" and report["failed_step"] == 1
+        assert runner.fingerprints[runner.state] == runner.fingerprints[pages["chat_contact"]]   # 两个聊天页面结构相同
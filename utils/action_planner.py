@@ -0,0 +1,128 @@
+import logging
+import xml.etree.ElementTree as ET
+
+import utils.classifier as classifier
+from utils.capture_policy import OMITTED_TAG, live_tag, omitted_count
+from utils.control_snapshot import fetch_children
+from utils.geometry import RECT_PATTERN, StateGeometry
+
+logger = logging.getLogger()
+
+MAX_GROUP_INDEX = 3  # 动态控件组只在前3个成员中选取代表
+
+
+def get_best_attr(elem: ET.Element):
+    """XPath 谓词优先使用 auto_id、title 或 name 属性"""
+    for attr in ["auto_id", "title", "name"]:
+        val = elem.attrib.get(attr, "")
+        if val:
+            val = val.replace('"', '\\"')
+            return f'@{attr}="{val}"'
+    return None
+
+def click_target(geometry: StateGeometry, index: int) -> tuple:
+    """
+    返回 (点击位置, 是否无法点击)：点击位置相对于控件矩形的左上角，矩形中心可以命中控件时为 None (click_input 默认点击中心)；
+    控件完全不可见或可见部分均被其他控件遮挡时无法点击；没有矩形信息的控件视为可以点击
+    """
+    if not RECT_PATTERN.match(geometry.elements[index].attrib.get("rect", "")):
+        return None, False
+    point = geometry.visible_point(index)
+    if point is None:
+        return None, True
+    if point == geometry.click_point(index):
+        return None, False
+    left, top = (int(value) for value in geometry.rects[index][:2])
+    return (point[0] - left, point[1] - top), False
+
+def plan_actions(gui_xml_tree: ET.ElementTree, state_num: int) -> list:
+    """
+    基于刚导出的状态XML一次遍历得到待执行的动作列表，不访问实时界面：
+    - 可交互控件：跳过不可交互的容器，以及祖先已是可交互控件的控件
+    - 动态控件组：结构相同的兄弟控件经二次分类为动态内容时，每组只保留第一个代表
+    - 控件标识：绝对XPath，优先使用 auto_id/title/name 谓词，否则使用同类型兄弟中的下标
+    - 点击位置：由控件几何索引判断矩形中心是否被裁剪或被其他控件 (弹出框、菜单等) 遮挡，被遮挡时改用可见部分中的其他位置
+    返回 [{"xpath", "tag", "index_path", "group", "click_point", "hidden"}, ...]，按先序遍历顺序排列；
+    index_path 为从根到控件的子节点下标序列，执行动作时由 resolve_control 定位实时控件；
+    click_point 为相对控件左上角的点击位置 (None 表示默认的中心)，hidden 表示控件当前无法被点击到；
+    采集时被裁剪的控件 (占位元素) 不规划动作，但计入兄弟控件的下标
+    """
+    root_elem = gui_xml_tree.getroot()
+    geometry = StateGeometry.from_xml(root_elem, transparent=classifier.non_interactive_containers)
+    positions = {id(elem): index for index, elem in enumerate(geometry.elements)}
+    planned = []
+    groups_handled = set()
+    # (元素, XPath, 下标路径, 祖先中是否已有可交互控件, 所属动态控件组, 在组内的序号)，先序遍历
+    stack = [(root_elem, f"/{root_elem.tag}", (), False, None, 0)]
+    while stack:
+        elem, xpath, index_path, covered, group_key, member_index = stack.pop()
+        interactive = index_path != () and elem.tag not in classifier.non_interactive_containers
+        if interactive and not covered:
+            if group_key is None or (group_key not in groups_handled and member_index < MAX_GROUP_INDEX):
+                if group_key is not None:
+                    groups_handled.add(group_key)
+                click_point, hidden = click_target(geometry, positions[id(elem)])
+                planned.append({"xpath": xpath, "tag": elem.tag, "index_path": index_path, "group": group_key,
+                                "click_point": click_point, "hidden": hidden})
+
+        children = [child for child in elem if child.tag != OMITTED_TAG]
+        similar = {}        # (tag, class_name) -> 结构相同的兄弟元素
+        for child in children:
+            similar.setdefault((child.tag, child.attrib.get("class_name", "")), []).append(child)
+        dynamic = {}        # (tag, class_name) -> 该组是否为动态控件组，只对需要规划的组做二次分类
+        tag_counts = {}
+        group_counts = {}
+        frames = []
+        position = 0
+        for child in elem:
+            if child.tag == OMITTED_TAG:
+                tag_counts[live_tag(child)] = tag_counts.get(live_tag(child), 0) + omitted_count(child)
+                position += omitted_count(child)
+                continue
+            tag_index = tag_counts.get(child.tag, 0)
+            tag_counts[child.tag] = tag_index + 1
+            structure = (child.tag, child.attrib.get("class_name", ""))
+            child_member_index = group_counts.get(structure, 0)
+            group_counts[structure] = child_member_index + 1
+            best_attr = get_best_attr(child)
+            child_xpath = xpath + (f"/{child.tag}[{best_attr}]" if best_attr else f"/{child.tag}[{tag_index}]")
+            child_covered = covered or interactive
+            child_group = None
+            if not child_covered and child.tag not in classifier.non_interactive_containers \
+                    and len(similar[structure]) > 1:
+                if structure not in dynamic:
+                    dynamic[structure] = classifier.is_dynamic_group(
+                        [sib.attrib.get("name") or sib.attrib.get("title", "") for sib in similar[structure]])
+                if dynamic[structure]:
+                    child_group = (state_num, xpath, child.tag)
+            frames.append((child, child_xpath, index_path + (position,), child_covered, child_group,
+                           child_member_index))
+            position += 1
+        stack.extend(reversed(frames))
+
+    logger.debug(f"Planned {len(planned)} actions for state {state_num}, "
+                 f"{sum(item['hidden'] for item in planned)} hidden")
+    return planned
+
+def resolve_control(root_wrapper, index_path: tuple, tag: str, children_cache: dict = None):
+    """
+    沿下标路径从根控件定位实时控件，每层的子控件及其属性由一次批量请求取回 (ControlSnapshot)；
+    children_cache 在同一状态内复用已读取的子节点列表。控件类型与快照不一致时抛出异常，否则返回实时控件
+    """
+    ctrl = None
+    for depth, position in enumerate(index_path):
+        prefix = index_path[:depth]
+        if children_cache is not None and prefix in children_cache:
+            children = children_cache[prefix]
+        else:
+            children = ctrl.children() if ctrl is not None else fetch_children(root_wrapper)
+            if children_cache is not None:
+                children_cache[prefix] = children
+        if position >= len(children):
+            raise Exception(f"Control path {index_path} no longer exists in the live UI")
+        ctrl = children[position]
+    if ctrl is None:
+        return root_wrapper
+    if ctrl.friendly_class_name() != tag:
+        raise Exception(f"Control at {index_path} is no longer a {tag}")
+    return ctrl.wrapper
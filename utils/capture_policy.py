@@ -0,0 +1,140 @@
+import copy
+import logging
+import xml.etree.ElementTree as ET
+
+import utils.classifier as classifier
+
+logger = logging.getLogger()
+
+OMITTED_TAG = "Omitted"  # 被裁剪的连续同类兄弟控件在XML中的占位元素
+MAX_RUN = 3              # 连续结构相同的兄弟控件默认保留的样例数
+
+
+def omitted_element(tag: str, class_name: str, count: int) -> ET.Element:
+    """占位元素：记录被裁剪控件的类型、类名与个数，使兄弟控件的下标与实时界面保持一致"""
+    return ET.Element(OMITTED_TAG, {"tag": tag, "class_name": class_name, "count": str(count)})
+
+def omitted_count(elem: ET.Element) -> int:
+    """XML子元素对应的实时控件个数：占位元素为其记录的个数，其余为1"""
+    return int(elem.attrib.get("count", 1)) if elem.tag == OMITTED_TAG else 1
+
+def live_tag(elem: ET.Element) -> str:
+    """XML子元素对应的实时控件类型"""
+    return elem.attrib.get("tag", "") if elem.tag == OMITTED_TAG else elem.tag
+
+def is_empty_rect(rect) -> bool:
+    return rect.right <= rect.left or rect.bottom <= rect.top
+
+def is_outside(rect, bounds) -> bool:
+    return rect.right <= bounds.left or rect.left >= bounds.right or \
+        rect.bottom <= bounds.top or rect.top >= bounds.bottom
+
+
+class CapturePolicy:
+    """
+    采集裁剪策略，决定控件树中哪些子控件需要继续采集：
+    - skip_empty: 跳过零面积的控件及其子树
+    - skip_offscreen: 跳过与窗口矩形 (bind 时给出) 不相交的控件及其子树
+    - max_run: 连续结构相同 (控件类型与类名) 的兄弟控件超过 max_run 个，且经二次分类为动态内容时，
+      只保留前 max_run 个样例，其余记为一个占位元素 (Omitted) 并记录个数；None 表示不限制
+    - class_rules: 按控件类型或类名覆盖以上设置，例如 {"ListItem": {"max_run": 5}, "Image": {"skip_empty": False}}
+    - full_capture: 白名单 (控件类型、类名或 auto_id)，命中的控件的整棵子树不做裁剪
+    被跳过的控件同样记为占位元素，XML中兄弟控件的位置与同类下标因此与实时界面一致
+    """
+    def __init__(self, skip_empty: bool = False, skip_offscreen: bool = False, max_run: int = None,
+                 class_rules: dict = None, full_capture=()):
+        self.skip_empty = skip_empty
+        self.skip_offscreen = skip_offscreen
+        self.max_run = max_run
+        self.class_rules = class_rules or {}
+        self.full_capture = set(full_capture)
+        self.bounds = None
+
+    def __repr__(self):
+        return (f"<CapturePolicy skip_empty={self.skip_empty} skip_offscreen={self.skip_offscreen} "
+                f"max_run={self.max_run} rules={self.class_rules} full_capture={sorted(self.full_capture)}>")
+
+    @property
+    def prunes(self) -> bool:
+        return self.skip_empty or self.skip_offscreen or self.max_run is not None or \
+            any(rules.get(name) for rules in self.class_rules.values()
+                for name in ("skip_empty", "skip_offscreen", "max_run"))
+
+    def bind(self, window) -> "CapturePolicy":
+        """绑定到导出的窗口：判断控件是否在屏幕外时以窗口矩形为界"""
+        policy = copy.copy(self)
+        policy.bounds = window.rectangle()
+        return policy
+
+    def rule(self, ctrl, name: str):
+        for key in (ctrl.friendly_class_name(), ctrl.element_info.class_name):
+            if key in self.class_rules and name in self.class_rules[key]:
+                return self.class_rules[key][name]
+        return getattr(self, name)
+
+    def is_whitelisted(self, ctrl) -> bool:
+        return bool(self.full_capture) and (ctrl.friendly_class_name() in self.full_capture or
+                                            ctrl.element_info.class_name in self.full_capture or
+                                            ctrl.element_info.automation_id in self.full_capture)
+
+    def child_policy(self, ctrl) -> "CapturePolicy":
+        """控件子树使用的策略：命中白名单时完整采集"""
+        return FULL_CAPTURE if self.is_whitelisted(ctrl) else self
+
+    def is_skipped(self, ctrl) -> bool:
+        if self.is_whitelisted(ctrl):
+            return False
+        rect = ctrl.rectangle()
+        if self.rule(ctrl, "skip_empty") and is_empty_rect(rect):
+            return True
+        return self.bounds is not None and self.rule(ctrl, "skip_offscreen") and is_outside(rect, self.bounds)
+
+    def select_children(self, children: list) -> list:
+        """
+        按策略挑选需要采集的子控件，返回与XML子元素一一对应的列表：
+        保留的控件快照，或代表连续若干个被裁剪控件的占位元素
+        """
+        if not self.prunes:
+            return list(children)
+        marked = [(child, self.is_skipped(child)) for child in children]  # (控件, 是否跳过)
+        entries = []
+        start = 0
+        while start < len(marked):
+            child, skipped = marked[start]
+            structure = (child.friendly_class_name(), child.element_info.class_name)
+            end = start + 1
+            while end < len(marked) and marked[end][1] == skipped and \
+                    (marked[end][0].friendly_class_name(), marked[end][0].element_info.class_name) == structure:
+                end += 1
+            run = [ctrl for ctrl, _ in marked[start:end]]
+            if skipped:
+                entries.append(omitted_element(*structure, len(run)))
+            else:
+                max_run = self.rule(child, "max_run")
+                if max_run is not None and len(run) > max_run and \
+                        classifier.is_dynamic_group([ctrl.element_info.name or ctrl.window_text() for ctrl in run]):
+                    entries.extend(run[:max_run])
+                    entries.append(omitted_element(*structure, len(run) - max_run))
+                else:
+                    entries.extend(run)
+            start = end
+        return entries
+
+
+FULL_CAPTURE = CapturePolicy()
+
+# 预置策略，可通过名称选择
+POLICIES = {
+    "full": FULL_CAPTURE,
+    "visible": CapturePolicy(skip_empty=True, skip_offscreen=True),
+    "compact": CapturePolicy(skip_empty=True, skip_offscreen=True, max_run=MAX_RUN),
+}
+
+
+def get_policy(policy) -> CapturePolicy:
+    """策略可以是 CapturePolicy、预置策略名称或 None (完整采集)"""
+    if policy is None:
+        return FULL_CAPTURE
+    if isinstance(policy, str):
+        return POLICIES[policy]
+    return policy
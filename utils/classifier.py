@@ -79,19 +79,21 @@ def is_dynamic_control(control: UIAWrapper) -> bool:
         siblings = []
 
     if len(siblings) > 1:
-        global _group_semantics_cache
-        text_list = list(sib.element_info.name or sib.window_text() for sib in siblings)
-        text_tuple = tuple(text_list)
-        if text_tuple in _group_semantics_cache:
-            logger.debug(f"Hit the group semantics cache.")
-            return _group_semantics_cache[text_tuple]
-
-        distinct = analyze_control_texts(text_list) # 二次分类
-        _group_semantics_cache[text_tuple] = distinct
-        return distinct
+        return is_dynamic_group(list(sib.element_info.name or sib.window_text() for sib in siblings))
     else:
         return False
 
+def is_dynamic_group(text_list: list) -> bool:
+    """对一组结构相同的兄弟控件的文本做二次分类，结果按文本元组缓存"""
+    text_tuple = tuple(text_list)
+    if text_tuple in _group_semantics_cache:
+        logger.debug(f"Hit the group semantics cache.")
+        return _group_semantics_cache[text_tuple]
+
+    distinct = analyze_control_texts(text_list) # 二次分类
+    _group_semantics_cache[text_tuple] = distinct
+    return distinct
+
 if __name__ == '__main__':
     text_list = ['文件传输助手 已置顶 [文件] 现代密码学-第6章.pdf 昨天 10:35',
                  '白婧譞 已置顶 我去车棚拿车 09:06',
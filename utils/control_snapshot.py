@@ -0,0 +1,169 @@
+import logging
+
+from pywinauto.controls.uiawrapper import UIAWrapper
+
+try:
+    from pywinauto.controls.uiawrapper import _friendly_classes
+    from pywinauto.uia_defines import IUIA, get_elem_interface
+    from pywinauto.uia_element_info import UIAElementInfo
+    from pywinauto.win32structures import RECT
+except ImportError:  # 非 UIA 环境 (如回放后端) 下只使用控件自身提供的批量读取
+    IUIA = None
+
+logger = logging.getLogger()
+
+# 批量读取的 UIA 属性，与导出XML所需的属性一一对应
+CACHED_PROPERTIES = ["Name", "ClassName", "AutomationId", "NativeWindowHandle", "BoundingRectangle", "ControlType",
+                     "IsTextPatternAvailable"]
+
+_cache_request = None
+
+
+def get_cache_request():
+    """构造 (并复用) 读取 CACHED_PROPERTIES 的 UIA CacheRequest"""
+    global _cache_request
+    if _cache_request is None:
+        iuia = IUIA()
+        request = iuia.iuia.CreateCacheRequest()
+        for prop in CACHED_PROPERTIES:
+            request.AddProperty(getattr(iuia.UIA_dll, f"UIA_{prop}PropertyId"))
+        _cache_request = request
+    return _cache_request
+
+def uses_cache_request(wrapper) -> bool:
+    return IUIA is not None and hasattr(getattr(wrapper, "element_info", None), "element")
+
+def friendly_class_name_of(control_type: str) -> str:
+    """与 UIAWrapper.friendly_class_name() 相同的映射，由已缓存的控件类型得到，不再读取控件"""
+    if control_type not in IUIA().known_control_types or _friendly_classes.get(control_type) is None:
+        return control_type
+    return _friendly_classes[control_type]
+
+def cached_props(element) -> dict:
+    """由带缓存的 IUIAutomationElement 取出属性；只有支持 Text 模式的控件需要额外读取一次文本"""
+    bound_rect = element.CachedBoundingRectangle
+    rect = RECT()
+    rect.left, rect.top, rect.right, rect.bottom = bound_rect.left, bound_rect.top, bound_rect.right, bound_rect.bottom
+    name = element.CachedName or ""
+    class_name = element.CachedClassName or ""
+    control_type = IUIA().known_control_type_ids.get(element.CachedControlType, "InvalidControlType")
+    title = name
+    if class_name and element.CachedIsTextPatternAvailable:  # 与 UIAElementInfo.rich_text 一致
+        try:
+            title = get_elem_interface(element, "Text").DocumentRange.GetText(-1)
+        except Exception:
+            title = name
+    return {
+        "title": title,
+        "name": name,
+        "class_name": class_name,
+        "auto_id": element.CachedAutomationId or "",
+        "handle": element.CachedNativeWindowHandle,
+        "rect": rect,
+        "control_type": control_type,
+        "friendly_class_name": friendly_class_name_of(control_type),
+    }
+
+def read_props(wrapper) -> dict:
+    """不支持批量读取的控件：逐个属性读取"""
+    return {
+        "title": wrapper.window_text(),
+        "name": wrapper.element_info.name,
+        "class_name": wrapper.element_info.class_name,
+        "auto_id": wrapper.element_info.automation_id,
+        "handle": wrapper.element_info.handle,
+        "rect": wrapper.rectangle(),
+        "control_type": wrapper.element_info.control_type,
+        "friendly_class_name": wrapper.friendly_class_name(),
+    }
+
+
+class SnapshotElementInfo:
+    """快照中的 element_info，属性均来自批量读取的结果"""
+    def __init__(self, props: dict):
+        self.name = props["name"]
+        self.class_name = props["class_name"]
+        self.automation_id = props["auto_id"]
+        self.handle = props["handle"]
+        self.control_type = props["control_type"]
+
+
+class ControlSnapshot:
+    """
+    控件属性快照 (UIA CacheRequest 模式)：导出所需的全部属性在一次跨进程请求中读取，
+    children() 一次请求取回全部子控件及其属性并缓存，之后的读取都不再跨进程。
+    提供与 UIAWrapper 相同的只读接口 (window_text/friendly_class_name/rectangle/children/parent/element_info)，
+    导出与比较的代码可直接使用；需要操作控件时通过 wrapper 取得实时控件 (真实 UIA 下按需构造)
+    """
+    def __init__(self, props: dict, wrapper=None, element=None, parent: "ControlSnapshot" = None):
+        self.props = props
+        self.element_info = SnapshotElementInfo(props)
+        self._wrapper = wrapper
+        self._element = element      # 带缓存的 IUIAutomationElement
+        self._parent = parent
+        self._children = None
+
+    def __repr__(self):
+        return f"<ControlSnapshot {self.props['friendly_class_name']} '{self.props['title']}'>"
+
+    @property
+    def wrapper(self):
+        if self._wrapper is None and self._element is not None:
+            self._wrapper = UIAWrapper(UIAElementInfo(self._element))
+        return self._wrapper
+
+    def window_text(self) -> str:
+        return self.props["title"]
+
+    def friendly_class_name(self) -> str:
+        return self.props["friendly_class_name"]
+
+    def class_name(self) -> str:
+        return self.props["class_name"]
+
+    def automation_id(self) -> str:
+        return self.props["auto_id"]
+
+    def rectangle(self):
+        return self.props["rect"]
+
+    def parent(self):
+        """父控件快照；不在同一次读取中的父控件 (如单独读取的列表条目) 按需读取一次"""
+        if self._parent is None:
+            parent = self.wrapper.parent() if self.wrapper is not None else None
+            if parent is None:
+                raise Exception("Control has no parent")
+            self._parent = snapshot_control(parent)
+        return self._parent
+
+    def children(self) -> list:
+        if self._children is None:
+            self._children = fetch_children(self.wrapper, element=self._element, parent=self)
+        return list(self._children)
+
+
+def snapshot_control(wrapper) -> ControlSnapshot:
+    """一次请求读取控件自身的全部属性；传入的已是快照时原样返回"""
+    if isinstance(wrapper, ControlSnapshot):
+        return wrapper
+    if hasattr(wrapper, "build_cache"):
+        props, target = wrapper.build_cache("element")[0]
+        return ControlSnapshot(props, wrapper=target)
+    if uses_cache_request(wrapper):
+        element = wrapper.element_info.element.BuildUpdatedCache(get_cache_request())
+        return ControlSnapshot(cached_props(element), wrapper=wrapper, element=element)
+    return ControlSnapshot(read_props(wrapper), wrapper=wrapper)
+
+def fetch_children(wrapper, element=None, parent: ControlSnapshot = None) -> list:
+    """一次请求取回全部子控件及其属性，返回子控件快照列表"""
+    if element is None and hasattr(wrapper, "build_cache"):
+        return [ControlSnapshot(props, wrapper=target, parent=parent) for props, target in wrapper.build_cache("children")]
+    if element is not None or uses_cache_request(wrapper):
+        element = element if element is not None else wrapper.element_info.element
+        array = element.FindAllBuildCache(IUIA().tree_scope["children"], IUIA().true_condition, get_cache_request())
+        children = []
+        for i in range(array.Length):
+            child = array.GetElement(i)
+            children.append(ControlSnapshot(cached_props(child), element=child, parent=parent))
+        return children
+    return [ControlSnapshot(read_props(child), wrapper=child, parent=parent) for child in wrapper.children()]
@@ -0,0 +1,197 @@
+import logging
+import os
+import shutil
+import threading
+import time
+import xml.etree.ElementTree as ET
+from collections.abc import Mapping
+
+from utils.capture_policy import get_policy
+from utils.journal import ExplorationJournal
+from utils.outcome_cache import PREDICTION_MODES, OutcomeCache
+from utils.scheduler import FrontierScheduler
+from utils.similarity import StateSimilarityIndex, structure_shingles
+from utils.state_store import CACHE_BYTES, StateStore
+
+try:
+    import comtypes  # worker 线程中的 UIA 调用需要先初始化 COM
+except ImportError:
+    comtypes = None
+
+logger = logging.getLogger()
+
+CAPTURE_DIR_NAME = ".capture"   # 各 worker 导出状态XML的临时目录，登记后移入 output_dir
+
+
+class VisitedStates(Mapping):
+    """
+    状态编号 -> 结构 (ET.ElementTree)：常驻内存的只有状态编号，解析后的树由 StateStore 的 LRU 缓存
+    在字节预算内保留，被淘汰的状态在访问时从 output_dir 重新读取
+    """
+    def __init__(self, store: StateStore):
+        self.store = store
+        self.state_nums = set()
+
+    def __setitem__(self, state_num: int, state: ET.ElementTree):
+        self.state_nums.add(state_num)
+        self.store.cache.put(state_num, state.getroot())
+
+    def add(self, state_num: int):
+        """登记已存入 output_dir 的状态，不读取其结构"""
+        self.state_nums.add(state_num)
+
+    def __getitem__(self, state_num: int) -> ET.ElementTree:
+        if state_num not in self.state_nums:
+            raise KeyError(state_num)
+        return ET.ElementTree(self.store.load(state_num))
+
+    def __contains__(self, state_num) -> bool:
+        return state_num in self.state_nums
+
+    def __iter__(self):
+        return iter(self.state_nums)
+
+    def __len__(self):
+        return len(self.state_nums)
+
+
+class ExplorationCoordinator:
+    """
+    探索的共享状态库与探索前沿，单个 Explorer 与多个并行 worker 均通过它登记状态与跳转：
+    - 状态按结构指纹全局去重，状态编号由协调器统一分配，worker 各自导出的XML登记后才移入 output_dir
+    - 所有 worker 共用一个 FrontierScheduler：选取动作时即认领，其他 worker 不会重复执行；
+      worker 优先执行自己发现的状态中的动作，没有时再从其他 worker 的状态中窃取
+    - 所有事件写入同一份探索日志，结束后由日志合并生成一个 UTG.yaml
+    以下共享结构只能在持有 lock 时修改；前沿暂时为空时 worker 在 lock 上等待其他 worker 的结果。
+    capture_policy 为所有 worker 导出状态时共用的采集裁剪策略，保证结构指纹可比；
+    similarity_threshold 不为 None 时启用近似重复检测：指纹未命中的状态与已有状态的结构 Jaccard 相似度
+    不低于该值时归入已有状态，其指纹记为别名；
+    delta_chain > 0 时新状态保存为相对于最相似的已存状态的编辑脚本 (StateStore)，重建时最多依次应用 delta_chain 个脚本；
+    state_cache_bytes 为常驻内存的已解析状态树的字节预算 (None 为不限)，超出后按 LRU 淘汰，需要时从磁盘重新读取；
+    outcome_prediction 为 "defer" 或 "skip" 时启用动作结果缓存 (OutcomeCache)，结果可预测的动作延后执行或不再执行
+    """
+    def __init__(self, output_dir: str, resume: bool = False, capture_policy=None, similarity_threshold: float = None,
+                 delta_chain: int = 0, state_cache_bytes: int = CACHE_BYTES, outcome_prediction: str = None):
+        if outcome_prediction is not None and outcome_prediction not in PREDICTION_MODES:
+            raise ValueError(f"Unknown outcome prediction mode: {outcome_prediction}")
+        self.output_dir = output_dir
+        self.capture_policy = get_policy(capture_policy)
+        self.similarity = StateSimilarityIndex(similarity_threshold) if similarity_threshold is not None else None
+        self.lock = threading.Condition()   # 默认使用可重入锁
+        self.state_fingerprints = {}        # 结构指纹 -> 状态编号
+        self.transitions = []               # UTG 边集合
+        self.plans = {}                     # 状态编号 -> {控件标识: 规划动作}
+        self.scheduler = FrontierScheduler()
+        self.outcome_prediction = outcome_prediction
+        self.outcomes = OutcomeCache() if outcome_prediction is not None else None
+        if not resume:
+            shutil.rmtree(self.output_dir, ignore_errors=True)  # 清空上次的UTG目录
+        self.journal = ExplorationJournal(self.output_dir, resume=resume)
+        self.store = StateStore(self.output_dir, max_chain=delta_chain, cache_bytes=state_cache_bytes)
+        self.visited_states = VisitedStates(self.store)   # 状态编号 -> 结构
+        if self.journal.states:
+            self.restore_from_journal()
+
+    def restore_from_journal(self):
+        """由探索日志恢复状态、指纹 (含近似重复的别名) 与跳转记录"""
+        for state_num, record in sorted(self.journal.states.items()):
+            self.visited_states.add(state_num)
+            self.state_fingerprints.setdefault(record["fingerprint"], state_num)
+            if self.similarity is not None:
+                self.similarity.add(state_num, structure_shingles(self.visited_states[state_num].getroot()))
+        for fingerprint, state_num in self.journal.aliases.items():
+            self.state_fingerprints.setdefault(fingerprint, state_num)
+        self.transitions.extend(self.journal.transitions)
+        logger.info(f"Resume exploration with {len(self.visited_states)} states, {len(self.transitions)} transitions")
+
+    def capture_dir(self, worker: str) -> str:
+        return os.path.join(self.output_dir, CAPTURE_DIR_NAME, worker)
+
+    def add_state(self, state_num: int, state: ET.ElementTree, fingerprint: str, xml_path: str, shingles=None):
+        """登记新状态，并写入探索日志"""
+        with self.lock:
+            self.visited_states[state_num] = state
+            self.state_fingerprints.setdefault(fingerprint, state_num)
+            if self.similarity is not None:
+                self.similarity.add(state_num, shingles if shingles is not None else structure_shingles(state.getroot()))
+            self.journal.record_state(state_num, fingerprint, xml_path)
+
+    def match_state(self, fingerprint: str, state: ET.ElementTree = None, shingles=None):
+        """
+        按结构指纹查找已有状态；未命中且启用近似重复检测时，在已有状态中查找与 state 结构相似的状态，
+        找到后将该指纹记为其别名。返回状态编号，没有时返回 None
+        """
+        with self.lock:
+            state_num = self.state_fingerprints.get(fingerprint)
+            if state_num is not None or self.similarity is None or state is None:
+                return state_num
+            match = self.similarity.best_match(shingles if shingles is not None else structure_shingles(state.getroot()))
+            if match is None:
+                return None
+            state_num, score = match
+            self.state_fingerprints[fingerprint] = state_num
+            self.journal.record_alias(fingerprint, state_num)
+            logger.info(f"Near-duplicate of state {state_num} (Jaccard {score:.3f})")
+            return state_num
+
+    def register_state(self, state: ET.ElementTree, fingerprint: str, captured_xml: str) -> tuple:
+        """
+        登记 worker 导出的状态：结构已存在 (或与已有状态近似重复) 时删除导出文件，否则分配新编号并存入 output_dir
+        (完整XML或差量)；返回 (状态编号, 是否为新状态)
+        """
+        shingles = structure_shingles(state.getroot()) if self.similarity is not None else None  # 在锁外计算
+        with self.lock:
+            state_num = self.match_state(fingerprint, state, shingles)
+            if state_num is None:
+                state_num = max(self.visited_states) + 1 if self.visited_states else 0
+                xml_path = self.store.save(state_num, state.getroot(), captured_xml)
+                self.add_state(state_num, state, fingerprint, xml_path, shingles)
+                self.lock.notify_all()
+                return state_num, True
+        try:
+            os.remove(captured_xml)
+        except OSError:
+            logger.debug(f"Fail to remove {captured_xml}")
+        return state_num, False
+
+    def log_interaction(self, transition: dict):
+        with self.lock:
+            self.transitions.append(transition)
+            self.journal.record_transition(transition)
+
+    def compact(self) -> str:
+        """由日志合并生成 UTG.yaml，并清理临时导出目录"""
+        with self.lock:
+            shutil.rmtree(os.path.join(self.output_dir, CAPTURE_DIR_NAME), ignore_errors=True)
+            return self.journal.compact()
+
+    def _run_worker(self, worker, max_actions: int):
+        if comtypes is not None:
+            comtypes.CoInitialize()
+        try:
+            worker.explore(strategy="frontier", max_actions=max_actions)
+        finally:
+            if comtypes is not None:
+                comtypes.CoUninitialize()
+
+    def run(self, workers: list, max_actions: int = None) -> dict:
+        """
+        每个 worker (共享本协调器的 Explorer，各自驱动一个应用实例) 在独立线程中执行前沿探索，
+        max_actions 为每个 worker 的动作上限；全部结束后合并生成 UTG.yaml，返回汇总统计
+        """
+        start = time.perf_counter()
+        threads = [threading.Thread(target=self._run_worker, args=(worker, max_actions),
+                                    name=f"explorer-{worker.worker_name}", daemon=True)
+                   for worker in workers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.compact()
+        stats = {"workers": len(workers), "seconds": time.perf_counter() - start,
+                 "states": len(self.visited_states), "transitions": len(self.transitions)}
+        for worker in workers:
+            for name, value in worker.stats.items():
+                stats[name] = stats.get(name, 0) + value
+        logger.info(f"Parallel exploration stats: {stats}")
+        return stats
@@ -1,96 +1,451 @@
+import hashlib
+import json
 import os
+import threading
+import time
 import yaml
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from langchain.docstore.document import Document
-from langchain_community.vectorstores import Chroma
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
 from langchain_huggingface import HuggingFaceEmbeddings
 import logging
 import xml.etree.ElementTree as ET
+from utils.vector_store import NumpyVectorStore
 
 logger = logging.getLogger()
 
-def load_xml_to_doc(file_path: str) -> list:
+EMBEDDING_MODEL = "intfloat/multilingual-e5-large"
+MANIFEST_NAME = "index_manifest.json"
+LOADER_VERSION = 2     # 文档解析与分块规则的版本 (2: YAML 按结构分块)，规则变化时递增，旧版本建立的索引整体重新分块
+
+def get_content_hash(content: str) -> str:
+    """计算文档内容的哈希值"""
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+def get_document_id(source: str, element_path: str, content_hash: str) -> str:
     """
-    Load XML file and convert it to a list of documents.
+    根据 解析规则版本 + 文件路径 + 元素路径 + 内容哈希 生成稳定的文档ID，
+    内容不变时ID不变，内容或解析规则变化时ID随之变化
+    """
+    key = f"{LOADER_VERSION}|{source}|{element_path}|{content_hash}"
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+def iter_xml_to_doc(file_path: str):
+    """
+    以流式方式(iterparse)解析XML文件，逐个产出文档。
+    元素在 start 事件时即可读取属性，end 事件后立即清空并从父节点移除，
+    因此内存占用只与树的深度相关，与文件大小无关。
     """
-    tree = ET.ElementTree(file=file_path)
-    root = tree.getroot()
-    documents = []
     # 保存需要跳过的、无content驱动的容器节点
     container_tags = {'GroupBox', 'Pane', 'QWidget', 'Custom', 'Panel'}
+    stack = []  # [(element, element_path, 已遇到的子节点数)]
 
-    for elem in root.iter():
-        if elem.tag not in container_tags and any(attr in elem.attrib for attr in ['title', 'name']):
-            text = f"tag: {elem.tag}, title: {elem.attrib.get('title', '')}, name: {elem.attrib.get('name', '')}, class_name: {elem.attrib.get('class_name', '')}, path: {elem.attrib.get('path', '')}"
-            documents.append(
-                Document(
+    for event, elem in ET.iterparse(file_path, events=('start', 'end')):
+        if event == 'start':
+            if stack:
+                parent, parent_path, child_count = stack[-1]
+                stack[-1] = (parent, parent_path, child_count + 1)
+                element_path = f"{parent_path}/{child_count}"
+            else:
+                element_path = "0"
+            stack.append((elem, element_path, 0))
+
+            if elem.tag not in container_tags and any(attr in elem.attrib for attr in ['title', 'name']):
+                text = f"tag: {elem.tag}, title: {elem.attrib.get('title', '')}, name: {elem.attrib.get('name', '')}, class_name: {elem.attrib.get('class_name', '')}, path: {elem.attrib.get('path', '')}"
+                yield Document(
                     page_content=text,
                     metadata={
                         "xml_path": file_path,
                         "tag": elem.tag,
                         "name": elem.attrib.get('name', ''),
+                        "element_path": element_path,
+                        "content_hash": get_content_hash(text),
                     }
                 )
-            )
+        else:
+            stack.pop()
+            elem.clear()
+            if stack:
+                del stack[-1][0][:]  # 已处理完的子节点从父节点中移除
+
+def load_xml_to_doc(file_path: str) -> list:
+    """
+    Load XML file and convert it to a list of documents.
+    """
+    documents = list(iter_xml_to_doc(file_path))
     logger.info(f"Loaded {len(documents)} documents from XML file: {file_path}")
 
     return documents
 
-def load_yaml_to_doc(file_path: str) -> list:
+def traverse_yaml(obj, prefix="", file_path=""):
+    """将任意YAML结构展开到每个标量叶子节点，每个叶子生成一个文档（通用YAML的兜底策略）"""
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            current_path = f"{prefix}.{key}" if prefix else key
+            yield from traverse_yaml(value, current_path, file_path)
+    elif isinstance(obj, list):
+        for index, item in enumerate(obj):
+            current_path = f"{prefix}[{index}]" if prefix else f"[{index}]"
+            yield from traverse_yaml(item, current_path, file_path)
+    else:
+        content = f"path: {prefix}\nvalue: {obj}"
+        yield Document(
+            page_content=content,
+            metadata={
+                "yaml_path": file_path,
+                "key_path": prefix,
+                "element_path": prefix,
+                "content_hash": get_content_hash(content),
+            }
+        )
+
+def make_yaml_chunk(content: str, file_path: str, element_path: str, **metadata) -> Document:
+    """生成一个结构化YAML分块文档，metadata 中的字段可用于检索过滤"""
+    metadata.update({
+        "yaml_path": file_path,
+        "key_path": element_path,
+        "element_path": element_path,
+        "content_hash": get_content_hash(content),
+    })
+    return Document(page_content=content, metadata=metadata)
+
+def chunk_appdoc(data: dict, file_path: str):
     """
-    Load YAML file and convert it to a list of documents.
+    App Doc 分块：每个页面生成一个页面摘要文档，每个控件生成一个控件文档
     """
-    def traverse_yaml(obj, prefix="", file_path=""):
-        if isinstance(obj, dict):
-            for key, value in obj.items():
-                current_path = f"{prefix}.{key}" if prefix else key
-                yield from traverse_yaml(value, current_path, file_path)
-        elif isinstance(obj, list):
-            for index, item in enumerate(obj):
-                current_path = f"{prefix}[{index}]" if prefix else f"[{index}]"
-                yield from traverse_yaml(item, current_path, file_path)
-        else:
-            content = f"path: {prefix}\nvalue: {obj}"
-            yield Document(
-                page_content=content,
-                metadata={"yaml_path": file_path, "key_path": prefix}
+    for page_index, page in enumerate(data.get('pages') or []):
+        page_name = page.get('page_name', '')
+        summary = page.get('summary', '')
+        controls = page.get('controls') or []
+        control_names = "、".join(ctrl.get('name', '') for ctrl in controls)
+        yield make_yaml_chunk(
+            f"页面: {page_name}\n功能: {summary}\n控件: {control_names}",
+            file_path, f"pages[{page_index}]",
+            doc_type="page", page_name=page_name, page_index=page_index,
+        )
+        for ctrl_index, ctrl in enumerate(controls):
+            is_dynamic = str(ctrl.get('dynamic', '')).lower() == 'true'
+            yield make_yaml_chunk(
+                f"页面: {page_name}\n控件: {ctrl.get('name', '')}\n描述: {ctrl.get('description', '')}\n"
+                f"动态控件: {is_dynamic}\n标识符: {ctrl.get('identifier', '')}",
+                file_path, f"pages[{page_index}].controls[{ctrl_index}]",
+                doc_type="control", page_name=page_name, page_index=page_index,
+                name=ctrl.get('name', ''), identifier=ctrl.get('identifier', ''), dynamic=is_dynamic,
             )
 
+def chunk_utg(data: dict, file_path: str):
+    """
+    UTG 分块：每条状态转移边生成一个文档
+    """
+    for index, transition in enumerate(data.get('transitions') or []):
+        action = transition.get('Action', '')
+        content = transition.get('Content', 'null')
+        identifier = transition.get('Control_Identifier', '')
+        state = transition.get('State')
+        new_state = transition.get('New_State_Num')
+        text = f"状态 {state} -> 状态 {new_state}\n操作: {action}\n控件: {identifier}"
+        if action == 'input':
+            text += f"\n输入: {content}"
+        yield make_yaml_chunk(
+            text, file_path, f"transitions[{index}]",
+            doc_type="transition", action=action, identifier=identifier,
+            state=int(state) if state is not None else -1,
+            new_state=int(new_state) if new_state is not None else -1,
+        )
+
+def load_yaml_to_doc(file_path: str) -> list:
+    """
+    Load YAML file and convert it to a list of documents.
+    App Doc (pages) 和 UTG (transitions) 按结构分块，其余YAML按标量叶子展开。
+    """
     with open(file_path, "r", encoding='utf-8') as f:
         data = yaml.safe_load(f)
 
-    logger.info(f"Loaded {len(data)} documents from YAML file: {file_path}")
+    if isinstance(data, dict) and 'pages' in data:
+        documents = list(chunk_appdoc(data, file_path))
+    elif isinstance(data, dict) and 'transitions' in data:
+        documents = list(chunk_utg(data, file_path))
+    else:
+        documents = list(traverse_yaml(data, file_path=file_path))
+    logger.info(f"Loaded {len(documents)} documents from YAML file: {file_path}")
+
+    return documents
+
+def iter_file_to_doc(file_path: str):
+    """根据文件后缀流式解析单个XML/YAML文件（YAML文件体积小，整体解析后逐个产出）"""
+    if file_path.endswith('.xml'):
+        yield from iter_xml_to_doc(file_path)
+    elif file_path.endswith('.yaml'):
+        yield from load_yaml_to_doc(file_path)
+
+def collect_source_files(dir_path: str) -> list:
+    """递归收集dir_path目录下的所有XML/YAML文件，按路径排序保证顺序稳定"""
+    source_files = []
+    for root, _, files in os.walk(dir_path): # 递归解析dir_path目录下的所有文件
+        for file_name in files:
+            if file_name.endswith('.xml') or file_name.endswith('.yaml'):
+                source_files.append(os.path.join(root, file_name))
+    return sorted(source_files)
+
+def get_file_digest(file_path: str) -> str:
+    """计算文件内容的哈希值，用于判断文件是否变化"""
+    digest = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def iter_documents_with_ids(documents, source: str):
+    """为文档流分配稳定ID，逐个产出 (doc_id, document)，同一文件中完全相同的 (元素路径, 内容) 只保留一份"""
+    seen = set()
+    for doc in documents:
+        doc_id = get_document_id(source, doc.metadata['element_path'], doc.metadata['content_hash'])
+        if doc_id in seen:
+            continue
+        seen.add(doc_id)
+        yield doc_id, doc
+
+class LazyHuggingFaceEmbeddings(Embeddings):
+    """
+    延迟加载的 HuggingFace 嵌入模型：只有真正需要计算向量时才加载模型，
+    增量索引没有新文档时可以完全跳过模型加载
+    """
+    def __init__(self, model_name: str = EMBEDDING_MODEL):
+        self.model_name = model_name
+        self._embeddings = None
+        self._lock = threading.Lock()
+
+    @property
+    def embeddings(self) -> HuggingFaceEmbeddings:
+        if self._embeddings is None:
+            with self._lock:  # 多个线程同时首次调用时只加载一次模型
+                if self._embeddings is None:
+                    logger.info(f"Loading embedding model: {self.model_name}")
+                    self._embeddings = HuggingFaceEmbeddings(model_name=self.model_name)
+        return self._embeddings
+
+    def embed_documents(self, texts: list) -> list:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> list:
+        return self.embeddings.embed_query(text)
+
+    def embed_queries(self, texts: list) -> list:
+        """批量计算查询向量：模型没有单独的查询编码参数时查询与文档编码相同，一次批量计算，否则逐个调用 embed_query"""
+        if getattr(self.embeddings, "query_encode_kwargs", None):
+            return [self.embeddings.embed_query(text) for text in texts]
+        return self.embeddings.embed_documents(texts)
+
+class DedupBatchEmbeddings(Embeddings):
+    """
+    去重 + 分批的嵌入流水线：
+    1. 按内容哈希去重，相同 page_content 只计算一次向量，计算完成后再按原顺序扇出给每个文档
+    2. 未命中缓存的文本按 batch_size 分批，由 max_workers 个线程并发计算
+    3. 内容哈希 -> 向量 的缓存按 max_cache_mb 限制内存，超出时按LRU淘汰
+    """
+    def __init__(self, base: Embeddings, batch_size: int = 32, max_workers: int = 2, max_cache_mb: int = 256):
+        self.base = base
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.max_cache_bytes = max_cache_mb * 1024 * 1024
+        self._cache = OrderedDict()  # content_hash -> vector
+        self._cache_bytes = 0
+        self.stats = {"documents": 0, "unique": 0, "embedded": 0, "seconds": 0.0}
+
+    def _cache_put(self, key: str, vector: list):
+        size = len(vector) * 8  # 按 float 估算
+        if size > self.max_cache_bytes:
+            return
+        self._cache[key] = vector
+        self._cache_bytes += size
+        while self._cache_bytes > self.max_cache_bytes:
+            _, evicted = self._cache.popitem(last=False)
+            self._cache_bytes -= len(evicted) * 8
+
+    def embed_documents(self, texts: list) -> list:
+        start = time.perf_counter()
+        keys = [get_content_hash(text) for text in texts]
+        unique = OrderedDict()  # content_hash -> text，保持首次出现的顺序
+        for key, text in zip(keys, texts):
+            unique.setdefault(key, text)
+
+        vectors = {}
+        missing = []
+        for key, text in unique.items():
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                vectors[key] = self._cache[key]
+            else:
+                missing.append((key, text))
+
+        # 分批计算，每次最多 max_workers 个批次在途，限制峰值内存
+        batches = [missing[i:i + self.batch_size] for i in range(0, len(missing), self.batch_size)]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for i in range(0, len(batches), self.max_workers):
+                window = batches[i:i + self.max_workers]
+                results = executor.map(lambda batch: self.base.embed_documents([text for _, text in batch]), window)
+                for batch, batch_vectors in zip(window, results):
+                    for (key, _), vector in zip(batch, batch_vectors):
+                        vectors[key] = vector
+                        self._cache_put(key, vector)
+
+        elapsed = time.perf_counter() - start
+        self.stats["documents"] += len(texts)
+        self.stats["unique"] += len(unique)
+        self.stats["embedded"] += len(missing)
+        self.stats["seconds"] += elapsed
+        logger.info(f"Embedded {len(texts)} documents with {len(missing)} model calls "
+                    f"({len(unique)} unique, ratio {len(texts) / max(len(unique), 1):.2f}) "
+                    f"in {elapsed:.2f}s, {len(texts) / max(elapsed, 1e-9):.1f} docs/sec")
+        # 扇出：每个文档得到自己的向量副本，metadata 由调用方按原顺序保留
+        return [list(vectors[key]) for key in keys]
 
-    return list(traverse_yaml(data, file_path=file_path))
+    def embed_query(self, text: str) -> list:
+        return self.base.embed_query(text)
 
-def load_documents_to_chroma(dir_path: str) -> Chroma:
+def load_index_manifest(persist_directory: str) -> dict:
+    """
+    读取索引清单 {相对路径: {"digest": 文件哈希, "ids": [文档ID, ...]}}；
+    清单由其他版本的解析规则生成 (或为没有版本号的旧格式) 时返回空清单，全部文件重新解析分块
+    """
+    manifest_path = os.path.join(persist_directory, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        logger.warning(f"Fail to read index manifest: {manifest_path}, rebuilding it")
+        return {}
+    if manifest.get("version") != LOADER_VERSION:
+        logger.info(f"Index manifest version {manifest.get('version')} differs from loader version {LOADER_VERSION}, "
+                    f"re-chunking all documents")
+        return {}
+    return manifest.get("files", {})
+
+def save_index_manifest(persist_directory: str, manifest: dict):
+    """原子写入索引清单 (连同解析规则版本)"""
+    os.makedirs(persist_directory, exist_ok=True)
+    manifest_path = os.path.join(persist_directory, MANIFEST_NAME)
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({"version": LOADER_VERSION, "files": manifest}, f, ensure_ascii=False)
+    os.replace(tmp_path, manifest_path)
+
+def open_vector_store(embeddings: Embeddings, persist_directory: str, backend: str = 'chroma') -> VectorStore:
+    """
+    打开(或新建)持久化向量库：
+    backend='chroma' 使用 Chroma；backend='numpy' 使用进程内的 NumpyVectorStore，不依赖 Chroma
+    """
+    if backend == 'numpy':
+        return NumpyVectorStore(embeddings, persist_directory=persist_directory)
+    elif backend == 'chroma':
+        from langchain_community.vectorstores import Chroma  # 仅在使用 Chroma 时才导入
+        return Chroma(persist_directory=persist_directory, embedding_function=embeddings)
+    raise ValueError(f"Unsupported vector store backend: {backend}")
+
+def load_documents_to_chroma(dir_path: str, persist_directory: str = './knowledge_base', incremental: bool = True,
+                             batch_size: int = 32, max_workers: int = 2, max_cache_mb: int = 256,
+                             write_batch_size: int = 512, backend: str = 'chroma') -> VectorStore:
     """
     Load XML and YAML files from the specified directory and store them in a Chroma vector store.
+    backend='numpy' 时写入 NumpyVectorStore，用法与 Chroma 相同。
+    incremental=True 时增量索引：未变化的文件直接跳过，只对新增/变化的文档计算向量并upsert；
+    incremental=False 时重新解析并写入全部文档。两种模式都会删除已消失的文档。
+    向量计算经过 DedupBatchEmbeddings，batch_size/max_workers/max_cache_mb 控制分批、并发与缓存内存上限。
+    文档以流的形式产生，每累积 write_batch_size 个待写入文档就计算向量并写入一次，内存占用不随语料规模增长。
     """
-    documents = []
-    for root, _, files in os.walk(dir_path): # 递归解析dir_path目录下的所有文件
-        for file_name in files:
-            file_path = os.path.join(root, file_name)
-            if file_name.endswith('.xml'):
-                documents.extend(load_xml_to_doc(file_path))
-            elif file_name.endswith('.yaml'):
-                documents.extend(load_yaml_to_doc(file_path))
+    embeddings = DedupBatchEmbeddings(LazyHuggingFaceEmbeddings(), batch_size=batch_size,
+                                      max_workers=max_workers, max_cache_mb=max_cache_mb)
+    db = open_vector_store(embeddings, persist_directory, backend)
+    existing_ids = set(db.get(include=[])['ids'])
+    manifest = load_index_manifest(persist_directory) if incremental else {}
+
+    new_manifest = {}
+    pending_ids, pending_docs = [], []
+    added = 0
+
+    def flush():
+        nonlocal added
+        if pending_docs:
+            db.add_documents(pending_docs, ids=pending_ids)
+            added += len(pending_docs)
+            pending_ids.clear()
+            pending_docs.clear()
+
+    for file_path in collect_source_files(dir_path):
+        source = os.path.relpath(file_path, dir_path).replace(os.sep, '/')
+        digest = get_file_digest(file_path)
+        entry = manifest.get(source)
+        if entry and entry['digest'] == digest and existing_ids.issuperset(entry['ids']):
+            new_manifest[source] = entry  # 文件未变化且文档均已入库，无需重新解析
+            continue
+        ids = []
+        for doc_id, doc in iter_documents_with_ids(iter_file_to_doc(file_path), source):
+            ids.append(doc_id)
+            if not incremental or doc_id not in existing_ids:
+                pending_ids.append(doc_id)
+                pending_docs.append(doc)
+                if len(pending_docs) >= write_batch_size:
+                    flush()
+        new_manifest[source] = {"digest": digest, "ids": ids}
+    flush()
 
-    if not documents:
+    kept_ids = {doc_id for entry in new_manifest.values() for doc_id in entry['ids']}
+    if not kept_ids:
         logger.error("No documents found to load.")
         raise Exception("No documents found to load.")
 
-    embeddings = HuggingFaceEmbeddings(model_name="intfloat/multilingual-e5-large")
-    db = Chroma.from_documents(
-        documents,
-        embedding=embeddings,
-        persist_directory='./knowledge_base'
-    )
+    stale_ids = list(existing_ids - kept_ids)
+    if stale_ids:
+        db.delete(ids=stale_ids)
+    if isinstance(db, NumpyVectorStore):
+        db.save()
+    save_index_manifest(persist_directory, new_manifest)
+    logger.info(f"Indexed {len(kept_ids)} documents: {added} added, {len(stale_ids)} deleted, "
+                f"{len(kept_ids) - added} unchanged")
     return db
 
+# 固定评估查询集：(查询, top-k结果中应出现的关键词)
+EVAL_QUERIES = [
+    ('如何发送消息到文件传输助手？', '文件传输助手'),
+    ('打开通讯录', '通讯录'),
+    ('查看收藏的内容', '收藏'),
+    ('进入朋友圈发表动态', '发表'),
+    ('打开小程序面板', '小程序'),
+    ('在搜索框中输入联系人', '搜索'),
+]
+
+def evaluate_retrieval(db, queries: list = None, k: int = 4) -> dict:
+    """
+    在固定查询集上评估检索效果：索引大小、平均/最大查询延迟，以及 top-k 命中率
+    （top-k 结果中任一文档包含期望关键词即视为命中）
+    """
+    queries = queries or EVAL_QUERIES
+    latencies, hits = [], 0
+    for query, keyword in queries:
+        start = time.perf_counter()
+        docs = db.similarity_search(query, k=k)
+        latencies.append(time.perf_counter() - start)
+        if any(keyword in doc.page_content for doc in docs):
+            hits += 1
+    result = {
+        "index_size": len(db.get(include=[])['ids']),
+        "avg_latency_ms": 1000 * sum(latencies) / len(latencies),
+        "max_latency_ms": 1000 * max(latencies),
+        f"hit@{k}": hits / len(queries),
+    }
+    logger.info(f"Retrieval evaluation: {result}")
+    return result
+
 
+# 示例调用: python -m utils.data_proc (文档路径相对于仓库根目录，与当前工作目录无关)
 if __name__ == '__main__':
-    db = load_documents_to_chroma('../doc')
+    db = load_documents_to_chroma(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'doc'))
+    evaluate_retrieval(db)
     retriever = db.as_retriever()
     query = '如何发送消息到文件传输助手？'
     docs = retriever.get_relevant_documents(query)
-    print(docs[0].page_content)
\ No newline at end of file
+    print(docs[0].page_content)
@@ -1,14 +1,18 @@
 import os
-import re
 import yaml
 import xml.etree.ElementTree as ET
+from collections import deque
 from openai import OpenAI
 import logging
-from pathlib import Path
+
+from utils.capture_policy import OMITTED_TAG, live_tag, omitted_count
+from utils.state_store import diff_subtrees, element_xpaths, load_states, subtree_xml
 
 logger = logging.getLogger()
 model = 'gpt-4.1'
 interactive_tags = ['Button', 'Edit', 'ListItem', 'ComboBox']
+DIFF_PROMPT_RATIO = 0.5  # 界面差异不超过完整XML的该比例时，由来源页面与差异推断页面名称，减小提示长度
+PROMPT_IGNORED_ATTRS = ["path", "depth", "handle"]  # 提示中省略的属性 (可由树结构得到或对页面语义无用)
 
 def parse_utg(utg_path) -> dict:
     """
@@ -27,18 +31,9 @@ def parse_utg(utg_path) -> dict:
         trans_map.setdefault(key, []).append(new_state)
     return trans_map
 
-def get_page_name_summary(xml_content: str) -> tuple:
-    """
-    使用 OpenAI API 为给定的页面 XML 生成页面名称和功能摘要（一句话）。
-    返回 (page_name, summary)。接口返回 JSON 包含 "page_name" 和 "summary" 字段。
-    """
+def request_page_name_summary(prompt: str) -> tuple:
+    """请求大模型返回页面名称和功能摘要，接口返回 JSON 包含 "page_name" 和 "summary" 字段"""
     agent = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-    prompt = f"""请阅读以下微信界面的XML结构，想一个合适的页面名称，并用一句话描述该界面的功能。
-XML:
-{xml_content}
-请以JSON格式输出，包含 "page_name" 和 "summary" 字段。
-示例输出:
-{{"page_name": "主页", "summary": "显示聊天列表，用于访问聊天内容"}}"""
     try:
         response = agent.chat.completions.create(
             model=model,
@@ -56,6 +51,33 @@ XML:
         logger.error(f"OpenAI 请求失败: {e}")
         return None, None
 
+def get_page_name_summary(xml_content: str) -> tuple:
+    """
+    使用 OpenAI API 为给定的页面 XML 生成页面名称和功能摘要（一句话）。
+    返回 (page_name, summary)。
+    """
+    prompt = f"""请阅读以下微信界面的XML结构，想一个合适的页面名称，并用一句话描述该界面的功能。
+XML:
+{xml_content}
+请以JSON格式输出，包含 "page_name" 和 "summary" 字段。
+示例输出:
+{{"page_name": "主页", "summary": "显示聊天列表，用于访问聊天内容"}}"""
+    return request_page_name_summary(prompt)
+
+def get_page_name_summary_from_diff(source_name: str, source_summary: str, control: str, diff_content: str) -> tuple:
+    """
+    由来源页面的名称、摘要与交互后的界面差异生成新页面的名称和功能摘要，提示只包含变化的子树。
+    返回 (page_name, summary)。
+    """
+    prompt = f"""在微信界面《{source_name}》（功能：{source_summary}）中与控件 {control} 交互后进入一个新界面。
+以下是新界面相对于原界面的差异，Added 为新增的控件子树，Removed 为消失的控件，Changed 为内容变化后的控件:
+{diff_content}
+请为新界面想一个合适的页面名称，并用一句话描述该界面的功能。
+请以JSON格式输出，包含 "page_name" 和 "summary" 字段。
+示例输出:
+{{"page_name": "主页", "summary": "显示聊天列表，用于访问聊天内容"}}"""
+    return request_page_name_summary(prompt)
+
 def get_control_description(page_name, page_summary, targets_info) -> str:
     """
     使用 OpenAI API 为控件生成功能描述。
@@ -87,22 +109,42 @@ def get_control_description(page_name, page_summary, targets_info) -> str:
         logger.error(f"OpenAI 控件描述请求失败: {e}")
         return ""
 
+def prompt_xml(elem: ET.Element, with_children: bool = True) -> str:
+    """提示中使用的控件XML：去掉缩进与 PROMPT_IGNORED_ATTRS"""
+    elem = ET.fromstring(subtree_xml(elem)) if with_children else ET.Element(elem.tag, elem.attrib)
+    for node in elem.iter():
+        for attr in PROMPT_IGNORED_ATTRS:
+            node.attrib.pop(attr, None)
+    return ET.tostring(elem, encoding="unicode")
+
+def render_diff(old: ET.Element, new: ET.Element) -> str:
+    """两个界面之间的差异文本：新增子树的XML、消失控件的标识，以及内容变化的控件 (不含子控件)"""
+    subtrees = diff_subtrees(old, new)
+    old_xpaths = element_xpaths(old)
+    lines = ["<Added>"] + [prompt_xml(elem) for elem in subtrees["added"]] + ["</Added>", "<Removed>"]
+    lines += [old_xpaths[id(elem)] for elem in subtrees["removed"]] + ["</Removed>", "<Changed>"]
+    lines += [prompt_xml(elem, with_children=False) for _, elem in subtrees["changed"]]
+    return "\n".join(lines + ["</Changed>"])
+
 def build_xpath_map(root: ET.Element) -> tuple[dict, dict]:
     """
     构建元素XPath映射与父元素映射。
     返回 (element_to_xpath, parent_map)：
       - element_to_xpath: 元素 id -> 绝对 XPath 字符串
       - parent_map: 元素 id -> 父元素对象
-    XPath 优先使用 [@auto_id]/[@title]/[@name] 定位，否则使用索引。
+    XPath 优先使用 [@auto_id]/[@title]/[@name] 定位，否则使用索引 (计入采集时被裁剪的同类控件)。
     """
     element_to_xpath = {}
     parent_map = {}
     def traverse(elem: ET.Element, path: str):
         element_to_xpath[id(elem)] = path
+        tag_counts = {}
         for child in list(elem):
+            index = tag_counts.get(live_tag(child), 0)
+            tag_counts[live_tag(child)] = index + omitted_count(child)
+            if child.tag == OMITTED_TAG:
+                continue
             parent_map[id(child)] = elem
-            siblings = [c for c in list(elem) if c.tag == child.tag]
-            index = siblings.index(child)
             if 'auto_id' in child.attrib and child.attrib['auto_id']:
                 part = f'/{child.tag}[@auto_id="{child.attrib["auto_id"]}"]'
             elif 'title' in child.attrib and child.attrib['title']:
@@ -117,45 +159,59 @@ def build_xpath_map(root: ET.Element) -> tuple[dict, dict]:
     traverse(root, root_path)
     return element_to_xpath, parent_map
 
-def parse_xml_file(xml_file) -> (int, ET.Element):
-    """
-    解析单个 XML 文件，返回状态编号及其根元素。
-    如果解析失败，记录错误并返回 None。
-    """
-    fname = xml_file.name
-    match = re.search(r'(\d+)', fname)
-    state_id = int(match.group(1)) if match else None
-    try:
-        tree = ET.parse(xml_file)
-    except Exception as e:
-        logger.error(f"无法解析XML文件 {fname}: {e}")
-        raise Exception("XML解析失败")
-    root = tree.getroot()
-
-    return state_id, root
+def exploration_order(states: dict, trans_map: dict) -> list:
+    """从编号最小的状态出发沿UTG广度优先排列状态，来源页面先于其跳转到的页面，无法到达的状态排在最后"""
+    successors = {}
+    for (state, _), new_states in trans_map.items():
+        successors.setdefault(state, []).extend(new_states)
+    order = []
+    seen = set()
+    queue = deque(sorted(states)[:1])
+    while queue:
+        state_id = queue.popleft()
+        if state_id in seen or state_id not in states:
+            continue
+        seen.add(state_id)
+        order.append(state_id)
+        queue.extend(successors.get(state_id, []))
+    return order + [state_id for state_id in sorted(states) if state_id not in seen]
 
-def get_page_info(xml_files: list) -> dict:
+def get_page_info(states: dict, trans_map: dict = None) -> dict:
     """
-    从 XML 文件列表中提取页面信息（名称和摘要）。
+    为每个状态提取页面信息（名称和摘要）。
+    按UTG顺序处理，已描述的来源页面与新页面的差异足够小时，只发送来源页面信息与差异，否则发送完整XML。
     返回字典：{state_id: {"page_name": ..., "summary": ...}}
     """
+    trans_map = trans_map or {}
+    incoming = {}  # state_id -> [(来源状态, 控件标识), ...]
+    for (state, ctrl), new_states in trans_map.items():
+        for new_state in new_states:
+            if new_state != state:
+                incoming.setdefault(new_state, []).append((state, ctrl))
     page_info = {}
-    for xml_file in xml_files:
-        fname = xml_file.name
-        try:
-            state_id, root = parse_xml_file(xml_file)
-        except Exception as e:
-            continue
-        xml_str = ET.tostring(root, encoding='utf-8').decode('utf-8')
-        page_name, summary = get_page_name_summary(xml_str)
+    for state_id in exploration_order(states, trans_map):
+        root = states[state_id]
+        xml_str = prompt_xml(root)
+        best = None  # (差异文本, 来源状态, 控件标识)
+        for source, ctrl in incoming.get(state_id, []):
+            if source in page_info:
+                diff_str = render_diff(states[source], root)
+                if len(diff_str) <= DIFF_PROMPT_RATIO * len(xml_str) and (best is None or len(diff_str) < len(best[0])):
+                    best = (diff_str, source, ctrl)
+        if best is not None:
+            diff_str, source, ctrl = best
+            page_name, summary = get_page_name_summary_from_diff(page_info[source]["page_name"],
+                                                                 page_info[source]["summary"], ctrl, diff_str)
+        else:
+            page_name, summary = get_page_name_summary(xml_str)
         if not page_name:
             logger.debug(f"Fail to get a page name for state{state_id}, using default.")
-            page_name = f"页面{state_id}" if state_id is not None else fname
+            page_name = f"页面{state_id}"
         if not summary:
             logger.debug(f"Fail to get a summary for state{state_id}, using default.")
             summary = ""
         page_info[state_id] = {"page_name": page_name, "summary": summary}
-        logger.info(f"页面 {fname}: 名称='{page_name}', 摘要='{summary}'")
+        logger.info(f"页面 state{state_id}: 名称='{page_name}', 摘要='{summary}'")
     return page_info
 
 def convert_xml_to_appdoc(xml_dir, utg_path, output_yaml):
@@ -164,26 +220,18 @@ def convert_xml_to_appdoc(xml_dir, utg_path, output_yaml):
     """
     # 解析UTG映射
     trans_map = parse_utg(utg_path)
-    xml_dir = Path(xml_dir)
-    # 扫描所有 XML 文件并按文件名中的数字排序
-    xml_files = sorted(
-        xml_dir.glob("*.xml"), 
-        key=lambda x: int(re.search(r'(\d+)', str(x)).group(1)) if re.search(r'(\d+)', str(x)) else str(x)
-    )
-    if not xml_files:
+    # 读取全部状态 (完整XML或差量存储)，按状态编号排序
+    states = load_states(xml_dir)
+    if not states:
         logger.error("未找到任何XML文件。")
         return
 
     # 第一阶段：为每个页面生成页面名称和摘要
-    page_info = get_page_info(xml_files)
+    page_info = get_page_info(states, trans_map)
 
     # 第二阶段：构建 AppDoc 结构（页面及控件）
     appdoc = {"pages": []}
-    for xml_file in xml_files:
-        try:
-            state_id, root = parse_xml_file(xml_file)
-        except Exception as e:
-            continue
+    for state_id, root in states.items():
         xpath_map, parent_map = build_xpath_map(root)
 
         # 标记需要跳过的动态控件（同一父节点下第二个及以后的动态控件）
@@ -238,9 +286,11 @@ def convert_xml_to_appdoc(xml_dir, utg_path, output_yaml):
             parent = parent_map.get(id(elem))
             index = 0
             if parent is not None:
-                same = [c for c in list(parent) if c.tag == tag]
-                if elem in same:
-                    index = same.index(elem)
+                for c in list(parent):
+                    if c is elem:
+                        break
+                    if live_tag(c) == tag:
+                        index += omitted_count(c)
             if not ctrl_text:
                 ctrl_text = f"{tag}{index}"
             control_name = f"{page_entry['page_name']}-{ctrl_text}"
@@ -1,181 +1,147 @@
+import copy
+import hashlib
 import logging
 import os
-import re
-import shutil
-import time
 
 from pywinauto import Desktop, Application
 from pywinauto.controls.uiawrapper import UIAWrapper
-import yaml
 import xml.etree.ElementTree as ET
 
-import utils.classifier as classifier
+from utils.action_planner import plan_actions, resolve_control
+from utils.capture_policy import FULL_CAPTURE, get_policy
+from utils.control_snapshot import snapshot_control
 from utils.gui_tree_exporter import export_gui_xml_structure, indent_xml
-
+from utils.coordinator import ExplorationCoordinator
+from utils.journal import write_utg_yaml
+from utils.settle import SettleDetector, window_fingerprint
+from utils.similarity import jaccard, structure_shingles
+from utils.state_store import CACHE_BYTES, diff_summary
+from utils.window_registry import WindowRegistry
+
+WAIT_INTERVAL = 0.05   # 并行探索中前沿暂时为空时，等待其他 worker 结果的间隔(秒)
 TEST_INPUTS = ["测试", "文件传输助手", "Hello", "12345", "!@#$%"]
 logger = logging.getLogger()
 
 
-def get_control_id(ctrl: UIAWrapper, gui_xml_tree: ET.ElementTree):
-    """
-    用绝对XPATH获取控件的唯一标识符，优先使用auto_id、title或name属性，最后使用索引
-    """
-    def get_best_attr(elem):
-        for attr in ["auto_id", "title", "name"]:
-            val = elem.attrib.get(attr, "")
-            if val:
-                val = val.replace('"', '\\"')
-                return f'@{attr}="{val}"'
-        return None
-
-    root_elem = gui_xml_tree.getroot()
-    ancestors = [] # 获取控件的祖先列表
-    current_ctrl = ctrl
-    while current_ctrl is not None:
-        ancestors.insert(0, current_ctrl)
-        try:
-            parent_ctrl = current_ctrl.parent()
-        except Exception:
-            parent_ctrl = None
-        current_ctrl = parent_ctrl
-
-    logger.debug(f"ancestors: {ancestors}")
-    if not ancestors or root_elem.tag != ancestors[1].friendly_class_name():
-        raise Exception("Root node mismatch, cannot generate XPath")
-
-    xpath_parts = [f"/{root_elem.tag}"]
-    parent_elem = root_elem
-    for ctrl_obj in ancestors[2:]:
-        tag = ctrl_obj.friendly_class_name()
-        same_type_children = parent_elem.findall(tag)
-        if not same_type_children:
-            logger.debug(f"Fail to find children with tag: {tag} in parent: {parent_elem.tag}")
-            raise Exception("Cannot find control path in XML structure")
-
-        matched = False
-        for idx, child_elem in enumerate(same_type_children):
-            best_attr = get_best_attr(child_elem)
-            ctrl_auto_id = getattr(ctrl_obj, "automation_id", lambda: "")()
-            ctrl_title = getattr(ctrl_obj, "window_text", lambda: "")()
-            ctrl_name = getattr(ctrl_obj, "element_info", None)
-            ctrl_name = ctrl_name.name if ctrl_name else ""
-            # Compare attribute values
-            if best_attr:
-                attr_name, attr_val = re.match(r'@(\w+)="(.*)"', best_attr).groups()
-                if (attr_name == "auto_id" and ctrl_auto_id == attr_val) or \
-                   (attr_name == "title" and ctrl_title == attr_val) or \
-                   (attr_name == "name" and ctrl_name == attr_val):
-                    xpath_parts.append(f'/{tag}[{best_attr}]')
-                    parent_elem = child_elem
-                    matched = True
-                    break
-        if not matched: # 如果没有找到匹配的属性，最后使用索引
-            try:
-                parent_ctrl = ctrl_obj.parent()
-            except Exception:
-                logger.debug("Parent node mismatch, get the root node")
-                parent_ctrl = None
-            if parent_ctrl:
-                siblings = [sib for sib in parent_ctrl.children() if sib.friendly_class_name() == tag]
-            else:
-                logger.debug("Parent node not found, only exist the root node in this level")
-                siblings = [ctrl_obj]
-            try:
-                index = siblings.index(ctrl_obj)
-            except ValueError:
-                logging.debug(f"Cannot find <{ctrl_obj}> in its siblings: {siblings}")
-                index = 0  # 默认使用第一个索引
-            if index + 1 > len(same_type_children):
-                raise Exception("XML structure mismatch, index out of range")
-            child_elem = same_type_children[index]
-            xpath_parts.append(f"/{tag}[{index}]")
-            parent_elem = child_elem
-
-    xpath = "".join(xpath_parts)
-    return xpath
-
-
-def is_state_similar(state1: ET.ElementTree, state2: ET.ElementTree) -> bool:
-    """判断两个界面结构是否相似（忽略内容差异）"""
+STRUCTURE_IGNORED_ATTRS = ["title", "name", "path", "rect", "handle", "auto_id", "is_dynamic"]
+
+def state_fingerprint(state: ET.ElementTree) -> str:
+    """界面结构指纹：删除会随内容变化的属性后序列化并取哈希，结构相同的状态指纹相同"""
     def normalize(elem):
-        # 删除会随内容变化的属性
-        for attr in ["title", "name", "path", "rect", "handle", "auto_id", "is_dynamic"]:
+        for attr in STRUCTURE_IGNORED_ATTRS:
             if attr in elem.attrib:
                 elem.attrib.pop(attr)
-        # 对所有子节点递归处理
         for child in list(elem):
             normalize(child)
-    import copy # 深拷贝
-    e1 = copy.deepcopy(state1.getroot())
-    e2 = copy.deepcopy(state2.getroot())
-    normalize(e1)
-    normalize(e2)
-    # 转换为字符串比较
-    xml_str1 = ET.tostring(e1)
-    xml_str2 = ET.tostring(e2)
-    if xml_str1 == xml_str2:
-        logging.debug(f"XML structure match")
-        return True
-    else:
-        return False
-
-def collect_interactive_controls(wrapper: UIAWrapper) -> list:
-    """收集当前界面中的可交互控件，注意该方法会过滤所有祖先控件为可交互的可交互控件"""
-    try:
-        controls = wrapper.descendants()
-    except Exception:
-        controls = wrapper.children()
-
-    all_interactive_controls = []  # 收集当前状态中的可交互控件
-    for ctrl in controls:
-        ctrl_type = ctrl.friendly_class_name()
-        if ctrl_type in classifier.non_interactive_containers:
-            continue  # 跳过不可交互的容器控件
-        all_interactive_controls.append(ctrl)
-
-    target_interactive_controls = []
-    for ctrl in all_interactive_controls:
-        parent_ctrl = ctrl.parent()
-        skip = False
-        while parent_ctrl is not None:
-            if parent_ctrl in all_interactive_controls:
-                skip = True
-                logger.debug(f"Skip interactive control: {ctrl}")
-                break
+    root = copy.deepcopy(state.getroot())
+    normalize(root)
+    return hashlib.sha1(ET.tostring(root)).hexdigest()
+
+def live_state_fingerprint(wrapper: UIAWrapper, max_depth: int = 15, policy=FULL_CAPTURE) -> str:
+    """
+    直接遍历实时控件树计算与 state_fingerprint 相同的结构指纹，每个节点的子控件及其属性由一次批量请求取回，
+    用于到达目标状态后的校验，不导出XML；policy 须与导出状态时的采集策略 (CapturePolicy 或预置策略名称) 一致
+    """
+    def build(ctrl, depth, policy):
+        elem = ET.Element(ctrl.friendly_class_name(), {"class_name": ctrl.element_info.class_name, "depth": str(depth)})
+        if depth < max_depth:
             try:
-                parent_ctrl = parent_ctrl.parent()
+                children = ctrl.children()
             except Exception:
-                logger.debug("Fail to get parent control, stop checking")
-                break
-        if not skip:
-            target_interactive_controls.append(ctrl)
+                children = []
+            child_policy = policy.child_policy(ctrl)
+            for child in child_policy.select_children(children):
+                elem.append(child if isinstance(child, ET.Element) else build(child, depth + 1, child_policy))
+        return elem
+    snapshot = snapshot_control(wrapper)
+    root = build(snapshot, 0, get_policy(policy).bind(snapshot))
+    indent_xml(root)
+    return hashlib.sha1(ET.tostring(root)).hexdigest()
+
+def is_state_similar(state1: ET.ElementTree, state2: ET.ElementTree, threshold: float = None) -> bool:
+    """判断两个界面结构是否相似（忽略内容差异）；给出 threshold 时结构 Jaccard 相似度不低于该值也视为相似"""
+    if state_fingerprint(state1) == state_fingerprint(state2):
+        logging.debug(f"XML structure match")
+        return True
+    if threshold is not None and \
+            jaccard(structure_shingles(state1.getroot()), structure_shingles(state2.getroot())) >= threshold:
+        logging.debug(f"XML structure near-duplicate")
+        return True
+    return False
 
-    return target_interactive_controls
+def get_latest_window_handle(new_handles: set):
+    """从动作产生的新窗口中取出唯一的新窗口句柄，没有或有多个新窗口时返回None"""
+    return next(iter(new_handles)) if len(new_handles) == 1 else None
 
+def click_control(ctrl: UIAWrapper, planned: dict):
+    """点击规划的控件：矩形中心被遮挡时点击规划时找到的可见位置"""
+    if planned["click_point"] is not None:
+        ctrl.click_input(coords=planned["click_point"])
+    else:
+        ctrl.click_input()
 
-def get_latest_window_handle(before_handles: list):
-    """获取最新打开的窗口句柄"""
-    time.sleep(0.5)  # 等待新窗口打开
-    after_handles = [w.element_info.handle for w in Desktop(backend="uia").windows()]
-    new_handles = set(after_handles) - set(before_handles)
-    return new_handles.pop() if len(new_handles) == 1 else None
+def get_action_keys(state_num: int, planned: dict) -> list:
+    """规划动作对应的日志键 (状态, 控件标识, 动作, 内容)，输入框每个测试输入各对应一个键"""
+    if planned["tag"] == 'Edit':
+        return [(state_num, planned["xpath"], "input", text) for text in TEST_INPUTS]
+    return [(state_num, planned["xpath"], "click", 'null')]
 
 class Explorer:
-    def __init__(self, main_handle: int, output_dir: str):
-        """使用给定窗口句柄初始化Explorer"""
+    def __init__(self, main_handle: int, output_dir: str, settle_timeout: float = 5.0, resume: bool = False,
+                 reset_app=None, coordinator: ExplorationCoordinator = None, worker_name: str = "main",
+                 capture_policy=None, similarity_threshold: float = None, delta_chain: int = 0,
+                 state_cache_bytes: int = CACHE_BYTES, outcome_prediction: str = None):
+        """
+        使用给定窗口句柄初始化Explorer，settle_timeout 为每次交互后等待界面稳定的上限(秒)；
+        resume=True 时从 output_dir 中的探索日志恢复已发现的状态与跳转，跳过已完成的动作；
+        reset_app 为可选的重启应用回调，前沿调度无法沿已知跳转到达目标状态时调用；
+        coordinator 为并行探索时共享的状态库与前沿 (此时忽略 resume 及以下各项采集与存储选项，以协调器的设置为准)，每个 worker 以不同的 worker_name 驱动各自的应用实例；
+        capture_policy 为导出状态时的采集裁剪策略 (CapturePolicy 或预置策略名称，默认完整采集)；
+        similarity_threshold 不为 None 时，结构 Jaccard 相似度不低于该值的状态 (如消息条数不同的同一聊天页面) 归为同一状态；
+        delta_chain > 0 时状态以差量形式存储 (见 StateStore)，默认每个状态保存完整XML；
+        state_cache_bytes 为内存中保留的已解析状态树的字节预算 (None 为不限)，超出后淘汰最久未用的树，需要时从磁盘重新读取；
+        outcome_prediction 启用动作结果缓存：同一控件在结构相同的区域中已有一致的结果 (如导航栏按钮)、
+        或输入框的不同输入已得到相同结果时，预测其余同类动作的结果；"defer" 将这些动作延后到前沿中其他动作之后，
+        "skip" 不再执行，直接按预测结果记录 (UTG 边标记 Predicted)；DFS 探索只支持 "skip"
+        """
         self.stack_path = []
         self.main_window_spec = Desktop(backend="uia").window(handle=main_handle)
         self.main_wrapper = self.main_window_spec.wrapper_object()
-        self.state_counter = 0
-        self.visited_states = {}      # 保存每个状态的结构表示用于比较
-        self.transitions = []         # 保存状态跳转记录 (UTG 边集合)，待解析为yaml
         self.output_dir = output_dir
-        shutil.rmtree(self.output_dir, ignore_errors=True)  # 清空上次的UTG目录shutil.rmtree("utg", ignore_errors=True)  # 清空上次的UTG目录
-        # 解析初始状态
-        initial_xml = export_gui_xml_structure(self.main_wrapper, output_dir=self.output_dir, state_num=self.state_counter)
-        self.visited_states[self.state_counter] = ET.parse(initial_xml)
-
-    def log_interaction(self, current_state_num: int, target_state_num: int, control_identifier: str, action: str, content: str):
+        self.settle = SettleDetector(timeout=settle_timeout)  # 交互后等待界面稳定，替代固定sleep
+        self.window_registry = WindowRegistry([self.main_wrapper.element_info.process_id])  # 只跟踪目标进程的顶层窗口
+        self.reset_app = reset_app
+        self.worker_name = worker_name
+        self.stats = {"actions": 0, "navigation_steps": 0, "navigation_failures": 0, "window_closes": 0, "resets": 0,
+                      "predicted_actions": 0, "deferred_actions": 0, "hidden_actions": 0}
+        self.owns_coordinator = coordinator is None
+        self.coordinator = coordinator or ExplorationCoordinator(output_dir, resume=resume, capture_policy=capture_policy,
+                                                                 similarity_threshold=similarity_threshold,
+                                                                 delta_chain=delta_chain,
+                                                                 state_cache_bytes=state_cache_bytes,
+                                                                 outcome_prediction=outcome_prediction)
+        self.capture_policy = self.coordinator.capture_policy
+        # 以下结构由协调器持有，并行探索时为所有 worker 共享，修改时需持有 self.lock
+        self.lock = self.coordinator.lock
+        self.visited_states = self.coordinator.visited_states      # 每个状态的结构表示，按需从磁盘读取
+        self.state_fingerprints = self.coordinator.state_fingerprints  # 结构指纹 -> 状态编号
+        self.transitions = self.coordinator.transitions             # 保存状态跳转记录 (UTG 边集合)，待解析为yaml
+        self.plans = self.coordinator.plans                         # 状态编号 -> {控件标识: 规划动作}
+        self.scheduler = self.coordinator.scheduler
+        self.journal = self.coordinator.journal
+        self.outcomes = self.coordinator.outcomes                   # 动作结果缓存，未启用时为 None
+        # 解析初始状态 (已存在时与已有状态去重)
+        self.capture_state(self.main_wrapper)
+
+    def wait_for_settle(self, current_wrapper: UIAWrapper) -> float:
+        """轮询顶层窗口集合与当前窗口子树指纹，界面稳定后立即返回，返回等待秒数"""
+        _, elapsed = self.settle.wait(lambda: window_fingerprint(current_wrapper, self.window_registry.list_windows))
+        logger.debug(f"UI settled in {elapsed:.3f}s")
+        return elapsed
+
+    def log_interaction(self, current_state_num: int, target_state_num: int, control_identifier: str, action: str, content: str,
+                        predicted: bool = False):
+        """记录UTG边，并附上动作前后界面的差异摘要 (新增、删除与内容变化的子树)；predicted 表示该边未经执行，由动作结果缓存预测"""
         transition = {
             "Action": action,
             "Content": content,
@@ -183,57 +149,274 @@ class Explorer:
             "State": current_state_num,
             "New_State_Num": target_state_num,
         }
-        self.transitions.append(transition)
+        if predicted:
+            transition["Predicted"] = True
+        with self.lock:
+            source, target = self.visited_states.get(current_state_num), self.visited_states.get(target_state_num)
+        if source is not None and target is not None:
+            transition["Diff"] = diff_summary(source.getroot(), target.getroot())
+        self.coordinator.log_interaction(transition)
 
     def export_utg_yaml(self, transitions: list):
         """将状态跳转记录导出为YAML文件"""
-        utg_data = {"transitions": transitions}
-        output_utg_yaml = os.path.join(self.output_dir, 'UTG.yaml')  # "utg/UTG.yaml"
-        os.makedirs(os.path.dirname(output_utg_yaml), exist_ok=True)
-        with open(output_utg_yaml, "w", encoding="utf-8") as f:
-            yaml.safe_dump(utg_data, f, allow_unicode=True)
-
-    def try_new_state(self, current_wrapper: UIAWrapper, new_win_handle) -> [int, UIAWrapper, ET.ElementTree]:
-        """检查是否产生新状态，新状态则返回新状态值，否则返回-1"""
+        write_utg_yaml(os.path.join(self.output_dir, 'UTG.yaml'), transitions)  # "utg/UTG.yaml"
+
+    def get_state_wrapper(self, current_wrapper: UIAWrapper, new_win_handle) -> UIAWrapper:
+        """动作之后的前台窗口：有唯一的新窗口时连接该窗口，否则仍为当前窗口"""
         if new_win_handle is None:
             logger.debug(f"No new window handle found")
 
         if new_win_handle is None or new_win_handle == current_wrapper.element_info.handle:
-            new_state_wrapper = current_wrapper  # 仍然是当前窗口
-        else:
-            new_state_wrapper = Application(backend="uia").connect(handle=new_win_handle).window(handle=new_win_handle).wrapper_object()
-
-        self.state_counter += 1
-        new_state_id = self.state_counter
-        new_xml_path = export_gui_xml_structure(new_state_wrapper, output_dir=self.output_dir, state_num=new_state_id)
-        new_state = ET.parse(new_xml_path)
-        # 检查新状态是否已存在（或与已有状态结构相似）
-        target_state_num = new_state_id  # 默认假定为新状态
-        for sid, state in self.visited_states.items():
-            if is_state_similar(state, new_state):
-                target_state_num = sid
-                try:
-                    os.remove(new_xml_path)
-                except OSError:
-                    logger.debug(f"Fail to remove {new_xml_path}")
-                    pass
-                self.state_counter -= 1  # 回滚状态值
-                break
-
-        if target_state_num == new_state_id:  # 如果是全新状态，则保存其结构供后续比较，并加入待探索队列
-            self.visited_states[new_state_id] = new_state
-
+            return current_wrapper  # 仍然是当前窗口
+        return Application(backend="uia").connect(handle=new_win_handle).window(handle=new_win_handle).wrapper_object()
+
+    def try_new_state(self, current_wrapper: UIAWrapper, new_win_handle,
+                      current_xml_tree: ET.ElementTree = None) -> [int, UIAWrapper, ET.ElementTree]:
+        """检查是否产生新状态，新状态则返回新状态值，否则返回-1；仍在当前窗口时以 current_xml_tree 为上一快照差量采集"""
+        new_state_wrapper = self.get_state_wrapper(current_wrapper, new_win_handle)
+        previous = current_xml_tree if new_state_wrapper is current_wrapper else None
+        target_state_num, new_state = self.capture_state(new_state_wrapper, previous)
         return [target_state_num, new_state_wrapper, new_state]
 
-    def explore(self):
-        """对GUI进行DFS遍历"""
+    def capture_state(self, new_state_wrapper: UIAWrapper, previous: ET.ElementTree = None) -> [int, ET.ElementTree]:
+        """
+        导出窗口结构并与已有状态比较，返回 (状态编号, 结构)；全新状态会被登记。
+        previous 为同一窗口动作前的状态结构时差量采集，复用未变化的子树。
+        导出写入本 worker 的临时目录，不持有锁，只有去重与编号分配在协调器中串行进行
+        """
+        captured_xml = export_gui_xml_structure(new_state_wrapper, output_dir=self.coordinator.capture_dir(self.worker_name),
+                                                previous=previous.getroot() if previous is not None else None,
+                                                policy=self.capture_policy)
+        new_state = ET.parse(captured_xml)
+        # 检查新状态是否已存在（或与已有状态结构相似），全新状态则保存其结构供后续比较
+        target_state_num, _ = self.coordinator.register_state(new_state, state_fingerprint(new_state), captured_xml)
+        return [target_state_num, new_state]
+
+    def explore(self, strategy: str = "frontier", max_actions: int = None):
+        """
+        探索GUI：strategy="frontier" 使用前沿调度 (默认)，"dfs" 使用原有的深度受限DFS；
+        max_actions 限制前沿调度执行的探索动作数
+        """
         self.stack_path = []
         try:
-            self._dfs_explore(0, self.main_wrapper, self.visited_states[0] , 0)
+            if strategy == "dfs":
+                self._dfs_explore(0, self.main_wrapper, self.visited_states[0] , 0)
+            else:
+                self._frontier_explore(max_actions)
         except Exception as e:
             logger.error(f"Explorer crashed: {e}", exc_info=True)
         finally:
-            self.export_utg_yaml(self.transitions)
+            with self.lock:
+                self.scheduler.release_worker(self.worker_name)
+                self.lock.notify_all()
+            if self.owns_coordinator:
+                self.coordinator.compact()  # 由探索日志生成UTG.yaml；并行探索时由协调器在全部 worker 结束后合并
+            logger.info(f"UI settle time distribution: {self.settle.summary()}")
+            logger.info(f"Exploration stats: {self.stats}, {len(self.visited_states)} states")
+
+    def plan_state(self, state_num: int):
+        """规划状态中的动作并加入探索前沿，已规划过的状态跳过；新状态归属于发现它的 worker"""
+        with self.lock:
+            if state_num in self.plans:
+                return
+            state = self.visited_states[state_num]
+            planned_actions = plan_actions(state, state_num)
+            self.plans[state_num] = {}
+            for planned in planned_actions:
+                self.plans[state_num].setdefault(planned["xpath"], planned)
+            action_keys = [key for planned in planned_actions for key in get_action_keys(state_num, planned)]
+            self.journal.record_plan(state_num, action_keys)
+            self.scheduler.add_state(state_num, action_keys, tried=self.journal.tried, owner=self.worker_name,
+                                     predicted=self.journal.predicted)
+            for planned in planned_actions:   # 无法点击到的控件 (被裁剪或遮挡) 延后到其他动作之后
+                if planned["hidden"] and planned["tag"] != "Edit" \
+                        and self.scheduler.defer((state_num, planned["xpath"], "click", 'null')):
+                    self.stats["hidden_actions"] += 1
+            self.register_outcomes(state_num, state, action_keys)
+            self.lock.notify_all()
+
+    def register_outcomes(self, state_num: int, state: ET.ElementTree, action_keys: list):
+        """将状态的动作登记到动作结果缓存 (恢复探索时重放已执行动作的结果)，并处理已可预测的动作"""
+        if self.outcomes is None:
+            return
+        with self.lock:
+            untried = [key for key in action_keys if key not in self.journal.tried]
+            observed = {key: self.journal.tried[key] for key in action_keys
+                        if key in self.journal.tried and key not in self.journal.predicted}
+            self.outcomes.add_state(state_num, state.getroot(), untried, observed)
+            self.apply_predictions(self.outcomes.predictable(untried))
+
+    def record_outcome(self, action_key: tuple, target_state_num: int):
+        """记录实际执行的动作结果；target_state_num 为 None 表示控件已无法操作"""
+        if self.outcomes is None:
+            return
+        with self.lock:
+            if target_state_num is None:
+                self.outcomes.discard(action_key)
+            else:
+                self.apply_predictions(self.outcomes.record(action_key, target_state_num))
+
+    def apply_predictions(self, action_keys: list):
+        """结果可预测的动作：skip 模式下按预测结果记录而不执行，defer 模式下在前沿中延后"""
+        with self.lock:
+            for action_key in action_keys:
+                if action_key in self.journal.tried or action_key in self.scheduler.claimed:
+                    continue
+                target_state_num = self.outcomes.predict(action_key)
+                if self.coordinator.outcome_prediction == "skip":
+                    self.outcomes.discard(action_key)
+                    self.journal.record_action(action_key, target_state_num, predicted=True)
+                    self.scheduler.record(action_key, target_state_num, predicted=True)
+                    if target_state_num != action_key[0]:
+                        self.log_interaction(action_key[0], target_state_num, action_key[1], action_key[2],
+                                             action_key[3], predicted=True)
+                    self.stats["predicted_actions"] += 1
+                elif self.scheduler.defer(action_key):
+                    self.stats["deferred_actions"] += 1
+
+    def perform_action(self, action_key: tuple, current_wrapper: UIAWrapper):
+        """在实时界面上执行动作键对应的动作并等待界面稳定，返回动作后的前台窗口；控件无法定位或操作失败时返回 None"""
+        state_num, control_identifier, action, content = action_key
+        planned = self.plans.get(state_num, {}).get(control_identifier)
+        if planned is None:
+            return None
+        try:
+            ctrl = resolve_control(current_wrapper, planned["index_path"], planned["tag"])
+            logger.info(f"{action} {control_identifier} in state {state_num}")
+            self.window_registry.begin_action(action_key)
+            if action == "input":
+                ctrl.type_keys('^A{BACKSPACE}' + content, with_spaces=True)
+            else:
+                click_control(ctrl, planned)
+        except Exception as e:
+            logger.debug(f"Fail to {action} {control_identifier}: {e}")
+            return None
+        self.wait_for_settle(current_wrapper)
+        new_handles, _ = self.window_registry.end_action()
+        return self.get_state_wrapper(current_wrapper, get_latest_window_handle(new_handles))
+
+    def resolve_state(self, wrapper: UIAWrapper):
+        """
+        实时界面对应的已有状态：先按结构指纹查找，未命中且启用近似重复检测时导出一次结构，
+        在已有状态中查找近似重复的状态 (找到后其指纹记为别名，下次直接命中)；都没有时返回 None
+        """
+        fingerprint = live_state_fingerprint(wrapper, policy=self.capture_policy)
+        state_num = self.coordinator.match_state(fingerprint)
+        if state_num is not None or self.coordinator.similarity is None:
+            return state_num
+        captured_xml = export_gui_xml_structure(wrapper, output_dir=self.coordinator.capture_dir(self.worker_name),
+                                                policy=self.capture_policy)
+        state = ET.parse(captured_xml)
+        os.remove(captured_xml)
+        return self.coordinator.match_state(state_fingerprint(state), state)
+
+    def locate_current_state(self) -> tuple:
+        """根据实时界面的结构指纹确定当前状态，优先检查目标进程新打开的窗口，返回 (状态编号或None, 前台窗口)"""
+        main_handle = self.main_wrapper.element_info.handle
+        candidates = [self.get_state_wrapper(self.main_wrapper, handle)
+                      for handle in self.window_registry.list_windows() if handle != main_handle]
+        for wrapper in candidates + [self.main_wrapper]:
+            try:
+                state_num = self.resolve_state(wrapper)
+            except Exception:
+                continue
+            if state_num is not None:
+                return state_num, wrapper
+        return None, self.main_wrapper
+
+    def reset_to_initial(self, target_state: int) -> tuple:
+        """
+        先关闭目标进程新打开的窗口，若仍无法沿已知跳转到达 target_state 且提供了 reset_app，再重启应用；
+        返回重新定位后的 (状态, 前台窗口)
+        """
+        main_handle = self.main_wrapper.element_info.handle
+        for handle in self.window_registry.list_windows():
+            if handle != main_handle:
+                self.stats["window_closes"] += 1
+                try:
+                    self.get_state_wrapper(self.main_wrapper, handle).close()
+                except Exception as e:
+                    logger.debug(f"关闭窗口失败: {e}")
+        self.window_registry.refresh()
+        state_num, wrapper = self.locate_current_state()
+        with self.lock:
+            reachable = state_num is not None and target_state in self.scheduler.shortest_paths(state_num)
+        if self.reset_app is None or reachable:
+            return state_num, wrapper
+        self.stats["resets"] += 1
+        self.reset_app()
+        self.wait_for_settle(self.main_wrapper)
+        self.window_registry.refresh()
+        return self.locate_current_state()
+
+    def navigate(self, path: list, current_wrapper: UIAWrapper) -> tuple:
+        """沿已知跳转路径回放动作到达目标状态，到达后校验结构指纹，返回 (实际所在状态或None, 前台窗口)"""
+        for action_key in path:
+            new_wrapper = self.perform_action(action_key, current_wrapper)
+            self.stats["navigation_steps"] += 1
+            if new_wrapper is None:
+                break
+            current_wrapper = new_wrapper
+        state_num = self.resolve_state(current_wrapper)
+        target_state = self.scheduler.edges[path[-1][0]][path[-1]]
+        if state_num != target_state:
+            self.stats["navigation_failures"] += 1
+            logger.debug(f"Navigation to state {target_state} arrived at {state_num}")
+        return state_num, current_wrapper
+
+    def _frontier_explore(self, max_actions: int = None):
+        """
+        前沿调度探索：每次选择导航代价最小、最新颖的 (状态, 未执行动作)，
+        沿UTG中最短的已知路径回放到该状态并校验指纹后执行，只有无法到达时才重启应用；
+        并行探索时动作由本 worker 认领，前沿暂时为空但其他 worker 仍在执行动作时等待其结果
+        """
+        for state_num in sorted(self.visited_states):
+            self.plan_state(state_num)
+        current_state, current_wrapper = self.locate_current_state()
+        while max_actions is None or self.stats["actions"] < max_actions:
+            with self.lock:
+                choice = self.scheduler.next_action(current_state, worker=self.worker_name)
+                if choice is None:
+                    if not self.scheduler.claimed:
+                        break
+                    self.lock.wait(WAIT_INTERVAL)
+                    continue
+            action_key, path, reset = choice
+            source_state = action_key[0]
+            if reset:
+                current_state, current_wrapper = self.reset_to_initial(source_state)
+                with self.lock:
+                    paths = self.scheduler.shortest_paths(current_state) if current_state is not None else {}
+                    if source_state not in paths:
+                        self.scheduler.drop_state(source_state)
+                        continue
+                path = paths[source_state]
+            if path:
+                current_state, current_wrapper = self.navigate(path, current_wrapper)
+                if current_state != source_state:
+                    with self.lock:
+                        self.scheduler.release(action_key)
+                    continue  # 未能到达，按实际所在状态重新选择
+
+            new_wrapper = self.perform_action(action_key, current_wrapper)
+            self.stats["actions"] += 1
+            if new_wrapper is None:  # 控件已不存在，视为无效动作
+                with self.lock:
+                    self.journal.record_action(action_key, source_state)
+                    self.scheduler.record(action_key, source_state)
+                    self.record_outcome(action_key, None)
+                continue
+            with self.lock:
+                previous = self.visited_states.get(source_state) if new_wrapper is current_wrapper else None
+            target_state_num, _ = self.capture_state(new_wrapper, previous)
+            with self.lock:
+                self.journal.record_action(action_key, target_state_num)
+                self.scheduler.record(action_key, target_state_num)
+                if target_state_num != source_state:
+                    self.log_interaction(source_state, target_state_num, action_key[1], action_key[2], action_key[3])
+                self.plan_state(target_state_num)
+                self.record_outcome(action_key, target_state_num)
+            current_state, current_wrapper = target_state_num, new_wrapper
 
     def _dfs_explore(self, current_state_num: int, current_wrapper: UIAWrapper, current_xml_tree: ET.ElementTree, depth:int = 0):
         """从状态current_state_num开始深度优先搜索"""
@@ -243,55 +426,51 @@ class Explorer:
         self.stack_path.append(current_state_num)
         logger.info(f"DFS进入状态 {current_state_num}，当前路径栈: {self.stack_path}，当前深度: {depth}")
 
-        # 获取当前界面中等待探索的可交互控件
-        target_interactive_controls = collect_interactive_controls(current_wrapper)
-
-        dynamic_groups_handled = set()
-        for ctrl in target_interactive_controls:
-            ctrl_type = ctrl.friendly_class_name()
-            is_dynamic = classifier.is_dynamic_control(ctrl)
-
-            if is_dynamic:
-                siblings = []
-                try:
-                    parent_ctrl = ctrl.parent()
-                except Exception:
-                    parent_ctrl = None
-                if parent_ctrl:
-                    siblings = [sib for sib in parent_ctrl.children() if classifier.is_similar_structure(sib, ctrl)]
-
-                if parent_ctrl:
-                    parent_id = parent_ctrl.element_info.handle or parent_ctrl.element_info.automation_id or \
-                            id(parent_ctrl)
-                    group_key = (current_state_num, parent_id, ctrl_type)
-                else:
-                    group_key = (current_state_num, None, ctrl_type)
-                # 若是动态控件且该组已处理，或超过第3个则跳过
-                if group_key in dynamic_groups_handled or siblings.index(ctrl) >= 3:
-                    continue
-                dynamic_groups_handled.add(group_key)
+        # 由状态快照规划待执行的动作，实时界面只用于定位并操作控件
+        planned_actions = plan_actions(current_xml_tree, current_state_num)
+        action_keys = [key for planned in planned_actions for key in get_action_keys(current_state_num, planned)]
+        self.journal.record_plan(current_state_num, action_keys)
+        self.register_outcomes(current_state_num, current_xml_tree, action_keys)
+        children_cache = {}
+        for planned in sorted(planned_actions, key=lambda item: item["hidden"]):  # 无法点击到的控件放在最后
+            ctrl_type = planned["tag"]
+            control_identifier = planned["xpath"]
+            if all(self.journal.is_done(key) for key in get_action_keys(current_state_num, planned)):
+                continue  # 恢复模式下跳过已完成的动作
+            try:
+                ctrl = resolve_control(current_wrapper, planned["index_path"], ctrl_type, children_cache)
+            except Exception as e:
+                logger.debug(f"Fail to locate {control_identifier}: {e}")
+                continue
 
             if ctrl_type == 'Edit':
                 for text in TEST_INPUTS:
                     action = "input"
                     content = text
+                    action_key = (current_state_num, control_identifier, action, content)
+                    if self.journal.is_done(action_key) or action_key in self.journal.predicted:
+                        continue  # 已完成，或已有输入的结果相同，其余输入按预测记录
                     try:
-                        logger.info(f"Interact with Edit control {ctrl}")
-                        before_handles = [w.element_info.handle for w in Desktop(backend="uia").windows()]
+                        logger.info(f"Interact with Edit control {control_identifier}")
+                        self.window_registry.begin_action(action_key)
                         ctrl.type_keys('^A{BACKSPACE}' + text, with_spaces=True)
                     except Exception as e:
                         logger.debug(f"Fail to type {text} in {ctrl.element_info.handle}: {e}")
                         continue
-                    time.sleep(0.5)
+                    self.wait_for_settle(current_wrapper)
                     prev_state_count = len(self.visited_states)
-                    new_win_handle = get_latest_window_handle(before_handles)
-                    target_state_num, target_state_wrapper, gui_xml_tree = self.try_new_state(current_wrapper, new_win_handle)
+                    new_handles, _ = self.window_registry.end_action()
+                    new_win_handle = get_latest_window_handle(new_handles)
+                    target_state_num, target_state_wrapper, gui_xml_tree = self.try_new_state(current_wrapper, new_win_handle,
+                                                                                              current_xml_tree)
+                    self.journal.record_action(action_key, target_state_num)
+                    self.record_outcome(action_key, target_state_num)
 
                     if target_state_num != current_state_num:
-                        self.log_interaction(current_state_num, target_state_num, get_control_id(ctrl, current_xml_tree),
+                        self.log_interaction(current_state_num, target_state_num, control_identifier,
                                             action, content)
 
-                    if len(self.transitions) > prev_state_count: # 如果产生了新状态
+                    if len(self.visited_states) > prev_state_count: # 如果产生了新状态
                         self._dfs_explore(target_state_num, target_state_wrapper, gui_xml_tree, depth + 1)
 
                     if target_state_wrapper.element_info.handle != current_wrapper.element_info.handle:
@@ -303,23 +482,30 @@ class Explorer:
                 ctrl.type_keys("^A{BACKSPACE}")
             else:
                 action = "click"
+                action_key = (current_state_num, control_identifier, action, 'null')
+                if action_key in self.journal.predicted:
+                    continue
                 try:
-                    logger.info(f"Interact with Button control {ctrl}")
-                    before_handles = [w.element_info.handle for w in Desktop(backend="uia").windows()]
-                    ctrl.click_input()
+                    logger.info(f"Interact with Button control {control_identifier}")
+                    self.window_registry.begin_action(action_key)
+                    click_control(ctrl, planned)
                 except Exception as e:
                     logger.debug(f"Fail to click in {ctrl.element_info.handle}: {e}")
                     continue
-                time.sleep(0.5)
+                self.wait_for_settle(current_wrapper)
                 prev_state_count = len(self.visited_states)
-                new_win_handle = get_latest_window_handle(before_handles)
-                target_state_num, target_state_wrapper, gui_xml_tree = self.try_new_state(current_wrapper, new_win_handle)
+                new_handles, _ = self.window_registry.end_action()
+                new_win_handle = get_latest_window_handle(new_handles)
+                target_state_num, target_state_wrapper, gui_xml_tree = self.try_new_state(current_wrapper, new_win_handle,
+                                                                                          current_xml_tree)
+                self.journal.record_action(action_key, target_state_num)
+                self.record_outcome(action_key, target_state_num)
 
                 if target_state_num != current_state_num:
-                    self.log_interaction(current_state_num, target_state_num, get_control_id(ctrl, current_xml_tree),
+                    self.log_interaction(current_state_num, target_state_num, control_identifier,
                                         action, 'null')
 
-                if len(self.transitions) > prev_state_count: # 如果产生了新状态
+                if len(self.visited_states) > prev_state_count: # 如果产生了新状态
                     self._dfs_explore(target_state_num, target_state_wrapper, gui_xml_tree, depth + 1)
 
                 if target_state_wrapper.element_info.handle != current_wrapper.element_info.handle:
@@ -330,6 +516,7 @@ class Explorer:
 
             current_wrapper.restore()
 
+        self.journal.record_state_done(current_state_num)
         self.stack_path.pop()
         logger.info(f"回退到状态 {self.stack_path[-1] if self.stack_path else 'None'}，当前路径栈: {self.stack_path}")
 
@@ -1,8 +1,17 @@
+import argparse
+import hashlib
+import json
+import logging
 import os
+import threading
+import time
 import yaml
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from difflib import SequenceMatcher
 from openai import OpenAI
 
+logger = logging.getLogger()
+
 
 class UIScriptGenerator:
     """
@@ -19,8 +28,11 @@ class UIScriptGenerator:
         with open(utg_path, 'r', encoding='utf-8') as f:
             self.utg = yaml.safe_load(f)
         # 提取控件列表，结构化存储: 名称, XPath, 动态标志, 列表名
+        # doc_generator 生成的 App Doc 按页面分组 (pages[].controls)
         self.controls = []
-        if isinstance(self.appdoc, dict) and 'controls' in self.appdoc:
+        if isinstance(self.appdoc, dict) and isinstance(self.appdoc.get('pages'), list):
+            control_list = [ctrl for page in self.appdoc['pages'] for ctrl in page.get('controls') or []]
+        elif isinstance(self.appdoc, dict) and 'controls' in self.appdoc:
             control_list = self.appdoc['controls']
         elif isinstance(self.appdoc, list):
             control_list = self.appdoc
@@ -35,7 +47,7 @@ class UIScriptGenerator:
                 'xpath': xpath,
                 'description': desc,
             }
-            if ctrl.get('dynamic', '').lower() == 'true':
+            if str(ctrl.get('dynamic', '')).lower() == 'true':
                 ctrl_dict['dynamic'] = True
 
             self.controls.append(ctrl_dict)
@@ -68,17 +80,36 @@ class UIScriptGenerator:
         """
         根据任务描述生成 UI 操作步骤脚本。
         """
+        script, _ = self._request_script(task_description)
+        return script
+
+    def generate_plan(self, task_description: str) -> list:
+        """
+        生成脚本并编译为可执行的动作计划 (见 utils.plan_runner.compile_script)，由 PlanRunner 执行
+        """
+        from utils.plan_runner import compile_script
+
+        return compile_script(self.generate_script(task_description), self.controls)
+
+    def _request_script(self, task_description: str, agent: OpenAI = None) -> tuple:
+        """
+        调用 LLM 生成脚本，返回 (script, usage)，usage 为本次请求的 token 用量。
+        """
         # 查找相关控件
         relevant_ctrls = self.find_relevant_controls(task_description)
         controls_info = ""
         for ctrl in relevant_ctrls:
-            controls_info += f"- 名称: {ctrl['name']}, 描述：{ctrl['description']}, is_dynamic: {ctrl['dynamic'] if ctrl['dynamic'] else 'false'}, XPath: {ctrl['xpath']}\n"
+            controls_info += f"- 名称: {ctrl['name']}, 描述：{ctrl['description']}, is_dynamic: {'true' if ctrl.get('dynamic') else 'false'}, XPath: {ctrl['xpath']}\n"
 
-        # 整理 UTG 状态转换信息为文本
+        # 整理 UTG 状态转换信息为文本 (跳转边上的界面差异摘要不放入提示)
+        utg = self.utg
+        if isinstance(utg, dict) and isinstance(utg.get('transitions'), list):
+            utg = dict(utg, transitions=[{key: value for key, value in t.items() if key != 'Diff'}
+                                         if isinstance(t, dict) else t for t in utg['transitions']])
         try:
-            transitions_info = yaml.dump(self.utg, allow_unicode=True)
+            transitions_info = yaml.dump(utg, allow_unicode=True)
         except Exception:
-            transitions_info = str(self.utg)
+            transitions_info = str(utg)
 
         # 构建 GPT-4 提示
         prompt = f"""应用控件定义 (来源 appdoc.yaml):
@@ -93,12 +124,19 @@ class UIScriptGenerator:
 - 对于动态控件，使用 `<列表名>.match('关键词')` 的方式引用。
 - 如果有多条路径可达任务目标，请提供多条路径（标明路径1、路径2 等）并推荐优先路径。
 - 输出格式可使用 Markdown 或纯文本，重点在可读性和结构化。
+- 最后用一个 ```yaml 代码块给出推荐路径的可执行计划，格式为:
+  steps:
+  - action: click | input | select | assert_state
+    control: 控件名称 (与上面的名称一致) 或 XPath
+    text: 输入的文本 (仅 input)
+    match: 列表条目标题的正则 (仅 select，用于动态控件，control 为该动态控件的名称)
 """
         messages = [
             {"role": "system", "content": "你是一个熟练的 UI 自动化脚本生成助手。"},
             {"role": "user", "content": prompt}
         ]
-        agent = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        if agent is None:
+            agent = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
         try:
             response = agent.chat.completions.create(
                 model="gpt-4.1",
@@ -108,10 +146,174 @@ class UIScriptGenerator:
             script = response.choices[0].message.content.strip()
         except Exception as e:
             raise RuntimeError(f"调用 OpenAI 接口失败: {e}")
-        return script
+        usage = {}
+        if getattr(response, 'usage', None) is not None:
+            usage = {
+                'prompt_tokens': response.usage.prompt_tokens,
+                'completion_tokens': response.usage.completion_tokens,
+                'total_tokens': response.usage.total_tokens,
+            }
+        return script, usage
+
+    def generate_batch(self, task_file: str, output_path: str, max_workers: int = 4) -> dict:
+        """
+        离线批量生成脚本:
+        读取任务文件 (每行一个任务的 .txt，或每行含 "task" 字段的 .jsonl)，对相同任务去重后并发生成，
+        每个任务写出一条 JSONL 记录 (含耗时与 token 用量)。
+        output_path 中已成功的任务会被跳过，因此中断后重新执行同一命令即可续跑；
+        失败的任务会重新生成，其旧的失败记录先从 output_path 中删除，每个任务最终只保留一条记录。
+        返回统计信息 {total, unique, skipped, succeeded, failed}。
+        """
+        tasks = load_batch_tasks(task_file)
+        unique_tasks = {}  # task_id -> {"task": ..., "lines": [...]}
+        for line_no, task in tasks:
+            task_id = get_task_id(task)
+            entry = unique_tasks.setdefault(task_id, {"task": task, "lines": []})
+            entry["lines"].append(line_no)
+
+        finished = load_finished_task_ids(output_path)
+        pending = {tid: entry for tid, entry in unique_tasks.items() if tid not in finished}
+        compact_batch_output(output_path, set(pending))
+        stats = {
+            "total": len(tasks),
+            "unique": len(unique_tasks),
+            "skipped": len(unique_tasks) - len(pending),
+            "succeeded": 0,
+            "failed": 0,
+        }
+        logger.info(f"Batch generation: {stats['total']} tasks, {stats['unique']} unique, "
+                    f"{stats['skipped']} already finished, {len(pending)} to run with {max_workers} workers")
+        if not pending:
+            return stats
 
-# 示例调用
+        agent = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))  # 客户端线程安全，所有 worker 共用
+        write_lock = threading.Lock()
+
+        def run_task(task_id: str, entry: dict) -> dict:
+            start = time.perf_counter()
+            record = {"task_id": task_id, "task": entry["task"], "lines": entry["lines"]}
+            try:
+                script, usage = self._request_script(entry["task"], agent=agent)
+                record.update({"status": "ok", "script": script, "usage": usage})
+            except Exception as e:
+                record.update({"status": "error", "error": str(e), "usage": {}})
+            record["elapsed"] = round(time.perf_counter() - start, 3)
+            return record
+
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+        with open(output_path, 'a', encoding='utf-8') as out, \
+                ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(run_task, tid, entry) for tid, entry in pending.items()]
+            for future in as_completed(futures):
+                record = future.result()
+                with write_lock:
+                    out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    out.flush()
+                    os.fsync(out.fileno())  # 每条记录落盘，保证中断后可续跑
+                if record["status"] == "ok":
+                    stats["succeeded"] += 1
+                else:
+                    stats["failed"] += 1
+                    logger.error(f"Task {record['task_id']} failed: {record['error']}")
+        logger.info(f"Batch generation finished: {stats}")
+        return stats
+
+
+def normalize_task(task: str) -> str:
+    """规范化任务描述 (合并空白)，用于去重"""
+    return " ".join(task.split())
+
+def get_task_id(task: str) -> str:
+    """根据规范化后的任务描述生成稳定的任务ID"""
+    return hashlib.sha1(normalize_task(task).encode('utf-8')).hexdigest()[:16]
+
+def load_batch_tasks(task_file: str) -> list:
+    """
+    读取批量任务文件，返回 [(行号, 任务描述), ...]，忽略空行和以 # 开头的注释行；
+    .jsonl 中无法解析或不是对象的行记录警告后跳过，不影响其余任务。
+    """
+    tasks = []
+    with open(task_file, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if task_file.endswith('.jsonl'):
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"Skip malformed task at {task_file}:{line_no}")
+                    continue
+                if not isinstance(record, dict):
+                    logger.warning(f"Skip task at {task_file}:{line_no}: expected a JSON object")
+                    continue
+                task = str(record.get('task') or '')
+            else:
+                task = line
+            task = normalize_task(task)
+            if task:
+                tasks.append((line_no, task))
+    return tasks
+
+def load_finished_task_ids(output_path: str) -> set:
+    """读取已有的 JSONL 输出，返回已成功生成的任务ID集合 (中断时写了一半的行会被忽略)"""
+    finished = set()
+    if not os.path.exists(output_path):
+        return finished
+    with open(output_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get('status') == 'ok':
+                finished.add(record.get('task_id'))
+    return finished
+
+def compact_batch_output(output_path: str, retry_ids: set):
+    """
+    重写 JSONL 输出，删除将要重新生成的任务的旧记录、重复的成功记录以及中断时写了一半的行；
+    没有需要删除的记录时不改动文件
+    """
+    if not os.path.exists(output_path):
+        return
+    kept, seen, dropped = [], set(), 0
+    with open(output_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                dropped += 1
+                continue
+            task_id = record.get('task_id')
+            if task_id in retry_ids or task_id in seen:
+                dropped += 1
+                continue
+            if record.get('status') == 'ok':
+                seen.add(task_id)
+            kept.append(line if line.endswith("\n") else line + "\n")
+    if not dropped:
+        return
+    tmp_path = output_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.writelines(kept)
+    os.replace(tmp_path, output_path)
+    logger.info(f"Removed {dropped} stale records from {output_path}")
+
+# 示例调用: python -m utils.gen_script (默认路径相对于仓库根目录，与当前工作目录无关)
 if __name__ == "__main__":
-    generator = UIScriptGenerator("../doc/appdoc.yaml", "../doc/utg/UTG.yaml")
-    task = "发送消息给文件传输助手"
-    print(generator.generate_script(task))
+    doc_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "doc")
+    parser = argparse.ArgumentParser(description="UI 自动化脚本生成")
+    parser.add_argument("--appdoc", default=os.path.join(doc_dir, "appdoc.yaml"))
+    parser.add_argument("--utg", default=os.path.join(doc_dir, "utg", "UTG.yaml"))
+    parser.add_argument("--tasks", help="批量任务文件 (.txt 或 .jsonl)，不指定时生成单个示例任务")
+    parser.add_argument("--output", default="batch_scripts.jsonl", help="批量模式的 JSONL 输出文件")
+    parser.add_argument("--workers", type=int, default=4, help="批量模式的最大并发数")
+    args = parser.parse_args()
+
+    generator = UIScriptGenerator(args.appdoc, args.utg)
+    if args.tasks:
+        generator.generate_batch(args.tasks, args.output, max_workers=args.workers)
+    else:
+        task = "发送消息给文件传输助手"
+        print(generator.generate_script(task))
@@ -0,0 +1,341 @@
+import logging
+import random
+import re
+import time
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+from utils.capture_policy import OMITTED_TAG
+
+logger = logging.getLogger()
+
+RECT_PATTERN = re.compile(r'\(L(-?\d+), T(-?\d+), R(-?\d+), B(-?\d+)\)')
+CELL_SIZE = 64          # 均匀网格的格子边长 (像素)
+MAX_CELLS = 256         # 覆盖格子数超过该值的大控件 (窗口、面板) 不入网格，查询时逐个比较
+SCAN_CELLS = 4096       # 区域查询覆盖的格子数超过该值时直接扫描全部控件
+WINDOW_TAGS = ["Dialog", "Window", "Menu"]   # 嵌套的窗口 (弹出框、菜单) 绘制在所属窗口的内容之上
+EMPTY_RECT = (0, 0, 0, 0)
+
+
+def parse_rect(text: str) -> tuple:
+    """"(L245, T61, R1675, B1018)" -> (left, top, right, bottom)，无法解析时返回空矩形"""
+    match = RECT_PATTERN.match(text or "")
+    return tuple(map(int, match.groups())) if match else EMPTY_RECT
+
+def rect_contains(rects: np.ndarray, x: int, y: int) -> np.ndarray:
+    """点在矩形内 (左、上边界包含，右、下边界不包含)"""
+    return (rects[:, 0] <= x) & (x < rects[:, 2]) & (rects[:, 1] <= y) & (y < rects[:, 3])
+
+def rect_intersects(rects: np.ndarray, region: tuple) -> np.ndarray:
+    left, top, right, bottom = region
+    return (rects[:, 0] < right) & (left < rects[:, 2]) & (rects[:, 1] < bottom) & (top < rects[:, 3])
+
+def rect_inside(rects: np.ndarray, region: tuple) -> np.ndarray:
+    left, top, right, bottom = region
+    return (left <= rects[:, 0]) & (rects[:, 2] <= right) & (top <= rects[:, 1]) & (rects[:, 3] <= bottom)
+
+
+class StateGeometry:
+    """
+    状态快照的控件几何索引：矩形只解析一次，存为数组 (按先序遍历编号)，
+    - rects 为控件自身的矩形，clips 为依次与各祖先矩形求交后的可见部分 (被滚动容器或窗口裁掉的部分不可见)
+    - 可见部分按 CELL_SIZE 的均匀网格分桶 (CSR 结构：格子编号有序，每个格子对应一段控件编号)，
+      覆盖格子过多的大控件单独保存，点查询与区域查询只比较相关格子中的控件
+    - 层叠顺序：窗口层级 (layers) 高的在上，同层中编号大的在上
+    - 遮挡：某点最上层的实体控件不属于控件自身的子树时，该点被遮挡；透明控件 (solid 为 False，如布局容器) 不遮挡其他控件
+    可由状态XML (from_xml) 或任意矩形与父节点数组构建；占位元素没有几何信息，不参与索引
+    """
+    def __init__(self, rects, parents, elements: list = None, layers=None, solid=None,
+                 cell_size: int = CELL_SIZE, max_cells: int = MAX_CELLS):
+        self.rects = np.asarray(rects, dtype=np.int64).reshape(-1, 4)
+        self.parents = np.asarray(parents, dtype=np.int64)
+        self.elements = elements              # 编号 -> XML元素 (由 from_xml 构建时)
+        self.cell_size = cell_size
+        self.max_cells = max_cells
+        n = len(self.rects)
+        layers = np.zeros(n, dtype=np.int64) if layers is None else np.asarray(layers, dtype=np.int64)
+        self.z = layers * n + np.arange(n)    # 层叠顺序，越大越靠上
+        self.solid = np.ones(n, dtype=bool) if solid is None else np.asarray(solid, dtype=bool)
+        self.levels = self._levels()
+        self.subtree_end = self._subtree_ends()   # 子树为编号区间 [i, subtree_end[i])
+        self.clips = self._clip_rects()
+        visible = (self.clips[:, 2] > self.clips[:, 0]) & (self.clips[:, 3] > self.clips[:, 1])
+        self.visible = visible
+        self._build_grid(np.flatnonzero(visible))
+        logger.debug(f"Geometry index: {n} controls, {len(self.large)} large, {len(self.cell_keys)} cells")
+
+    @classmethod
+    def from_xml(cls, root: ET.Element, transparent=(), **kwargs) -> "StateGeometry":
+        """
+        由状态XML构建：根元素编号为 0，按先序遍历编号；
+        transparent 为不遮挡其他控件的控件类型，窗口层级为祖先 (含自身) 中 WINDOW_TAGS 类型控件的个数
+        """
+        elements, parents, rects, layers = [], [], [], []
+        stack = [(root, -1, 0)]
+        while stack:
+            elem, parent, layer = stack.pop()
+            index = len(elements)
+            layer += elem.tag in WINDOW_TAGS
+            elements.append(elem)
+            parents.append(parent)
+            layers.append(layer)
+            rects.append(parse_rect(elem.attrib.get("rect")) if elem.tag != OMITTED_TAG else EMPTY_RECT)
+            stack.extend((child, index, layer) for child in reversed(elem))
+        solid = [elem.tag not in transparent for elem in elements]
+        return cls(rects, parents, elements, layers, solid, **kwargs)
+
+    def _levels(self) -> list:
+        """按深度分层的控件编号 (子节点编号大于父节点，按编号顺序即可逐个确定深度)"""
+        depths = np.zeros(len(self.parents), dtype=np.int64)
+        parents = self.parents.tolist()
+        for index in range(1, len(parents)):
+            depths[index] = depths[parents[index]] + 1 if parents[index] >= 0 else 0
+        order = np.argsort(depths, kind="stable")
+        bounds = np.searchsorted(depths[order], np.arange(depths.max() + 2 if len(depths) else 1))
+        return [order[bounds[d]:bounds[d + 1]] for d in range(len(bounds) - 1)]
+
+    def _subtree_ends(self) -> np.ndarray:
+        ends = np.arange(1, len(self.parents) + 1, dtype=np.int64)
+        for level in reversed(self.levels[1:]):   # 自底向上，每层一次向量化更新
+            np.maximum.at(ends, self.parents[level], ends[level])
+        return ends
+
+    def _clip_rects(self) -> np.ndarray:
+        clips = self.rects.copy()
+        for level in self.levels[1:]:   # 自顶向下，父节点的可见部分已确定
+            level = level[self.parents[level] >= 0]
+            bounds = clips[self.parents[level]]
+            clips[level, :2] = np.maximum(clips[level, :2], bounds[:, :2])
+            clips[level, 2:] = np.minimum(clips[level, 2:], bounds[:, 2:])
+        return clips
+
+    def _cell_ranges(self, rects: np.ndarray) -> tuple:
+        """矩形覆盖的格子坐标区间 (含两端)"""
+        size = self.cell_size
+        return (np.floor_divide(rects[:, 0], size), np.floor_divide(rects[:, 1], size),
+                np.floor_divide(rects[:, 2] - 1, size), np.floor_divide(rects[:, 3] - 1, size))
+
+    def _cell_key(self, cx, cy):
+        return (cy - self.origin[1]) * self.columns + (cx - self.origin[0])
+
+    def _build_grid(self, indexes: np.ndarray):
+        cx0, cy0, cx1, cy1 = self._cell_ranges(self.clips[indexes])
+        widths, heights = cx1 - cx0 + 1, cy1 - cy0 + 1
+        counts = widths * heights
+        small = counts <= self.max_cells
+        self.large = indexes[~small]
+        indexes, cx0, cy0, widths, counts = indexes[small], cx0[small], cy0[small], widths[small], counts[small]
+        self.origin = (int(cx0.min()) if len(indexes) else 0, int(cy0.min()) if len(indexes) else 0)
+        self.columns = int((cx1[small] - self.origin[0]).max()) + 1 if len(indexes) else 1
+        # 展开每个控件覆盖的格子：第 i 个控件占 counts[i] 项，项内偏移换算为格子坐标
+        owners = np.repeat(np.arange(len(indexes)), counts)
+        offsets = np.arange(len(owners)) - np.repeat(np.cumsum(counts) - counts, counts)
+        keys = self._cell_key(cx0[owners] + offsets % widths[owners], cy0[owners] + offsets // widths[owners])
+        order = np.argsort(keys, kind="stable")
+        keys, members = keys[order], indexes[owners[order]]
+        self.cell_keys, starts = np.unique(keys, return_index=True)
+        self.cell_starts = np.append(starts, len(keys))
+        self.cell_members = members
+
+    def _cell_candidates(self, cx: int, cy: int) -> np.ndarray:
+        if not (0 <= cx - self.origin[0] < self.columns):
+            return self.cell_members[:0]
+        position = np.searchsorted(self.cell_keys, self._cell_key(cx, cy))
+        if position == len(self.cell_keys) or self.cell_keys[position] != self._cell_key(cx, cy):
+            return self.cell_members[:0]
+        return self.cell_members[self.cell_starts[position]:self.cell_starts[position + 1]]
+
+    def elements_at(self, x: int, y: int) -> list:
+        """可见部分包含点 (x, y) 的控件编号，最上层的在前"""
+        size = self.cell_size
+        candidates = np.concatenate([self._cell_candidates(x // size, y // size), self.large])
+        hits = candidates[rect_contains(self.clips[candidates], x, y)]
+        return hits[np.argsort(-self.z[hits], kind="stable")].tolist()
+
+    def hit_test(self, x: int, y: int):
+        """点 (x, y) 处最上层的控件编号，没有时返回 None"""
+        hits = self.elements_at(x, y)
+        return hits[0] if hits else None
+
+    def query_region(self, region: tuple, inside: bool = False) -> list:
+        """
+        可见部分与区域 (left, top, right, bottom) 相交的控件编号 (inside=True 时须完全位于区域内)，按编号排序；
+        例如以列表的矩形为视口，得到当前可见的列表项
+        """
+        if region[2] <= region[0] or region[3] <= region[1]:
+            return []
+        cx0, cy0, cx1, cy1 = (int(value) for value in
+                              np.concatenate(self._cell_ranges(np.array([region], dtype=np.int64))))
+        cx0, cx1 = max(cx0, self.origin[0]), min(cx1, self.origin[0] + self.columns - 1)
+        cy0 = max(cy0, self.origin[1])
+        if cx1 < cx0 or (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > SCAN_CELLS:
+            candidates = np.flatnonzero(self.visible)
+        else:
+            low = self._cell_key(np.arange(cx0, cx1 + 1), np.arange(cy0, cy1 + 1)[:, None]).ravel()
+            positions = np.searchsorted(self.cell_keys, low)
+            positions = positions[(positions < len(self.cell_keys))]
+            positions = positions[np.isin(self.cell_keys[positions], low)]
+            parts = [self.cell_members[self.cell_starts[p]:self.cell_starts[p + 1]] for p in positions]
+            marked = np.zeros(len(self.rects), dtype=bool)   # 控件跨越多个格子，标记去重后按编号取出
+            marked[np.concatenate(parts + [self.large])] = True
+            candidates = np.flatnonzero(marked)
+        clips = self.clips[candidates]
+        mask = rect_inside(clips, region) if inside else rect_intersects(clips, region)
+        return candidates[mask].tolist()
+
+    def click_point(self, index: int) -> tuple:
+        """click_input 默认点击的位置：控件矩形的中心"""
+        left, top, right, bottom = self.rects[index]
+        return int(left + right) // 2, int(top + bottom) // 2
+
+    def is_descendant(self, index: int, ancestor: int) -> bool:
+        return ancestor <= index < self.subtree_end[ancestor]
+
+    def occluder(self, index: int, point: tuple = None):
+        """
+        点击控件的 point (默认矩形中心) 时命中的其他实体控件编号：该点不在控件可见部分内时返回 -1，
+        最上层的实体控件属于控件自身的子树 (或该点只有透明控件) 时返回 None
+        """
+        x, y = point or self.click_point(index)
+        left, top, right, bottom = self.clips[index]
+        if not (left <= x < right and top <= y < bottom):
+            return -1
+        for hit in self.elements_at(x, y):
+            if self.is_descendant(hit, index):
+                return None
+            if self.solid[hit]:
+                return hit
+        return None
+
+    def visible_point(self, index: int, steps: int = 3):
+        """
+        点击控件时能命中控件自身的位置：优先矩形中心，否则在可见部分中按 steps x steps 的网格依次尝试各格中心，
+        都被遮挡 (或控件完全不可见) 时返回 None
+        """
+        if self.occluder(index) is None:
+            return self.click_point(index)
+        left, top, right, bottom = (int(value) for value in self.clips[index])
+        if right <= left or bottom <= top:
+            return None
+        for row in range(steps):
+            for column in range(steps):
+                point = (left + (2 * column + 1) * (right - left) // (2 * steps),
+                         top + (2 * row + 1) * (bottom - top) // (2 * steps))
+                if self.occluder(index, point) is None:
+                    return point
+        return None
+
+
+############################### 性能测试 ###############################
+
+def synthetic_geometry(n: int = 100000, seed: int = 0, width: int = 1920, height: int = 1080) -> tuple:
+    """
+    生成 n 个控件的合成界面：窗口下嵌套的面板逐层细分父矩形，叶子为按钮或列表项，
+    部分列表向下延伸超出窗口 (被裁剪)，少量弹出层覆盖在其他控件之上；返回 (矩形, 父节点)，按先序遍历编号
+    """
+    rng = random.Random(seed)
+    rects, parents = [(0, 0, width, height)], [-1]
+    stack = [0]
+    while len(rects) < n:
+        parent = stack.pop(0) if stack else 0
+        left, top, right, bottom = rects[parent]
+        fanout = rng.randint(2, 8)
+        vertical = rng.random() < 0.5
+        overflow = rng.random() < 0.1   # 虚拟化列表：子项总高度超出容器
+        span = (bottom - top) * (3 if overflow else 1)
+        for i in range(fanout):
+            if len(rects) >= n:
+                break
+            if vertical:
+                step = max(1, span // fanout)
+                rect = (left, top + i * step, right, top + (i + 1) * step)
+            else:
+                step = max(1, (right - left) // fanout)
+                rect = (left + i * step, top, left + (i + 1) * step, bottom)
+            rects.append(rect)
+            parents.append(parent)
+            stack.append(len(rects) - 1)
+    for _ in range(n // 1000):   # 弹出层：根的子节点，绘制在最上层
+        left, top = rng.randrange(width - 200), rng.randrange(height - 200)
+        rects.append((left, top, left + 200, top + 150))
+        parents.append(0)
+    order = preorder(parents)
+    position = {old: new for new, old in enumerate(order)}
+    return [rects[old] for old in order], [position[parents[old]] if parents[old] >= 0 else -1 for old in order]
+
+def preorder(parents: list) -> list:
+    children = {}
+    for index, parent in enumerate(parents):
+        children.setdefault(parent, []).append(index)
+    order, stack = [], [0]
+    while stack:
+        index = stack.pop()
+        order.append(index)
+        stack.extend(reversed(children.get(index, [])))
+    return order
+
+def tree_walk_at(rects: list, parents: list, x: int, y: int) -> list:
+    """不建索引时的做法：遍历整棵树逐个比较矩形 (考虑祖先裁剪)，返回包含该点的控件编号，最上层在前"""
+    children = {}
+    for index, parent in enumerate(parents):
+        children.setdefault(parent, []).append(index)
+    hits, stack = [], [0]
+    while stack:
+        index = stack.pop()
+        left, top, right, bottom = rects[index]
+        if left <= x < right and top <= y < bottom:
+            hits.append(index)
+            stack.extend(children.get(index, []))
+    return sorted(hits, reverse=True)
+
+def benchmark_geometry(n: int = 100000, queries: int = 1000, seed: int = 0) -> dict:
+    """在 n 个控件的合成界面上比较建索引的耗时，以及点查询、视口查询与遍历整棵树的延迟"""
+    rects, parents = synthetic_geometry(n, seed)
+    start = time.perf_counter()
+    geometry = StateGeometry(rects, parents)
+    build_time = time.perf_counter() - start
+    rng = random.Random(seed)
+    points = [(rng.randrange(1920), rng.randrange(1080)) for _ in range(queries)]
+
+    start = time.perf_counter()
+    indexed = [geometry.elements_at(x, y) for x, y in points]
+    point_time = time.perf_counter() - start
+    walk_points = points[:max(1, queries // 20)]
+    start = time.perf_counter()
+    walked = [tree_walk_at(rects, parents, x, y) for x, y in walk_points]
+    walk_time = time.perf_counter() - start
+    assert walked == indexed[:len(walk_points)]
+
+    regions = [(x, y, x + 300, y + 400) for x, y in points]
+    start = time.perf_counter()
+    visible = [geometry.query_region(region) for region in regions]
+    region_time = time.perf_counter() - start
+    start = time.perf_counter()
+    scanned = [np.flatnonzero(geometry.visible & rect_intersects(geometry.clips, region)).tolist()
+               for region in regions[:max(1, queries // 20)]]
+    scan_time = time.perf_counter() - start
+    assert scanned == visible[:len(scanned)]
+
+    start = time.perf_counter()
+    hidden = sum(geometry.visible_point(index) is None for index in range(0, n, max(1, n // queries)))
+    point_search_time = time.perf_counter() - start
+    results = {
+        "controls": n,
+        "visible": int(geometry.visible.sum()),
+        "build_ms": round(1000 * build_time, 1),
+        "point_us": round(1e6 * point_time / queries, 1),
+        "tree_walk_point_us": round(1e6 * walk_time / len(walk_points), 1),
+        "region_us": round(1e6 * region_time / queries, 1),
+        "region_results": round(sum(map(len, visible)) / queries, 1),
+        "full_scan_region_us": round(1e6 * scan_time / len(scanned), 1),
+        "visible_point_us": round(1e6 * point_search_time / len(range(0, n, max(1, n // queries))), 1),
+        "hidden_sampled": hidden,
+    }
+    logger.info(f"Geometry index benchmark: {results}")
+    return results
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(benchmark_geometry())
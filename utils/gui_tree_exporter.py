@@ -1,70 +1,50 @@
+import copy
 import logging
 import os
+import sys
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pywinauto.controls.uiawrapper import UIAWrapper
 import xml.etree.ElementTree as ET
 from datetime import datetime
 import utils.classifier as classifier
 # import classifier
+from utils.capture_policy import FULL_CAPTURE, OMITTED_TAG, CapturePolicy, get_policy
 from utils.connector import get_wrapper_object, weixin_app_path, weixin_title
+from utils.control_snapshot import ControlSnapshot, snapshot_control
 # from connector import get_wrapper_object, weixin_app_path, weixin_title
+from utils.scroller import ListScroller
+
+try:
+    import comtypes  # 采集线程中的 UIA 调用需要先初始化 COM
+except ImportError:
+    comtypes = None
 
 logger = logging.getLogger()
 
+CAPTURE_WORKERS = 4  # 并行采集子树的线程数上限
+
 ############################### 容器滚动器 ###############################
 
 def scroll_back(list_ctrl: UIAWrapper, max_iter=100):
-    """向上滚动容器"""
+    """向上滚动容器，到达顶部后立即停止"""
     logger.debug(f"Start scrolling back in the list control")
-    for _ in range(max_iter):
-        try:
-            # list_ctrl.set_focus()
-            # send_keys('{PGUP}')  # 或 send_keys('{PGUP}')、list_ctrl.scroll等
-            list_ctrl.type_keys('{PGUP}')
-        except Exception:
-            logger.debug("Failed to scroll back in the list control.")
-            break
-        # 等待一小段时间以确保滚动完成
-        # send_keys('{WAIT}')
+    ListScroller(list_ctrl, max_iter).scroll_to_edge("top")
 
 """动态返回类型 List[dict] 或 List[ET.Element]"""
 def extract_all_list_items(list_ctrl: UIAWrapper, depth=0, prefix: str="", max_iter=100):
     """
     自动滚动容器并递归解析所有子项，返回去重后的完整元素列表
+    先跳转到顶部，之后每次翻页只解析新露出的条目，到达底部后停止并滚回顶部
     """
     logger.debug(f"Start extracting list items")
-    seen_items = set()   # 记录已采集的唯一标识（如title、auto_id等）
+    scroller = ListScroller(list_ctrl, max_iter)
+    scroller.scroll_to_edge("top")
     all_items_info = []
-
-    for _ in range(max_iter):
-        # 获取当前可见的所有子项
-        try:
-            children = list_ctrl.children()
-        except Exception:
-            logger.debug("Failed to retrieve children from the list control.")
-            break
-        changed = False
-        for child in children:
-            title = child.window_text()
-            unique_key = (title, str(child.rectangle()))
-            if unique_key not in seen_items:
-                seen_items.add(unique_key)
-                all_items_info.append(
-                    control_info_to_xml(child, depth, prefix + f" -> {child.friendly_class_name()}[{child.window_text()}]")
-                )
-                changed = True
-        # 尝试滚动
-        try:
-            # list_ctrl.set_focus()
-            # send_keys('{PGDN}')
-            list_ctrl.type_keys('{PGDN}')
-        except Exception:
-            logger.debug("Failed to scroll the list control.")
-            break
-        if not changed:  # 若本轮无新增条目，认为已滚至底部
-            logger.debug("No new items found, stopping extraction.")
-            break
-
-    scroll_back(list_ctrl)
+    for child in scroller.iter_new_items():
+        all_items_info.append(
+            control_info_to_xml(child, depth, prefix + f" -> {child.friendly_class_name()}[{child.window_text()}]")
+        )
+    scroller.scroll_to_edge("top")
     return all_items_info
 
 ############################### 将GUI解析为XML结构 ###############################
@@ -88,10 +68,8 @@ def indent_xml(elem, level=0):
         if level and (not elem.tail or not elem.tail.strip()):
             elem.tail = i
 
-def control_info_to_xml(ctrl: UIAWrapper, depth: int = 0, prefix: str = "", llm_trigger: bool = True, max_depth: int = 15) -> ET.Element:
-    if depth > max_depth:
-        return None
-
+def control_attrs(ctrl: ControlSnapshot, depth: int, prefix: str, llm_trigger: bool) -> dict:
+    """控件快照对应的XML属性"""
     attrs = {
         "title": ctrl.window_text(),
         "name": ctrl.element_info.name,
@@ -104,22 +82,171 @@ def control_info_to_xml(ctrl: UIAWrapper, depth: int = 0, prefix: str = "", llm_
     }
     if llm_trigger and ctrl.friendly_class_name() not in classifier.non_interactive_containers:
         attrs["is_dynamic"] = str(classifier.is_dynamic_control(ctrl))
-    elem = ET.Element(ctrl.friendly_class_name(), attrs)
+    return attrs
 
+def capture_children(ctrl: ControlSnapshot, policy: CapturePolicy) -> tuple:
+    """按采集策略挑选需要采集的子控件，返回 (子树使用的策略, 子控件快照或占位元素的列表)"""
     try:
         children = ctrl.children()
     except Exception as e:
         children = []
+    policy = policy.child_policy(ctrl)
+    return policy, policy.select_children(children)
+
+def control_info_to_xml(ctrl: UIAWrapper, depth: int = 0, prefix: str = "", llm_trigger: bool = True, max_depth: int = 15,
+                        policy: CapturePolicy = FULL_CAPTURE) -> ET.Element:
+    """
+    将控件子树解析为XML元素。每个控件的属性在一次批量请求中读取 (ControlSnapshot)，
+    子控件连同其属性也由一次请求取回，之后的属性读取与动态控件判断都不再跨进程；
+    policy 决定哪些子控件被裁剪 (记为占位元素)
+    """
+    if depth > max_depth:
+        return None
+
+    ctrl = snapshot_control(ctrl)
+    elem = ET.Element(ctrl.friendly_class_name(), control_attrs(ctrl, depth, prefix, llm_trigger))
 
+    policy, children = capture_children(ctrl, policy)
     for child in children:
-        child_elem = control_info_to_xml(child, depth + 1, prefix + f" -> {child.friendly_class_name()}[{child.window_text()}]")
+        if isinstance(child, ET.Element):
+            elem.append(child)
+            continue
+        child_elem = control_info_to_xml(child, depth + 1, prefix + f" -> {child.friendly_class_name()}[{child.window_text()}]",
+                                         policy=policy)
         if child_elem is not None:
             elem.append(child_elem)
     return elem
 
-def export_gui_xml_structure(dlg_wrapper: UIAWrapper, output_dir="gui_export", state_num=0) -> str:
+############################### 差量采集 ###############################
+
+SIGNATURE_ATTRS = ("title", "name", "class_name", "auto_id", "handle", "rect")
+
+def snapshot_signature(ctrl: ControlSnapshot) -> tuple:
+    """控件的低成本签名：控件类型与导出的各项属性 (不含路径与动态判断)，均来自批量读取的快照"""
+    attrs = control_attrs(ctrl, 0, "", llm_trigger=False)
+    return (ctrl.friendly_class_name(),) + tuple(attrs[name] for name in SIGNATURE_ATTRS)
+
+def element_signature(elem: ET.Element) -> tuple:
+    """上一快照中XML元素的同一签名"""
+    return (elem.tag,) + tuple(elem.attrib.get(name, "") for name in SIGNATURE_ATTRS)
+
+def is_subtree_unchanged(ctrl: ControlSnapshot, previous: ET.Element, policy: CapturePolicy = FULL_CAPTURE) -> bool:
     """
-    将GUI导出为XML格式
+    逐层比较子树中各节点的签名与子控件数 (按同一采集策略裁剪后)，全部一致时认为子树未变化。
+    上一快照中的叶子节点同样批量读取一次子控件，之前为空、动作后才填充的容器因此不会被当作叶子复用；
+    比较时读取的子控件缓存在快照中，判定为变化后继续采集时不会重复读取
+    """
+    if snapshot_signature(ctrl) != element_signature(previous):
+        return False
+    try:
+        ctrl.children()
+    except Exception:
+        return False
+    policy, children = capture_children(ctrl, policy)
+    if len(children) != len(previous):
+        return False
+    for child, prev in zip(children, previous):
+        if isinstance(child, ET.Element):
+            if prev.tag != OMITTED_TAG or child.attrib != prev.attrib:
+                return False
+        elif not is_subtree_unchanged(child, prev, policy):
+            return False
+    return True
+
+def reuse_subtree(ctrl: ControlSnapshot, previous: ET.Element, prefix: str) -> ET.Element:
+    """复用上一快照中未变化的子树，子树中的路径前缀换成新的路径"""
+    elem = copy.deepcopy(previous)
+    old_path = previous.attrib.get("path", "")
+    new_path = prefix.replace("->", "→")
+    for node in elem.iter():
+        path = node.attrib.get("path", "")
+        if path.startswith(old_path):
+            node.attrib["path"] = new_path + path[len(old_path):]
+    return elem
+
+def control_info_to_xml_incremental(ctrl: UIAWrapper, previous: ET.Element, depth: int = 0, prefix: str = "",
+                                    llm_trigger: bool = True, max_depth: int = 15,
+                                    policy: CapturePolicy = FULL_CAPTURE) -> ET.Element:
+    """
+    差量采集：自顶向下比较实时控件与上一快照 previous 中同位置节点的签名，
+    未变化的子树直接复用上一快照 (省去XML构建，动态控件判断只对子树根重新进行)，
+    发生变化的子树继续逐层比较；没有可比较的节点时按完整采集处理。
+    UIA 没有子树变化通知，微信又会在属性与子控件数都不变的容器下替换内容，只比较上层会漏掉变化，
+    因此每个节点仍读取一次，读取次数与完整采集相同
+    """
+    if depth > max_depth:
+        return None
+
+    ctrl = snapshot_control(ctrl)
+    if previous is None or ctrl.friendly_class_name() != previous.tag:
+        return control_info_to_xml(ctrl, depth, prefix, llm_trigger, max_depth, policy)
+    elem = ET.Element(ctrl.friendly_class_name(), control_attrs(ctrl, depth, prefix, llm_trigger))
+
+    policy, children = capture_children(ctrl, policy)
+    previous_children = list(previous)
+    for position, child in enumerate(children):
+        if isinstance(child, ET.Element):
+            elem.append(child)
+            continue
+        child_prefix = prefix + f" -> {child.friendly_class_name()}[{child.window_text()}]"
+        previous_child = previous_children[position] if position < len(previous_children) else None
+        if previous_child is not None and depth + 1 <= max_depth and \
+                is_subtree_unchanged(child, previous_child, policy):
+            child_elem = reuse_subtree(child, previous_child, child_prefix)
+            if child.friendly_class_name() not in classifier.non_interactive_containers:  # 兄弟控件可能已变化
+                child_elem.attrib["is_dynamic"] = str(classifier.is_dynamic_control(child))
+        else:
+            child_elem = control_info_to_xml_incremental(child, previous_child, depth + 1, child_prefix,
+                                                         max_depth=max_depth, policy=policy)
+        if child_elem is not None:
+            elem.append(child_elem)
+    return elem
+
+############################### 并行采集 ###############################
+
+def is_thread_safe(wrapper) -> bool:
+    """控件后端能否被多个线程同时访问：回放后端按其声明；真实UIA只有在 MTA 模式 (pywinauto 默认) 下才可以"""
+    backend = getattr(wrapper, "backend", None)
+    if hasattr(backend, "thread_safe"):
+        return backend.thread_safe
+    return getattr(sys, "coinit_flags", None) == 0
+
+def _init_capture_thread():
+    if comtypes is not None:
+        comtypes.CoInitializeEx(comtypes.COINIT_MULTITHREADED)
+
+def prefetch_subtree(root: ControlSnapshot, max_workers: int = CAPTURE_WORKERS, max_depth: int = 15,
+                     policy: CapturePolicy = FULL_CAPTURE) -> ControlSnapshot:
+    """
+    用有界线程池并行读取整棵子树：每个节点的子控件批量读取是一个任务，完成后再提交其子节点的任务，
+    互不依赖的兄弟子树因此并发采集。读取结果缓存在各节点的快照中，之后由 control_info_to_xml 串行生成XML，
+    子控件顺序与串行遍历一致。被采集策略裁剪的控件不再读取；差量采集同样需要每个节点 (包括上一快照中的叶子) 的子控件数，
+    因此也全部预读
+    """
+    with ThreadPoolExecutor(max_workers=max_workers, initializer=_init_capture_thread) as executor:
+        pending = {executor.submit(root.children): (0, policy.child_policy(root))}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                depth, node_policy = pending.pop(future)
+                try:
+                    children = future.result()
+                except Exception as e:  # 读取失败的节点留给串行生成时再处理
+                    logger.debug(f"Fail to prefetch children: {e}")
+                    continue
+                if depth + 1 > max_depth:
+                    continue
+                for child in node_policy.select_children(children):
+                    if not isinstance(child, ET.Element):
+                        pending[executor.submit(child.children)] = (depth + 1, node_policy.child_policy(child))
+    return root
+
+def export_gui_xml_structure(dlg_wrapper: UIAWrapper, output_dir="gui_export", state_num=0,
+                             max_workers: int = CAPTURE_WORKERS, previous: ET.Element = None, policy=None) -> str:
+    """
+    将GUI导出为XML格式；max_workers > 1 且控件后端支持多线程访问时并行采集子树，否则串行。
+    previous 为同一窗口上一次导出的根元素时使用差量采集，复用未变化的子树 (读取次数不变，省去其中的动态控件判断)；
+    policy 为采集裁剪策略 (CapturePolicy 或预置策略名称，默认完整采集)
     """
     # 创建输出目录
     output_path = os.path.join(output_dir)
@@ -128,7 +255,14 @@ def export_gui_xml_structure(dlg_wrapper: UIAWrapper, output_dir="gui_export", s
     logger.info(f"Start extracting GUI structure for: {dlg_wrapper.window_text()}")
 
     # 控件XML结构导出
-    root = control_info_to_xml(dlg_wrapper, llm_trigger=False)
+    snapshot = snapshot_control(dlg_wrapper)
+    policy = get_policy(policy).bind(snapshot)
+    if max_workers > 1 and is_thread_safe(dlg_wrapper):
+        prefetch_subtree(snapshot, max_workers, policy=policy)
+    if previous is not None:
+        root = control_info_to_xml_incremental(snapshot, previous, llm_trigger=False, policy=policy)
+    else:
+        root = control_info_to_xml(snapshot, llm_trigger=False, policy=policy)
     indent_xml(root)
     tree = ET.ElementTree(root)
     xml_path = os.path.join(output_path, f"state{state_num}.xml")
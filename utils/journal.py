@@ -0,0 +1,158 @@
+import json
+import logging
+import os
+import sys
+
+import yaml
+
+logger = logging.getLogger()
+
+JOURNAL_NAME = "journal.jsonl"
+UTG_NAME = "UTG.yaml"
+
+
+def fsync_file(path: str):
+    """确保文件内容已落盘"""
+    with open(path, "rb") as f:
+        os.fsync(f.fileno())
+
+def write_utg_yaml(output_path: str, transitions: list):
+    """将状态跳转记录写为UTG.yaml，先写临时文件再替换，避免中途崩溃留下半个文件"""
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    tmp_path = output_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        yaml.safe_dump({"transitions": transitions}, f, allow_unicode=True)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, output_path)
+
+
+class ExplorationJournal:
+    """
+    探索过程的只追加日志 (output_dir/journal.jsonl)，每个事件写入后立即 fsync：
+    - state: 新状态的编号、结构指纹与XML文件
+    - alias: 与已有状态近似重复的结构指纹及其归入的状态
+    - plan: 某状态规划出的全部动作，即该状态的待探索前沿
+    - action: 某动作已执行及其到达的状态 (predicted 表示未执行，到达的状态由动作结果缓存预测)
+    - transition: UTG 边
+    - state_done: 某状态的动作已全部探索完
+    进程被杀或崩溃后，以 resume=True 重新打开即可恢复上述信息并从中断处继续；
+    UTG.yaml 可随时由 compact() 从日志生成
+    """
+    def __init__(self, output_dir: str, resume: bool = False):
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, JOURNAL_NAME)
+        self.states = {}            # state_num -> {"fingerprint": ..., "file": ...}
+        self.aliases = {}           # 近似重复状态的结构指纹 -> state_num
+        self.plans = {}             # state_num -> [action_key, ...]
+        self.tried = {}             # action_key -> 到达的状态编号
+        self.predicted = set()      # 按预测结果记录、未实际执行的 action_key
+        self.transitions = []
+        self.completed_states = set()
+        os.makedirs(output_dir, exist_ok=True)
+        if resume and os.path.exists(self.path):
+            self._load()
+        else:
+            open(self.path, "w", encoding="utf-8").close()
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def _load(self):
+        """重放日志；最后一行若因崩溃写了一半则丢弃并截断"""
+        valid_bytes = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    logger.warning(f"Discard torn journal record at byte {valid_bytes} of {self.path}")
+                    break
+                self._apply(event)
+                valid_bytes += len(line)
+        with open(self.path, "r+b") as f:
+            f.truncate(valid_bytes)
+        logger.info(f"Journal loaded: {len(self.states)} states, {len(self.transitions)} transitions, "
+                    f"{sum(len(keys) for keys in self.frontier().values())} untried actions")
+
+    def _apply(self, event: dict):
+        kind = event["event"]
+        if kind == "state":
+            self.states[event["state"]] = {"fingerprint": event["fingerprint"], "file": event["file"]}
+        elif kind == "alias":
+            self.aliases[event["fingerprint"]] = event["state"]
+        elif kind == "plan":
+            self.plans[event["state"]] = [tuple(key) for key in event["actions"]]
+        elif kind == "action":
+            self.tried[tuple(event["key"])] = event["target"]
+            if event.get("predicted"):
+                self.predicted.add(tuple(event["key"]))
+        elif kind == "transition":
+            self.transitions.append(event["transition"])
+        elif kind == "state_done":
+            self.completed_states.add(event["state"])
+
+    def _append(self, event: dict):
+        self._apply(event)
+        self._file.write(json.dumps(event, ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def record_state(self, state_num: int, fingerprint: str, xml_path: str):
+        fsync_file(xml_path)  # 先保证状态文件落盘，日志中出现的状态文件一定完整
+        self._append({"event": "state", "state": state_num, "fingerprint": fingerprint,
+                      "file": os.path.basename(xml_path)})
+
+    def record_alias(self, fingerprint: str, state_num: int):
+        self._append({"event": "alias", "fingerprint": fingerprint, "state": state_num})
+
+    def record_plan(self, state_num: int, action_keys: list):
+        if state_num not in self.plans:
+            self._append({"event": "plan", "state": state_num, "actions": [list(key) for key in action_keys]})
+
+    def record_action(self, action_key: tuple, target_state: int, predicted: bool = False):
+        event = {"event": "action", "key": list(action_key), "target": target_state}
+        if predicted:
+            event["predicted"] = True
+        self._append(event)
+
+    def record_transition(self, transition: dict):
+        self._append({"event": "transition", "transition": transition})
+
+    def record_state_done(self, state_num: int):
+        if state_num not in self.completed_states:
+            self._append({"event": "state_done", "state": state_num})
+
+    def is_done(self, action_key: tuple) -> bool:
+        """动作已执行过，且其到达的状态无需再次进入 (即原状态本身或已探索完的状态)"""
+        if action_key not in self.tried:
+            return False
+        target = self.tried[action_key]
+        return target == action_key[0] or target in self.completed_states
+
+    def frontier(self) -> dict:
+        """各状态尚未执行的动作：state_num -> [action_key, ...]"""
+        return {state: [key for key in keys if key not in self.tried]
+                for state, keys in self.plans.items()
+                if any(key not in self.tried for key in keys)}
+
+    def compact(self, output_path: str = None) -> str:
+        """由日志生成 UTG.yaml，去除重复的跳转记录，返回输出路径"""
+        output_path = output_path or os.path.join(self.output_dir, UTG_NAME)
+        seen = set()
+        transitions = []
+        for transition in self.transitions:
+            key = json.dumps(transition, sort_keys=True, ensure_ascii=False)
+            if key not in seen:
+                seen.add(key)
+                transitions.append(transition)
+        write_utg_yaml(output_path, transitions)
+        return output_path
+
+    def close(self):
+        self._file.close()
+
+
+if __name__ == '__main__':
+    # 由探索日志重新生成 UTG.yaml：python -m utils.journal doc/utg
+    journal = ExplorationJournal(sys.argv[1] if len(sys.argv) > 1 else "doc/utg", resume=True)
+    print(journal.compact())
+    journal.close()
@@ -0,0 +1,394 @@
+import logging
+import re
+import time
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+from difflib import SequenceMatcher
+
+from utils.capture_policy import OMITTED_TAG, omitted_count
+from utils.control_snapshot import snapshot_control
+
+logger = logging.getLogger()
+
+STEP_PATTERN = re.compile(r'/(?P<tag>[^/\[]+)(?:\[(?:@(?P<attr>\w+)="(?P<value>(?:[^"\\]|\\.)*)"|(?P<index>\d+))\])?')
+IDENTITY_ATTRS = ["auto_id", "title", "name"]          # 控件标识谓词依次选用的属性 (与 get_best_attr 一致)
+SCORE_WEIGHTS = {"auto_id": 4.0, "title": 2.0, "name": 2.0, "class_name": 1.0}
+DISTANCE_PENALTY = 0.25     # 重新定位时，同类兄弟中的位置每偏离一位扣除的分数
+MIN_RATIO = 0.6             # 谓词属性值的相似度低于该值时不计分
+MAX_CANDIDATES = 3          # 重新定位时每层最多尝试的候选数
+MAX_RELOCATION_ATTEMPTS = 24  # 一次定位中最多尝试的重新定位候选总数，控件不存在时搜索代价不随层数指数增长
+MIN_SHARE = 0.5             # 重新定位的得分至少为参照属性全部相同时得分的这一比例，同类兄弟只有一个时不要求
+CACHE_ENTRIES = 256
+
+
+def node_attrs(node) -> dict:
+    """控件快照或状态XML元素的 (类型, 标识属性)"""
+    if isinstance(node, ET.Element):
+        return {"tag": node.tag, "auto_id": node.attrib.get("auto_id", ""), "title": node.attrib.get("title", ""),
+                "name": node.attrib.get("name", ""), "class_name": node.attrib.get("class_name", "")}
+    props = node.props
+    return {"tag": props["friendly_class_name"], "auto_id": props["auto_id"], "title": props["title"],
+            "name": props["name"], "class_name": props["class_name"]}
+
+def identity(attrs: dict):
+    """控件标识使用的谓词 (属性, 值)，三个属性都为空时返回 None (使用同类下标)"""
+    for attr in IDENTITY_ATTRS:
+        if attrs[attr]:
+            return attr, attrs[attr]
+    return None
+
+def xml_children(elem: ET.Element) -> list:
+    """状态XML的子元素；采集时被裁剪的占位元素展开为相应个数的 None，兄弟控件的下标与原界面一致"""
+    children = []
+    for child in elem:
+        if child.tag == OMITTED_TAG:
+            children.extend([None] * omitted_count(child))
+        else:
+            children.append(child)
+    return children
+
+def xml_attrs(elem: ET.Element) -> list:
+    return [node_attrs(child) if child is not None else None for child in xml_children(elem)]
+
+
+class Step:
+    """标识中的一层：控件类型加上谓词 (属性, 值) 或同类兄弟中的下标；expected 为编译时参照状态中该层控件的属性"""
+    __slots__ = ("tag", "predicate", "index", "expected")
+
+    def __init__(self, tag: str, predicate=None, index: int = None, expected: dict = None):
+        self.tag = tag
+        self.predicate = predicate
+        self.index = index
+        self.expected = expected
+
+    def __repr__(self):
+        return f"/{self.tag}[{'@%s=%r' % self.predicate if self.predicate else self.index}]"
+
+    def match(self, nodes: list):
+        """严格匹配：返回匹配的控件在 nodes 中的位置，没有时返回 None；nodes 中的 None 为被裁剪的控件"""
+        tag_index = 0
+        for position, attrs in enumerate(nodes):
+            if attrs is None or attrs["tag"] != self.tag:
+                continue
+            if self.predicate is not None:
+                if identity(attrs) == self.predicate:
+                    return position
+            elif tag_index == self.index:
+                expected = self.expected
+                return position if expected is None or expected["class_name"] == attrs["class_name"] else None
+            tag_index += 1
+        return None
+
+    def relocate(self, nodes: list) -> list:
+        """
+        下标变化或标识属性变化时按属性得分重新定位：返回可接受的候选位置，得分高的在前 (最多 MAX_CANDIDATES 个)；
+        得分至少为参照属性全部相同时得分的 MIN_SHARE，同类兄弟只有一个时不要求
+        """
+        expected = dict(self.expected or {})
+        if self.predicate is not None:
+            expected.setdefault(self.predicate[0], self.predicate[1])
+        candidates = [(position, attrs) for position, attrs in enumerate(nodes)
+                      if attrs is not None and attrs["tag"] == self.tag]
+        attainable = sum(weight for attr, weight in SCORE_WEIGHTS.items() if expected.get(attr))
+        scored = []
+        for tag_index, (position, attrs) in enumerate(candidates):
+            score = 0.0
+            for attr, weight in SCORE_WEIGHTS.items():
+                if not expected.get(attr):
+                    continue
+                ratio = 1.0 if attrs[attr] == expected[attr] else SequenceMatcher(None, attrs[attr], expected[attr]).ratio()
+                score += weight * ratio if ratio >= MIN_RATIO else 0.0
+            if self.index is not None:
+                score -= DISTANCE_PENALTY * abs(tag_index - self.index)
+            if (attainable and score >= MIN_SHARE * attainable) or len(candidates) == 1:
+                scored.append((score, position))
+        scored.sort(key=lambda item: -item[0])
+        return [position for _, position in scored[:MAX_CANDIDATES]]
+
+
+def parse_identifier(identifier: str) -> tuple:
+    """
+    '/Dialog/GroupBox[0]/Button[@title="通讯录"]' -> ([Step, ...], [每层结束的位置, ...])，第一层为根控件；
+    谓词的值中可以含有 '/' 与转义的引号
+    """
+    steps, ends, position = [], [], 0
+    while position < len(identifier):
+        match = STEP_PATTERN.match(identifier, position)
+        if match is None:
+            raise ValueError(f"Invalid control identifier at {position}: {identifier}")
+        if match.group("attr"):
+            predicate = (match.group("attr"), match.group("value").replace('\\"', '"'))
+            steps.append(Step(match.group("tag"), predicate=predicate))
+        else:
+            index = match.group("index")
+            steps.append(Step(match.group("tag"), index=int(index) if index is not None else 0))
+        position = match.end()
+        ends.append(position)
+    if not steps:
+        raise ValueError(f"Empty control identifier: {identifier!r}")
+    return steps, ends
+
+
+class Locator:
+    """
+    编译后的控件标识：逐层下降的步骤程序，每层只读取一次子控件 (ControlSnapshot 批量读取)，
+    不像 child_window(..., depth=n) 那样扫描整棵子树逐个比较属性。
+    reference 为参照状态XML的根元素 (如 App Doc 中标识所在的状态)，编译时记录每层控件的属性，
+    下标变化或标识属性变化导致严格匹配失败时，按属性得分在同类兄弟中重新定位
+    """
+    def __init__(self, identifier: str, reference: ET.Element = None):
+        self.identifier = identifier
+        self.steps, self.ends = parse_identifier(identifier)
+        if reference is not None:
+            self.bind(reference)
+
+    def __repr__(self):
+        return f"<Locator {self.identifier}>"
+
+    def prefix(self, depth: int) -> str:
+        """前 depth 层对应的标识"""
+        return self.identifier[:self.ends[depth - 1]]
+
+    def bind(self, reference: ET.Element):
+        """在参照状态中严格解析一次，记录每层控件的属性；参照状态中不存在该控件时不记录"""
+        path = self.walk(reference, xml_attrs, xml_children, relocate=False)
+        if path is not None:
+            for step, elem in zip(self.steps[1:], path[1:]):
+                step.expected = node_attrs(elem)
+
+    def walk(self, root, read_attrs, read_children, start: int = 1, relocate: bool = True, stats: dict = None):
+        """
+        从第 start 层开始逐层匹配，返回从 root 起每层匹配到的节点列表，无法定位时返回 None；
+        read_attrs(node) 返回子节点属性列表，read_children(node) 返回对应的子节点。
+        某层严格匹配失败 (或其下无法继续定位) 时依次尝试重新定位的候选，优先选择其下各层都能严格匹配的候选；
+        已确认无法定位的 (节点, 层) 不再重复搜索，整次定位最多尝试 MAX_RELOCATION_ATTEMPTS 个候选
+        """
+        search = {"failed": set(), "attempts": MAX_RELOCATION_ATTEMPTS}
+        return self._walk(root, read_attrs, read_children, start, relocate, stats, search)
+
+    def _walk(self, root, read_attrs, read_children, start: int, relocate: bool, stats: dict, search: dict):
+        if start == len(self.steps):
+            return [root]
+        key = (id(root), start, relocate)
+        if key in search["failed"]:
+            return None
+        step = self.steps[start]
+        nodes = read_attrs(root)
+        position = step.match(nodes)
+        if position is not None:
+            rest = self._walk(read_children(root)[position], read_attrs, read_children, start + 1, relocate, stats, search)
+            if rest is not None:
+                return [root] + rest
+        if relocate:
+            candidates = [candidate for candidate in step.relocate(nodes) if candidate != position]
+            for strict in (True, False):
+                for candidate in candidates:
+                    if search["attempts"] <= 0:
+                        logger.debug(f"Gave up relocating {self.identifier}: too many candidates tried")
+                        return None
+                    search["attempts"] -= 1
+                    rest = self._walk(read_children(root)[candidate], read_attrs, read_children, start + 1, not strict,
+                                      stats, search)
+                    if rest is not None:
+                        logger.debug(f"Relocated {step} in {self.identifier}")
+                        if stats is not None:
+                            stats["relocations"] += 1
+                        return [root] + rest
+        search["failed"].add(key)
+        return None
+
+    def resolve_element(self, root: ET.Element, relocate: bool = True):
+        """在状态XML中定位控件，返回元素，不存在时返回 None"""
+        path = self.walk(root, xml_attrs, xml_children, relocate=relocate)
+        return path[-1] if path is not None else None
+
+    def resolve(self, root_wrapper, relocate: bool = True, stats: dict = None):
+        """在实时界面中定位控件，返回目标控件的快照 (.wrapper 为实时控件)，不存在时抛出 LookupError"""
+        return self.descend((1, snapshot_control(root_wrapper)), relocate, stats)[1][-1]
+
+    def descend(self, start: tuple, relocate: bool = True, stats: dict = None) -> tuple:
+        """
+        从已定位的前缀 start=(已匹配的层数, 控件快照) 继续下降，返回 (start 的层数, [start 的控件快照, ..., 目标控件快照])，
+        不存在时抛出 LookupError
+        """
+        depth, node = start
+        path = self.walk(node, lambda snap: [node_attrs(child) for child in snap.children()],
+                         lambda snap: snap.children(), start=depth, relocate=relocate, stats=stats)
+        if path is None:
+            raise LookupError(f"Control {self.identifier} not found in the live UI")
+        return depth, path
+
+
+class LocatorCache:
+    """
+    已定位控件的 LRU 缓存，键为 (scope, 标识)，scope 由调用方给出 (如当前状态的结构指纹，界面变化后自然换用新的键)：
+    - 命中时读取一次控件属性检查其仍然存在且类型与标识属性不变，否则视为失效并重新定位
+    - 各标识的公共前缀共享：已定位的中间控件及其子控件列表按前缀缓存，新标识从最长的已定位前缀继续下降
+    stats 记录命中、未命中、失效与重新定位的次数
+    """
+    def __init__(self, max_entries: int = CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self.locators = {}              # 标识 -> Locator
+        self.entries = OrderedDict()    # (scope, 标识) -> 目标控件快照
+        self.prefixes = {}              # scope -> {标识前缀: 控件快照}
+        self.stats = {"hits": 0, "misses": 0, "stale": 0, "relocations": 0}
+
+    def locator(self, identifier: str, reference: ET.Element = None) -> Locator:
+        locator = self.locators.get(identifier)
+        if locator is None:
+            locator = self.locators[identifier] = Locator(identifier, reference)
+        elif reference is not None and all(step.expected is None for step in locator.steps[1:]):
+            locator.bind(reference)
+        return locator
+
+    def resolve(self, identifier: str, root_wrapper, scope=None, reference: ET.Element = None):
+        """定位控件并返回实时控件，找不到时抛出 LookupError"""
+        key = (scope, identifier)
+        cached = self.entries.get(key)
+        if cached is not None:
+            if self.is_valid(cached):
+                self.entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return cached.wrapper
+            self.stats["stale"] += 1
+            self.invalidate(scope)
+        self.stats["misses"] += 1
+        locator = self.locator(identifier, reference)
+        prefixes = self.prefixes.setdefault(scope, {})
+        start = self.longest_prefix(locator, prefixes)
+        try:
+            depth, path = locator.descend(start or (1, snapshot_control(root_wrapper)), stats=self.stats)
+        except LookupError:
+            if start is None:
+                raise
+            self.invalidate(scope)   # 缓存的中间控件可能已过期，从根重新定位一次
+            prefixes = self.prefixes.setdefault(scope, {})
+            depth, path = locator.descend((1, snapshot_control(root_wrapper)), stats=self.stats)
+        for offset, node in enumerate(path[:-1]):
+            if depth + offset > 1:   # 根控件由调用方传入，不缓存
+                prefixes[locator.prefix(depth + offset)] = node
+        self.entries[key] = path[-1]
+        while len(self.entries) > self.max_entries:
+            (old_scope, _), _ = self.entries.popitem(last=False)
+            if not any(entry_scope == old_scope for entry_scope, _ in self.entries):
+                self.prefixes.pop(old_scope, None)
+        return path[-1].wrapper
+
+    def longest_prefix(self, locator: Locator, prefixes: dict):
+        """最长的已定位前缀，返回 (已匹配的层数, 控件快照)，没有时返回 None"""
+        for depth in range(len(locator.steps) - 1, 1, -1):
+            node = prefixes.get(locator.prefix(depth))
+            if node is not None:
+                return depth, node
+        return None
+
+    def is_valid(self, snapshot) -> bool:
+        """读取一次控件属性：控件已不存在 (读取失败) 或类型、标识属性已变化时失效"""
+        try:
+            current = snapshot_control(snapshot.wrapper)
+        except Exception:
+            return False
+        return node_attrs(current) == node_attrs(snapshot)
+
+    def invalidate(self, scope=None):
+        """丢弃某个 scope 的全部缓存 (界面已变化)"""
+        self.prefixes.pop(scope, None)
+        for key in [key for key in self.entries if key[0] == scope]:
+            del self.entries[key]
+
+
+############################### 性能测试 ###############################
+
+def scan_resolve(root_wrapper, locator: Locator):
+    """
+    child_window(control_type=..., title=..., depth=n).wrapper_object() 的做法：逐层列出深度不超过 n 的整棵子树，
+    再逐个读取控件类型与谓词属性比较，返回第一个匹配的控件；只适用于最后一层带谓词的标识
+    """
+    target = locator.steps[-1]
+    readers = {"auto_id": lambda ctrl: ctrl.element_info.automation_id, "title": lambda ctrl: ctrl.window_text(),
+               "name": lambda ctrl: ctrl.element_info.name}
+    level, candidates = [root_wrapper], []
+    for _ in range(len(locator.steps) - 1):
+        level = [child for ctrl in level for child in ctrl.children()]
+        candidates.extend(level)
+    attr, value = target.predicate
+    matches = [ctrl for ctrl in candidates if ctrl.friendly_class_name() == target.tag and readers[attr](ctrl) == value]
+    if not matches:
+        raise LookupError(f"Control {locator.identifier} not found in the live UI")
+    return matches[0]
+
+def shift_indices(root: ET.Element, locator: Locator) -> ET.Element:
+    """复制状态，在标识经过的每个按下标定位的控件前插入一个同类型的兄弟控件 (模拟界面更新后下标整体后移)"""
+    import copy
+
+    shifted = copy.deepcopy(root)
+    path = locator.walk(shifted, xml_attrs, xml_children, relocate=False)
+    parents = {child: parent for parent in path[:-1] for child in parent}
+    for step, elem in zip(locator.steps[1:], path[1:]):
+        if step.predicate is None:
+            parent = parents[elem]
+            sibling = ET.Element(elem.tag, {"class_name": "inserted", "rect": "(L0, T0, R0, B0)"})
+            parent.insert(list(parent).index(elem), sibling)
+    return shifted
+
+def benchmark_locator(utg_dir: str = "doc/utg", latency: float = 0.0005, repeat: int = 3) -> dict:
+    """
+    在回放后端上定位 UTG 中每条跳转的控件标识，比较 child_window 式的子树扫描、编译后的逐层定位 (冷启动)
+    与带缓存的定位 (同一状态中的重复定位) 的UIA调用次数与延迟；latency 为模拟的每次UIA调用耗时，
+    并在下标后移的状态副本上检验重新定位是否找到原控件
+    """
+    import os
+
+    import yaml
+
+    from utils.replay import ReplayBackend, wrapper_from_xml
+    from utils.state_store import load_states
+
+    states = load_states(utg_dir)
+    with open(os.path.join(utg_dir, "UTG.yaml"), encoding="utf-8") as f:
+        transitions = yaml.safe_load(f)["transitions"]
+    targets = sorted({(t["State"], t["Control_Identifier"]) for t in transitions if t["State"] in states})
+    backend = ReplayBackend(latency=latency)
+    roots = {state_num: wrapper_from_xml(states[state_num], backend) for state_num, _ in targets}
+    results = {"identifiers": len(targets)}
+
+    def measure(name: str, resolve, items):
+        backend.reset()
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for state_num, identifier in items:
+                resolve(state_num, identifier)
+        count = repeat * len(items)
+        results[f"{name}_calls"] = round(backend.total_calls / count, 1)
+        results[f"{name}_ms"] = round(1000 * (time.perf_counter() - start) / count, 2)
+
+    scannable = [(num, identifier) for num, identifier in targets if parse_identifier(identifier)[0][-1].predicate]
+    results["scannable"] = len(scannable)
+    measure("scan", lambda num, identifier: scan_resolve(roots[num], Locator(identifier)), scannable)
+    measure("compiled_scannable", lambda num, identifier: Locator(identifier).resolve(roots[num]), scannable)
+    measure("compiled", lambda num, identifier: Locator(identifier).resolve(roots[num]), targets)
+    cache = LocatorCache()
+    for num, identifier in targets:   # 预热：每个标识定位一次
+        cache.resolve(identifier, roots[num], scope=num)
+    measure("cached", lambda num, identifier: cache.resolve(identifier, roots[num], scope=num), targets)
+
+    relocated = found = 0
+    for state_num, identifier in targets:
+        locator = Locator(identifier, states[state_num])
+        if all(step.predicate is not None for step in locator.steps[1:]):
+            continue
+        expected = locator.resolve_element(states[state_num], relocate=False)
+        shifted = wrapper_from_xml(shift_indices(states[state_num], locator), ReplayBackend())
+        relocated += 1
+        try:
+            found += str(locator.resolve(shifted).props["rect"]) == expected.attrib.get("rect")
+        except LookupError:
+            pass
+    results.update({"shifted": relocated, "relocated_correctly": found, "cache_stats": cache.stats})
+    logger.info(f"Locator benchmark on {utg_dir}: {results}")
+    return results
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(benchmark_locator())
@@ -0,0 +1,118 @@
+import hashlib
+import logging
+import xml.etree.ElementTree as ET
+
+from utils.similarity import structure_shingles
+from utils.state_store import element_xpaths
+
+logger = logging.getLogger()
+
+REGION_LEVELS = 1   # 控件所在区域：向上第几层祖先的子树
+INPUT_REPEAT = 2    # 同一输入框已有这么多种不同输入得到一致的结果后，其余输入的结果视为相同
+MIN_SOURCES = 2     # 跨状态预测至少需要在这么多个状态中观察到一致的结果
+PREDICTION_MODES = ["defer", "skip"]
+
+
+def region_fingerprint(elem: ET.Element) -> str:
+    """区域的结构指纹：子树的结构 shingle 集合的哈希，忽略标题等内容，动态控件组的成员数不影响结果"""
+    return hashlib.sha1("\n".join(sorted(structure_shingles(elem))).encode("utf-8")).hexdigest()
+
+def control_regions(root: ET.Element, xpaths, levels: int = REGION_LEVELS) -> dict:
+    """控件标识 -> 控件所在区域 (向上 levels 层的祖先，不超过根) 的结构指纹"""
+    wanted = set(xpaths)
+    elements = {id(elem): elem for elem in root.iter()}
+    parents = {child: parent for parent in root.iter() for child in parent}
+    regions = {}
+    fingerprints = {}   # 区域元素 id -> 结构指纹，同一区域只计算一次
+    for elem_id, xpath in element_xpaths(root).items():
+        if xpath not in wanted or xpath in regions:
+            continue
+        region = elements[elem_id]
+        for _ in range(levels):
+            region = parents.get(region, region)
+        if id(region) not in fingerprints:
+            fingerprints[id(region)] = region_fingerprint(region)
+        regions[xpath] = fingerprints[id(region)]
+    return regions
+
+
+class OutcomeCache:
+    """
+    动作结果缓存：以 (控件标识, 动作, 所在区域的结构指纹) 为键，记录动作在各状态中执行的结果 (来源状态, 到达状态)。
+    同一键在至少 min_sources 个状态中的结果一致时可预测其他状态中的同类动作：都到达同一状态时预测为该状态，
+    都停留在原状态时预测为停留；同一状态的输入框已有 input_repeat 种不同输入的结果一致时，预测其余输入的结果也相同。
+    预测只给出已知的状态，因此被预测的动作不会发现新状态，可以延后或跳过执行
+    """
+    def __init__(self, input_repeat: int = INPUT_REPEAT, min_sources: int = MIN_SOURCES, region_levels: int = REGION_LEVELS):
+        self.input_repeat = input_repeat
+        self.min_sources = min_sources
+        self.region_levels = region_levels
+        self.regions = {}    # (状态, 控件标识) -> 区域指纹
+        self.outcomes = {}   # (控件标识, 动作, 区域指纹) -> {内容: {(来源状态, 到达状态), ...}}
+        self.pending = {}    # (控件标识, 动作, 区域指纹) -> {未执行的动作键}
+
+    def cache_key(self, action_key: tuple):
+        state_num, xpath, action, _ = action_key
+        region = self.regions.get((state_num, xpath))
+        return (xpath, action, region) if region is not None else None
+
+    def add_state(self, state_num: int, root: ET.Element, action_keys: list, observed: dict = None):
+        """
+        登记状态中尚未执行的动作 action_keys 及其所在区域；
+        observed 为该状态中已实际执行的动作及其到达的状态 (恢复探索时由日志重放)
+        """
+        observed = observed or {}
+        xpaths = {key[1] for key in action_keys} | {key[1] for key in observed}
+        for xpath, region in control_regions(root, xpaths, self.region_levels).items():
+            self.regions[(state_num, xpath)] = region
+        for key, target_state in observed.items():
+            self.observe(key, target_state)
+        for key in action_keys:
+            cache_key = self.cache_key(key)
+            if cache_key is not None:
+                self.pending.setdefault(cache_key, set()).add(key)
+
+    def predict(self, action_key: tuple):
+        """预测动作到达的状态，结果不确定时返回 None"""
+        cache_key = self.cache_key(action_key)
+        if cache_key is None or cache_key not in self.outcomes:
+            return None
+        state_num, _, action, content = action_key
+        by_content = self.outcomes[cache_key]
+        observed = by_content.get(content)
+        if observed is None:
+            if action != "input":
+                return None
+            observed = {outcome for outcomes in by_content.values() for outcome in outcomes if outcome[0] == state_num}
+            if sum(any(source == state_num for source, _ in outcomes) for outcomes in by_content.values()) < self.input_repeat:
+                return None
+        sources, targets = {source for source, _ in observed}, {target for _, target in observed}
+        if state_num not in sources and len(sources) < self.min_sources:
+            return None
+        if all(source == target for source, target in observed):
+            return state_num
+        return next(iter(targets)) if len(targets) == 1 else None
+
+    def record(self, action_key: tuple, target_state: int) -> list:
+        """记录实际执行的动作结果，返回因此变得可预测的未执行动作键"""
+        self.discard(action_key)
+        cache_key = self.observe(action_key, target_state)
+        return self.predictable(self.pending.get(cache_key, ())) if cache_key is not None else []
+
+    def observe(self, action_key: tuple, target_state: int):
+        cache_key = self.cache_key(action_key)
+        if cache_key is not None:
+            self.outcomes.setdefault(cache_key, {}).setdefault(action_key[3], set()).add((action_key[0], target_state))
+        return cache_key
+
+    def discard(self, action_key: tuple):
+        """动作已执行、已按预测处理或已无法执行，不再等待预测"""
+        cache_key = self.cache_key(action_key)
+        if cache_key in self.pending:
+            self.pending[cache_key].discard(action_key)
+            if not self.pending[cache_key]:
+                del self.pending[cache_key]
+
+    def predictable(self, action_keys) -> list:
+        """action_keys 中当前可预测的动作键"""
+        return [key for key in action_keys if self.predict(key) is not None]
@@ -0,0 +1,560 @@
+import logging
+import os
+import re
+import time
+import xml.etree.ElementTree as ET
+from collections import deque
+
+import yaml
+from pywinauto import Application
+
+from utils.capture_policy import FULL_CAPTURE
+from utils.control_snapshot import snapshot_control
+from utils.explorer import live_state_fingerprint, state_fingerprint
+from utils.locator import LocatorCache, identity, node_attrs, parse_identifier
+from utils.scroller import ListScroller
+from utils.settle import SettleDetector, window_fingerprint
+from utils.state_store import load_states
+from utils.window_registry import WindowRegistry
+
+logger = logging.getLogger()
+
+PLAN_ACTIONS = ["click", "input", "select", "assert_state"]
+FIND_ATTRS = ["tag", "auto_id", "title", "name", "class_name", "title_re"]   # find 条件支持的属性
+FIND_DEPTH = 15             # find 条件广度优先查找的最大深度，与采集深度一致
+CLEAR_KEYS = '^A{BACKSPACE}'
+PLAN_BLOCK = re.compile(r"```ya?ml\s*\n(.*?)```", re.S)
+PATH_HEADER = re.compile(r"路径\s*[2-9]")      # 伪代码中第二条及之后的备选路径
+SELECT_PATTERN = re.compile(r"`?(?P<control>[^\s`.，。:：]+)\.match\(\s*['\"‘“](?P<match>.*?)['\"’”]\s*\)")
+INPUT_PATTERN = re.compile(r"在\s*[`「“\"]?(?P<control>[^`」”\"'‘]+?)[`」”\"]?\s*(?:中|里|内)?\s*输入\s*[`]?['\"‘“](?P<text>.*?)['\"’”]")
+CLICK_PATTERN = re.compile(r"点击\s*[`「“\"]?(?P<control>[^`」”\"'\s，。,:：]+)")
+
+
+############################### 计划编译 ###############################
+
+def load_appdoc_controls(appdoc) -> list:
+    """
+    App Doc 中的控件列表：[{name, xpath, description, dynamic, page}, ...]；
+    支持 doc_generator 生成的按页面分组格式 (pages[].controls)，以及顶层的 controls 列表或纯列表
+    """
+    if isinstance(appdoc, dict) and isinstance(appdoc.get('pages'), list):
+        groups = [(page.get('page_name', ''), page.get('controls') or []) for page in appdoc['pages']]
+    elif isinstance(appdoc, dict) and 'controls' in appdoc:
+        groups = [('', appdoc['controls'])]
+    elif isinstance(appdoc, list):
+        groups = [('', appdoc)]
+    else:
+        groups = []
+    controls = []
+    for page_name, control_list in groups:
+        for ctrl in control_list:
+            controls.append({
+                'name': ctrl.get('name') or ctrl.get('id', ''),
+                'xpath': ctrl.get('identifier', ''),
+                'description': ctrl.get('description', ''),
+                'dynamic': str(ctrl.get('dynamic', '')).lower() == 'true',
+                'page': page_name,
+            })
+    return controls
+
+def parent_identifier(identifier: str) -> str:
+    """去掉标识的最后一层"""
+    _, ends = parse_identifier(identifier)
+    return identifier[:ends[-2]] if len(ends) > 1 else identifier
+
+def resolve_control_name(name: str, controls: list, select: bool = False) -> dict:
+    """
+    计划中的控件引用 -> 步骤中的定位字段：XPath 原样使用；App Doc 中的控件名 (完整名称或页面前缀后的部分) 换成其标识；
+    select 步骤引用动态控件 (列表条目的模板) 时定位其所在的列表；都不匹配时按标题查找 ({"find": {"title": 名称}})
+    """
+    name = name.strip().strip('`"“”「」<>')
+    if name.startswith('/'):
+        return {"control": name}
+    matched = [ctrl for ctrl in controls if ctrl['name'] == name] or \
+              [ctrl for ctrl in controls if ctrl['name'].split('-', 1)[-1] == name]
+    if not matched:
+        return {"find": {"title": name}}
+    ctrl = matched[0]
+    identifier = parent_identifier(ctrl['xpath']) if select and ctrl.get('dynamic') else ctrl['xpath']
+    return {"control": identifier}
+
+def compile_plan(steps: list, controls: list = ()) -> list:
+    """
+    规范化计划步骤：[{action, control 或 find, text, match, expect, wait}, ...]；
+    control 可以是 App Doc 中的控件名或 XPath，find 为 child_window 式的属性条件 (tag/auto_id/title/name/class_name/title_re)；
+    input 需要 text，select 需要 match (条目标题的正则)，assert_state 需要 expect (UTG 中的状态编号)
+    """
+    plan = []
+    for position, raw in enumerate(steps):
+        action = raw.get('action')
+        if action not in PLAN_ACTIONS:
+            raise ValueError(f"Step {position}: unknown action {action!r}, expected one of {PLAN_ACTIONS}")
+        step = {"action": action}
+        if action != "assert_state":
+            if raw.get('control'):
+                step.update(resolve_control_name(str(raw['control']), controls, select=action == "select"))
+            elif raw.get('find'):
+                unknown = set(raw['find']) - set(FIND_ATTRS)
+                if unknown:
+                    raise ValueError(f"Step {position}: unsupported find attributes {sorted(unknown)}")
+                step["find"] = {key: str(value) for key, value in raw['find'].items()}
+            else:
+                raise ValueError(f"Step {position}: {action} needs a control or find criteria")
+        if action == "input":
+            if raw.get('text') is None:
+                raise ValueError(f"Step {position}: input needs text")
+            step["text"] = str(raw['text'])
+        if action == "select":
+            if raw.get('match') is None:
+                raise ValueError(f"Step {position}: select needs match")
+            step["match"] = str(raw['match'])
+        if raw.get('expect') is not None:
+            step["expect"] = int(raw['expect'])
+        elif action == "assert_state":
+            raise ValueError(f"Step {position}: assert_state needs expect")
+        if raw.get('wait') is not None:
+            step["wait"] = bool(raw['wait'])
+        plan.append(step)
+    return plan
+
+def parse_pseudocode(script: str) -> list:
+    """
+    从生成脚本的伪代码中提取推荐路径 (第一条路径) 的动作：
+    "点击 控件名"、"在 控件名 输入 '文本'"、"<列表名>.match('关键词')"，每行至多一个动作
+    """
+    steps = []
+    for line in script.splitlines():
+        if PATH_HEADER.search(line) and steps:
+            break
+        match = SELECT_PATTERN.search(line)
+        if match:
+            steps.append({"action": "select", "control": match.group("control"), "match": match.group("match")})
+            continue
+        match = INPUT_PATTERN.search(line)
+        if match:
+            steps.append({"action": "input", "control": match.group("control"), "text": match.group("text")})
+            continue
+        match = CLICK_PATTERN.search(line)
+        if match:
+            steps.append({"action": "click", "control": match.group("control")})
+    return steps
+
+def compile_script(script: str, controls: list = ()) -> list:
+    """生成脚本 -> 可执行计划：优先使用脚本末尾的 ```yaml 计划块，没有时解析伪代码"""
+    for block in reversed(PLAN_BLOCK.findall(script)):
+        try:
+            data = yaml.safe_load(block)
+        except yaml.YAMLError:
+            continue
+        steps = data.get('steps') if isinstance(data, dict) else data
+        if isinstance(steps, list) and steps:
+            return compile_plan(steps, controls)
+    steps = parse_pseudocode(script)
+    if not steps:
+        raise ValueError("No executable steps found in the script")
+    return compile_plan(steps, controls)
+
+def load_plan(plan_path: str, appdoc_path: str = "doc/appdoc.yaml") -> list:
+    """读取计划文件 (含 steps 列表的 YAML) 并按 App Doc 编译"""
+    with open(plan_path, encoding="utf-8") as f:
+        data = yaml.safe_load(f) or {}
+    controls = []
+    if appdoc_path and os.path.exists(appdoc_path):
+        with open(appdoc_path, encoding="utf-8") as f:
+            controls = load_appdoc_controls(yaml.safe_load(f))
+    return compile_plan(data.get('steps') if isinstance(data, dict) else data, controls)
+
+
+############################### 计划执行 ###############################
+
+def child_step(attrs: dict, index: int) -> str:
+    """按探索器的控件标识规则生成一层标识：auto_id/title/name 谓词，否则为同类兄弟中的下标"""
+    predicate = identity(attrs)
+    if predicate is None:
+        return f"/{attrs['tag']}[{index}]"
+    attr, value = predicate
+    return '/%s[@%s="%s"]' % (attrs['tag'], attr, value.replace('"', '\\"'))
+
+def matches_criteria(attrs: dict, criteria: dict) -> bool:
+    for key, value in criteria.items():
+        if key == "title_re":
+            if not re.search(value, attrs["title"]):
+                return False
+        elif attrs[key] != value:
+            return False
+    return True
+
+def find_control(root_wrapper, criteria: dict, max_depth: int = FIND_DEPTH) -> tuple:
+    """
+    按属性条件广度优先查找控件 (child_window 的条件写法)，每个节点的子控件及其属性一次批量读取，
+    返回 (控件快照, 控件标识)，找不到时抛出 LookupError
+    """
+    root = snapshot_control(root_wrapper)
+    queue = deque([(root, f"/{root.friendly_class_name()}", 0)])
+    while queue:
+        node, identifier, depth = queue.popleft()
+        if depth >= max_depth:
+            continue
+        counts = {}
+        for child in node.children():
+            attrs = node_attrs(child)
+            index = counts.get(attrs["tag"], 0)
+            counts[attrs["tag"]] = index + 1
+            child_identifier = identifier + child_step(attrs, index)
+            if matches_criteria(attrs, criteria):
+                return child, child_identifier
+            queue.append((child, child_identifier, depth + 1))
+    raise LookupError(f"No control matches {criteria}")
+
+
+class PlanRunner:
+    """
+    在应用上执行编译后的计划：
+    - 控件按标识逐层定位 (LocatorCache，以当前状态为 scope 并以 UTG 中的状态XML为参照重新定位)，或按 find 条件批量查找
+    - 动作后用 SettleDetector 等待界面稳定，替代固定 sleep；已知停留在原状态的动作 (如在聊天输入框中输入) 不单独等待，
+      由后续动作一起等待
+    - 期望到达的状态来自步骤的 expect 或 UTG 中的跳转，用实时结构指纹校验，不导出XML
+    - 每一步记录定位、执行、等待与校验的耗时
+    states_dir 为探索结果目录 (stateN.xml + UTG.yaml)；list_windows/connect_window 用于替换顶层窗口的枚举与连接方式
+    """
+    def __init__(self, main_wrapper, states_dir: str = "doc/utg", settle_timeout: float = 5.0, capture_policy=FULL_CAPTURE,
+                 list_windows=None, connect_window=None):
+        self.main_wrapper = main_wrapper
+        self.settle = SettleDetector(timeout=settle_timeout)
+        self.window_registry = WindowRegistry([main_wrapper.element_info.process_id], list_windows=list_windows)
+        self.connect_window = connect_window or \
+            (lambda handle: Application(backend="uia").connect(handle=handle).window(handle=handle).wrapper_object())
+        self.capture_policy = capture_policy
+        self.locators = LocatorCache()
+        self.states = load_states(states_dir) if states_dir else {}
+        self.transitions = {}
+        utg_path = os.path.join(states_dir, "UTG.yaml") if states_dir else None
+        if utg_path and os.path.exists(utg_path):
+            with open(utg_path, encoding="utf-8") as f:
+                utg = yaml.safe_load(f) or {}
+            self.transitions = {
+                (t["State"], t["Control_Identifier"], t["Action"], str(t["Content"])): t["New_State_Num"]
+                for t in utg.get("transitions") or [] if not t.get("Predicted")
+            }
+        self.fingerprints = {num: state_fingerprint(ET.ElementTree(root)) for num, root in self.states.items()}
+        self.fingerprint_states = {}    # 结构指纹 -> 状态编号 (结构相同的状态取编号最小的)
+        for num, fingerprint in sorted(self.fingerprints.items(), reverse=True):
+            self.fingerprint_states[fingerprint] = num
+        self.window = main_wrapper
+        self.state = None
+        self.pending = False    # 已执行、尚未等待界面稳定的动作
+
+    def identify(self) -> int:
+        """当前窗口对应的已知状态，未知时返回 None"""
+        return self.fingerprint_states.get(live_state_fingerprint(self.window, policy=self.capture_policy))
+
+    def run(self, plan: list, initial_state: int = None, trace_path: str = None) -> dict:
+        """
+        执行计划，返回 {status, initial_state, final_state, steps: [每步的耗时记录], seconds, settle}；
+        某一步定位、执行或校验失败时停止，status 为 "failed" 并记录 failed_step 与 error；
+        trace_path 不为空时把执行轨迹写为 YAML (与手写任务脚本的 utg 轨迹格式一致)
+        """
+        start = time.perf_counter()
+        self.window, self.pending = self.main_wrapper, False
+        self.window_registry.refresh()
+        self.state = initial_state if initial_state is not None else self.identify()
+        report = {"status": "ok", "initial_state": self.state, "steps": []}
+        trace = []
+        for position, step in enumerate(plan):
+            record = {"step": position, "action": step["action"], "state": self.state}
+            report["steps"].append(record)
+            step_start = time.perf_counter()
+            try:
+                self.run_step(step, record, last=position == len(plan) - 1)
+            except Exception as e:
+                logger.error(f"Step {position} ({step['action']}) failed: {e}")
+                report.update({"status": "failed", "failed_step": position, "error": str(e)})
+                break
+            finally:
+                record["total_ms"] = round(1000 * (time.perf_counter() - step_start), 2)
+            if step["action"] != "assert_state":
+                trace.append({"Action": "input" if step["action"] == "input" else "click",
+                              "Control_Identifier": record.get("identifier"), "Input": step.get("text", "null"),
+                              "State": record["state"], "New_State": self.state})
+        report.update({"final_state": self.state, "seconds": round(time.perf_counter() - start, 3),
+                       "settle": self.settle.summary()})
+        if trace_path:
+            os.makedirs(os.path.dirname(os.path.abspath(trace_path)), exist_ok=True)
+            with open(trace_path, "w", encoding="utf-8") as f:
+                yaml.safe_dump(trace, f, allow_unicode=True)
+        logger.info(f"Plan {report['status']} in {report['seconds']}s: {len(report['steps'])}/{len(plan)} steps")
+        return report
+
+    def run_step(self, step: dict, record: dict, last: bool = False):
+        action = step["action"]
+        expect = step.get("expect")
+        if action != "assert_state":
+            clock = time.perf_counter()
+            target, identifier = self.locate(step)
+            record["identifier"] = identifier
+            record["locate_ms"] = round(1000 * (time.perf_counter() - clock), 2)
+            content = step["text"] if action == "input" else "null"
+            if expect is None and self.state is not None:
+                expect = self.transitions.get((self.state, identifier, "input" if action == "input" else "click", content))
+            clock = time.perf_counter()
+            if not self.pending:
+                self.window_registry.begin_action((self.state, identifier, action, content))
+            if action == "input":
+                target.type_keys(CLEAR_KEYS + content, with_spaces=True)
+            else:
+                target.click_input()
+            self.pending = True
+            record["act_ms"] = round(1000 * (time.perf_counter() - clock), 2)
+            if not step.get("wait", last or expect is None or expect != self.state):
+                record["expect"] = expect
+                return   # 界面结构不变，与后续动作一起等待
+        fingerprint = None
+        if self.pending:
+            clock = time.perf_counter()
+            fingerprint = self.wait_for_settle(expect)
+            record["settle_ms"] = round(1000 * (time.perf_counter() - clock), 2)
+        record["expect"] = expect
+        if expect is None:
+            self.state = None      # 结果未知，之后的控件不再以状态为 scope 缓存
+            self.locators.invalidate(None)
+            return
+        if fingerprint is None:
+            clock = time.perf_counter()
+            fingerprint = live_state_fingerprint(self.window, policy=self.capture_policy)
+            record["verify_ms"] = round(1000 * (time.perf_counter() - clock), 2)
+        if fingerprint != self.fingerprints.get(expect):
+            self.state = self.fingerprint_states.get(fingerprint)
+            raise RuntimeError(f"Expected state {expect}, reached {'unknown state' if self.state is None else f'state {self.state}'}")
+        self.state = expect
+
+    def locate(self, step: dict) -> tuple:
+        """定位步骤的目标控件，返回 (实时控件, 控件标识)；select 步骤返回列表中标题匹配的条目"""
+        if "control" in step:
+            reference = self.states.get(self.state) if self.state is not None else None
+            target = self.locators.resolve(step["control"], self.window, scope=self.state, reference=reference)
+            identifier = step["control"]
+        else:
+            snapshot, identifier = find_control(self.window, step["find"])
+            target = snapshot.wrapper
+        if step["action"] != "select":
+            return target, identifier
+        scroller = ListScroller(target)
+        for item in scroller.iter_new_items():
+            if re.search(step["match"], item.window_text()):
+                attrs = node_attrs(item)
+                item_identifier = identifier + child_step(attrs, 0) if identity(attrs) is not None else None
+                return item.wrapper, item_identifier
+        raise LookupError(f"No item matching {step['match']!r} in {identifier}")
+
+    def wait_for_settle(self, expect: int = None):
+        """
+        等待界面稳定并切换到动作打开的新窗口 (当前窗口被关闭时回到主窗口)。
+        有期望状态时以实时结构指纹采样，到达期望状态即返回，等待与校验共用同一次读取，返回最后一次采样的指纹；
+        否则按顶层窗口集合与子树指纹等待，返回 None
+        """
+        target = self.fingerprints.get(expect) if expect is not None else None
+        if target is None:
+            self.settle.wait(lambda: window_fingerprint(self.window, self.window_registry.list_windows))
+            fingerprint = None
+        else:
+            def sample():
+                windows = set(self.window_registry.list_windows())
+                self.follow_windows(windows - self.window_registry.windows, self.window_registry.windows - windows)
+                return live_state_fingerprint(self.window, policy=self.capture_policy)
+            fingerprint, _ = self.settle.wait(sample, accept=lambda current: current == target)
+        self.follow_windows(*self.window_registry.end_action())
+        self.pending = False
+        return fingerprint
+
+    def follow_windows(self, new_handles: set, closed_handles: set):
+        """动作打开了唯一的新窗口时切换到该窗口，当前窗口被关闭时回到主窗口"""
+        handle = self.window.element_info.handle
+        if len(new_handles) == 1:
+            new_handle = next(iter(new_handles))
+            if new_handle != handle:
+                self.window = self.connect_window(new_handle)
+        elif handle in closed_handles:
+            self.window = self.main_wrapper
+
+
+############################### 性能测试 ###############################
+
+def scan_find(root_wrapper, criteria: dict, max_depth: int = FIND_DEPTH):
+    """
+    child_window(**criteria).wrapper_object() 的做法：广度优先遍历子树，逐个控件读取类型与条件中的属性进行比较
+    """
+    readers = {"tag": lambda ctrl: ctrl.friendly_class_name(), "auto_id": lambda ctrl: ctrl.element_info.automation_id,
+               "title": lambda ctrl: ctrl.window_text(), "name": lambda ctrl: ctrl.element_info.name,
+               "class_name": lambda ctrl: ctrl.element_info.class_name,
+               "title_re": lambda ctrl: ctrl.window_text()}
+    level = [root_wrapper]
+    for _ in range(max_depth):
+        level = [child for ctrl in level for child in ctrl.children()]
+        for ctrl in level:
+            if all(re.search(value, readers[key](ctrl)) if key == "title_re" else readers[key](ctrl) == value
+                   for key, value in criteria.items()):
+                return ctrl
+        if not level:
+            break
+    raise LookupError(f"No control matches {criteria}")
+
+def run_script_style(main_wrapper, plan: list, output_dir: str, list_windows, connect_window, sleep: float = 1.0) -> float:
+    """
+    按 script/task*.py 的写法执行计划：child_window 式扫描定位，动作后固定 sleep，每一步之后导出完整的XML状态；
+    返回耗时 (秒)
+    """
+    from utils.gui_tree_exporter import export_gui_xml_structure
+    from utils.locator import Locator, scan_resolve
+
+    start = time.perf_counter()
+    window, windows = main_wrapper, set(list_windows())
+    export_gui_xml_structure(window, output_dir, 0)
+    for position, step in enumerate(plan):
+        if "control" in step:
+            target = scan_resolve(window, Locator(step["control"]))
+        else:
+            target = scan_find(window, step["find"])
+        if step["action"] == "select":
+            target = next(item for item in target.children() if re.search(step["match"], item.window_text()))
+        if step["action"] == "input":
+            target.click_input()
+            target.type_keys(step["text"], with_spaces=True)
+        elif step["action"] != "assert_state":
+            target.click_input()
+        time.sleep(sleep)
+        current = set(list_windows())
+        if len(current - windows) == 1:
+            window = connect_window(next(iter(current - windows)))
+        windows = current
+        export_gui_xml_structure(window, output_dir, position + 1)
+    return time.perf_counter() - start
+
+def generate_task_utg(output_dir: str, base_dir: str = "doc/utg", contact: str = "ben") -> dict:
+    """
+    生成覆盖 script/ 中两个任务的回放目录：在 base_dir 的探索结果上补充探索中没有记录的页面，
+    即与文件传输助手/contact 的聊天页面 (聊天输入框、发送与聊天记录按钮) 和聊天记录窗口，
+    以及搜索结果条目、会话列表条目、聊天记录按钮的跳转；返回 {页面名: 状态编号}
+    """
+    import copy
+
+    from utils.gui_tree_exporter import indent_xml
+    from utils.journal import write_utg_yaml
+    from utils.replay import ReplayRect, assign_xpaths
+
+    os.makedirs(output_dir, exist_ok=True)
+    states = load_states(base_dir)
+    with open(os.path.join(base_dir, "UTG.yaml"), encoding="utf-8") as f:
+        transitions = [t for t in (yaml.safe_load(f) or {}).get("transitions") or [] if t["State"] in states]
+    main, search = states[0], states[15]
+    window = ReplayRect.parse(main.attrib.get("rect"))
+
+    def element(tag: str, parent: ET.Element = None, **attrs) -> ET.Element:
+        attrs = dict({"title": "", "name": "", "class_name": "", "auto_id": "", "handle": "None", "rect": str(window),
+                      "depth": "1", "path": ""}, **attrs)
+        return ET.SubElement(parent, tag, attrs) if parent is not None else ET.Element(tag, attrs)
+
+    def chat_page(title: str) -> ET.Element:
+        root = copy.deepcopy(main)
+        panel = element("GroupBox", root, class_name="mmui::ChatMasterView", title=title)
+        element("Button", panel, title="聊天记录", name="聊天记录", class_name="mmui::XButton", depth="2")
+        element("Edit", panel, auto_id="chat_input_field", class_name="mmui::ChatInputField", depth="2")
+        element("Button", panel, title="发送(S)", name="发送(S)", class_name="mmui::XOutlineButton", depth="2")
+        return root
+
+    sessions = next(elem for elem in main.iter("ListBox") if elem.attrib.get("auto_id") == "session_list")
+    list(sessions)[-1].attrib["title"] = f"{contact} Hello, {contact} 10:02"
+    history = element("Dialog", title=f"与“{contact}”的聊天记录", class_name="mmui::ChatHistoryWindow", handle="7000001",
+                      depth="0")
+    group = element("GroupBox", history, class_name="mmui::XView")
+    element("Edit", group, name="搜索", class_name="mmui::XValidatorTextEdit", depth="2")
+    results = element("ListBox", group, auto_id="history_list", class_name="mmui::XTableView", depth="2")
+    element("ListItem", results, title=f"{contact}: Hello, {contact}", class_name="mmui::XTableCell", depth="3")
+
+    pages = {"main": 0, "search": 15}
+    for offset, (name, root) in enumerate([("chat_file_transfer", chat_page("文件传输助手")),
+                                           ("chat_contact", chat_page(contact)), ("history", history)]):
+        pages[name] = max(states) + 1
+        states[pages[name]] = root
+
+    def xpath(state_num: int, predicate) -> str:
+        xpaths = assign_xpaths(states[state_num])
+        return next(path for elem, path in xpaths.items() if predicate(elem))
+
+    def add(state_num: int, predicate, target: int, action: str = "click", content: str = "null"):
+        transitions.append({"Action": action, "Content": content, "Control_Identifier": xpath(state_num, predicate),
+                            "State": state_num, "New_State_Num": target})
+
+    chat_input = lambda elem: elem.attrib.get("auto_id") == "chat_input_field"
+    add(pages["search"], lambda elem: elem.tag == "ListItem" and elem.attrib.get("title") == "文件传输助手",
+        pages["chat_file_transfer"])
+    add(pages["chat_file_transfer"], chat_input, pages["chat_file_transfer"], "input",
+        "Hello, this is a test message from the automation script!")
+    add(pages["chat_file_transfer"], lambda elem: elem.attrib.get("title") == "发送(S)", pages["chat_file_transfer"])
+    add(pages["main"], lambda elem: elem.attrib.get("auto_id") == "session_item", pages["chat_contact"])
+    add(pages["chat_contact"], lambda elem: elem.attrib.get("title") == "聊天记录", pages["history"])
+    add(pages["history"], lambda elem: elem.tag == "Edit", pages["history"], "input", f"Hello, {contact}")
+    for state_num, root in states.items():
+        indent_xml(root)
+        ET.ElementTree(root).write(os.path.join(output_dir, f"state{state_num}.xml"), encoding="utf-8",
+                                   xml_declaration=True)
+    write_utg_yaml(os.path.join(output_dir, "UTG.yaml"), transitions)
+    return pages
+
+def benchmark_tasks(plan_paths=("script/task1.yaml", "script/task2.yaml"), appdoc_path: str = "doc/appdoc.yaml",
+                    latency: float = 0.0005, action_latency: float = 0.2, script_sleep: float = 1.0) -> dict:
+    """
+    在回放后端上端到端执行任务计划，比较手写脚本的做法 (子树扫描定位 + 固定 sleep + 每步导出XML，另给出不计 sleep 的耗时)
+    与 PlanRunner (逐层定位 + 稳定检测 + 指纹校验) 的耗时；latency 为模拟的每次UIA调用耗时，action_latency 为应用的响应时间
+    """
+    import tempfile
+
+    from utils.replay import ReplayApp, ReplayBackend
+
+    results = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        utg_dir = os.path.join(work_dir, "utg")
+        generate_task_utg(utg_dir)
+        for plan_path in plan_paths:
+            plan = load_plan(plan_path, appdoc_path)
+            name = os.path.splitext(os.path.basename(plan_path))[0]
+            measured = {"steps": len(plan)}
+            for sleep in (script_sleep, 0.0):
+                backend = ReplayBackend(latency=latency)
+                app = ReplayApp(utg_dir, backend=backend, action_latency=action_latency)
+                list_windows = lambda: app.desktop.find_windows(process=app.process_id)
+                seconds = run_script_style(app.window, plan, os.path.join(work_dir, f"{name}_{sleep}"),
+                                           list_windows, app.desktop.window, sleep=sleep)
+                key = "script" if sleep else "script_no_sleep"
+                measured.update({f"{key}_s": round(seconds, 3), f"{key}_calls": backend.total_calls})
+            backend = ReplayBackend(latency=latency)
+            app = ReplayApp(utg_dir, backend=backend, action_latency=action_latency)
+            runner = PlanRunner(app.window, utg_dir, list_windows=lambda: app.desktop.find_windows(process=app.process_id),
+                                connect_window=app.desktop.window)
+            backend.reset()
+            report = runner.run(plan)
+            measured.update({"runner_s": report["seconds"], "runner_calls": backend.total_calls,
+                             "runner_status": report["status"], "final_state": report["final_state"],
+                             "step_ms": [record["total_ms"] for record in report["steps"]]})
+            results[name] = measured
+    logger.info(f"Task benchmark: {results}")
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from utils.connector import get_wrapper_object, weixin_title
+
+    parser = argparse.ArgumentParser(description="执行任务计划")
+    parser.add_argument("plan", nargs="?", help="计划文件 (YAML)，不指定时在回放后端上运行性能测试")
+    parser.add_argument("--appdoc", default="doc/appdoc.yaml")
+    parser.add_argument("--utg", default="doc/utg", help="用于校验状态与重新定位控件的探索结果目录")
+    parser.add_argument("--trace", help="执行轨迹的输出文件 (YAML)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.plan:
+        runner = PlanRunner(get_wrapper_object(weixin_title), args.utg)
+        print(runner.run(load_plan(args.plan, args.appdoc), trace_path=args.trace))
+    else:
+        print(benchmark_tasks())
@@ -0,0 +1,616 @@
+"""
+回放后端：用已导出的状态XML模拟 pywinauto UIAWrapper，
+可在没有微信/Windows的环境中复现探索、解析与滚动流程，并统计UIA调用次数与模拟调用延迟
+"""
+import copy
+import logging
+import os
+import random
+import threading
+import time
+import xml.etree.ElementTree as ET
+from collections import Counter, OrderedDict
+from types import SimpleNamespace
+
+import yaml
+
+from utils.capture_policy import OMITTED_TAG, omitted_count
+from utils.geometry import parse_rect
+from utils.state_store import load_states
+
+logger = logging.getLogger()
+
+CLEAR_KEYS = '^A{BACKSPACE}'  # 探索器输入前清空文本框的按键
+SYNTHETIC_BUTTON_SIZE = (120, 40)  # 合成页面面板中按钮的宽、高，依次排列在主窗口底部
+MAX_LIVE_TREES = 32           # ReplayApp 保留的最近构建的状态控件树数，模拟应用的内存不随访问过的状态数增长
+
+
+class ReplayRect:
+    """模拟 pywinauto 的 RECT，字符串形式与之一致: (L245, T61, R1675, B1018)"""
+    def __init__(self, left=0, top=0, right=0, bottom=0):
+        self.left, self.top, self.right, self.bottom = left, top, right, bottom
+
+    @classmethod
+    def parse(cls, text: str) -> "ReplayRect":
+        return cls(*parse_rect(text))
+
+    def width(self) -> int:
+        return self.right - self.left
+
+    def height(self) -> int:
+        return self.bottom - self.top
+
+    def __eq__(self, other):
+        return isinstance(other, ReplayRect) and \
+            (self.left, self.top, self.right, self.bottom) == (other.left, other.top, other.right, other.bottom)
+
+    def __hash__(self):
+        return hash((self.left, self.top, self.right, self.bottom))
+
+    def __str__(self):
+        return "(L%d, T%d, R%d, B%d)" % (self.left, self.top, self.right, self.bottom)
+
+    def __repr__(self):
+        return "<RECT L%d, T%d, R%d, B%d>" % (self.left, self.top, self.right, self.bottom)
+
+
+class ReplayBackend:
+    """
+    回放后端的调用统计与延迟模拟：每次模拟的跨进程UIA调用计数一次，并按 latency 秒休眠；
+    进程内的 win32 调用 (EnumWindows 等) 单独计入 win32_calls，按 win32_latency 秒休眠
+    """
+    thread_safe = True
+
+    def __init__(self, latency: float = 0.0, win32_latency: float = 0.0):
+        self.latency = latency
+        self.win32_latency = win32_latency
+        self.calls = Counter()
+        self.win32_calls = Counter()
+        self._lock = threading.Lock()
+
+    def call(self, name: str):
+        with self._lock:
+            self.calls[name] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def win32_call(self, name: str):
+        with self._lock:
+            self.win32_calls[name] += 1
+        if self.win32_latency:
+            time.sleep(self.win32_latency)
+
+    @property
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+    def reset(self):
+        with self._lock:
+            self.calls.clear()
+            self.win32_calls.clear()
+
+
+class ReplayElementInfo:
+    """模拟 UIAElementInfo，每次属性读取都计为一次UIA调用"""
+    def __init__(self, wrapper: "ReplayWrapper"):
+        self._wrapper = wrapper
+
+    def _get(self, name: str, value):
+        self._wrapper.backend.call(name)
+        return value
+
+    @property
+    def name(self):
+        return self._get("name", self._wrapper.props["name"])
+
+    @property
+    def class_name(self):
+        return self._get("class_name", self._wrapper.props["class_name"])
+
+    @property
+    def automation_id(self):
+        return self._get("automation_id", self._wrapper.props["auto_id"])
+
+    @property
+    def handle(self):
+        return self._get("handle", self._wrapper.props["handle"])
+
+    @property
+    def control_type(self):
+        return self._get("control_type", self._wrapper.props["control_type"])
+
+    @property
+    def process_id(self):
+        return self._get("process_id", self._wrapper.props.get("process_id", 0))
+
+    @property
+    def rectangle(self):
+        return self._get("rectangle", self._wrapper.props["rect"])
+
+    @property
+    def runtime_id(self):
+        return self._get("runtime_id", (id(self._wrapper),))
+
+
+class ReplayWrapper:
+    """
+    模拟 UIAWrapper：属性来自状态XML中的一个节点，children()/parent() 按XML结构返回，
+    交互操作 (click_input/type_keys) 只计数，由上层回放逻辑决定界面如何变化
+    """
+    def __init__(self, props: dict, backend: ReplayBackend, parent: "ReplayWrapper" = None):
+        self.props = props
+        self.backend = backend
+        self._parent = parent
+        self._children = []
+        self.element_info = ReplayElementInfo(self)
+        self.typed_keys = []
+        self.app = None  # 所属的 ReplayApp，交互操作由其决定界面跳转
+
+    def __repr__(self):
+        return f"<ReplayWrapper {self.props['friendly_class_name']} '{self.props['title']}'>"
+
+    def __eq__(self, other):
+        """与 pywinauto 一致，按 runtime_id 比较，每次比较读取双方的 runtime_id"""
+        if not isinstance(other, ReplayWrapper):
+            return False
+        return self.element_info.runtime_id == other.element_info.runtime_id
+
+    def __hash__(self):
+        return hash(self.element_info.runtime_id)
+
+    def window_text(self) -> str:
+        self.backend.call("window_text")
+        return self.props["title"]
+
+    def friendly_class_name(self) -> str:
+        self.backend.call("friendly_class_name")
+        return self.props["friendly_class_name"]
+
+    def class_name(self) -> str:
+        self.backend.call("class_name")
+        return self.props["class_name"]
+
+    def automation_id(self) -> str:
+        self.backend.call("automation_id")
+        return self.props["auto_id"]
+
+    def rectangle(self) -> ReplayRect:
+        self.backend.call("rectangle")
+        return self.props["rect"]
+
+    def children(self) -> list:
+        self.backend.call("children")
+        return self._live_children()
+
+    def _live_children(self) -> list:
+        """当前的子控件 (不计调用)，children() 与 build_cache() 共用"""
+        return list(self._children)
+
+    def cached_props(self) -> dict:
+        """批量读取时返回的属性 (不计调用)"""
+        return dict(self.props)
+
+    def build_cache(self, scope: str = "children") -> list:
+        """
+        模拟 UIA CacheRequest (BuildUpdatedCache/FindAllBuildCache)：一次调用取回 scope 内每个控件的全部属性，
+        scope 为 "element" (自身) 或 "children" (全部子控件)，返回 [(属性, 控件), ...]
+        """
+        self.backend.call("build_cache")
+        targets = [self] if scope == "element" else self._live_children()
+        return [(target.cached_props(), target) for target in targets]
+
+    def parent(self):
+        self.backend.call("parent")
+        return self._parent
+
+    def descendants(self) -> list:
+        self.backend.call("descendants")
+        result = []
+        stack = list(reversed(self._children))
+        while stack:
+            node = stack.pop()
+            result.append(node)
+            stack.extend(reversed(node._children))
+        return result
+
+    def is_visible(self) -> bool:
+        self.backend.call("is_visible")
+        return True
+
+    def set_focus(self):
+        self.backend.call("set_focus")
+        return self
+
+    def restore(self):
+        self.backend.call("restore")
+        return self
+
+    def close(self):
+        self.backend.call("close")
+        if self.app is not None:
+            self.app.handle_close(self)
+
+    def click_input(self, *args, **kwargs):
+        self.backend.call("click_input")
+        if self.app is not None:
+            self.app.handle_action(self, "click", "null")
+
+    def type_keys(self, keys: str, *args, **kwargs):
+        self.backend.call("type_keys")
+        self.typed_keys.append(keys)
+        if self.app is not None:
+            content = keys[len(CLEAR_KEYS):] if keys.startswith(CLEAR_KEYS) else keys
+            if content:
+                self.app.handle_action(self, "input", content)
+        return self
+
+
+def parse_props(elem: ET.Element) -> dict:
+    """将状态XML节点的属性转换为回放控件属性"""
+    handle = elem.attrib.get("handle", "None")
+    return {
+        "friendly_class_name": elem.tag,
+        "control_type": elem.tag,
+        "title": elem.attrib.get("title", ""),
+        "name": elem.attrib.get("name", ""),
+        "class_name": elem.attrib.get("class_name", ""),
+        "auto_id": elem.attrib.get("auto_id", ""),
+        "handle": int(handle) if handle.isdigit() else None,
+        "rect": ReplayRect.parse(elem.attrib.get("rect", "")),
+    }
+
+def child_elements(elem: ET.Element) -> list:
+    """状态XML的子元素；采集时被裁剪的占位元素展开为相应个数的空白控件，兄弟控件的下标与原界面一致"""
+    children = []
+    for child in elem:
+        if child.tag == OMITTED_TAG:
+            children.extend(ET.Element(child.attrib.get("tag", ""), {"class_name": child.attrib.get("class_name", "")})
+                            for _ in range(omitted_count(child)))
+        else:
+            children.append(child)
+    return children
+
+def wrapper_from_xml(source, backend: ReplayBackend = None) -> ReplayWrapper:
+    """由状态XML文件路径或根元素构建回放控件树，返回根控件"""
+    root = ET.parse(source).getroot() if isinstance(source, str) else source
+    backend = backend or ReplayBackend()
+
+    def build(elem: ET.Element, parent):
+        wrapper = ReplayWrapper(parse_props(elem), backend, parent)
+        wrapper._children = [build(child, wrapper) for child in child_elements(elem)]
+        return wrapper
+
+    return build(root, None)
+
+
+class VirtualListWrapper(ReplayWrapper):
+    """
+    模拟虚拟化列表控件 (如微信会话列表)：共有 len(items) 个条目，但 children() 只返回视口内的 page_size 个，
+    条目矩形随滚动位置变化；支持 {PGDN}/{PGUP}/{HOME}/{END}/{DOWN}/{UP} 按键。
+    supports_home=False 时 {HOME}/{END} 不生效，用于模拟不支持跳转的控件；
+    supports_scroll=False 时不提供 ScrollPattern (iface_scroll)
+    """
+    def __init__(self, items: list, page_size: int = 10, item_height: int = 60, backend: ReplayBackend = None,
+                 supports_home: bool = True, rect: ReplayRect = None, supports_scroll: bool = True):
+        backend = backend or ReplayBackend()
+        rect = rect or ReplayRect(0, 0, 300, page_size * item_height)
+        super().__init__({
+            "friendly_class_name": "ListBox", "control_type": "List", "title": "", "name": "",
+            "class_name": "mmui::XTableView", "auto_id": "", "handle": None, "rect": rect,
+        }, backend)
+        self.items = list(items)
+        self.page_size = page_size
+        self.item_height = item_height
+        self.supports_home = supports_home
+        self.supports_scroll = supports_scroll
+        self.top_index = 0
+
+    @property
+    def max_top_index(self) -> int:
+        return max(0, len(self.items) - self.page_size)
+
+    @property
+    def iface_scroll(self):
+        """模拟 UIA ScrollPattern：垂直滚动百分比与视口占内容的百分比，无法滚动时为 -1 (UIA_ScrollPatternNoScroll)"""
+        if not self.supports_scroll:
+            raise AttributeError("ScrollPattern is not supported")
+        self.backend.call("scroll_pattern")
+        if not self.max_top_index:
+            return SimpleNamespace(CurrentVerticalScrollPercent=-1.0, CurrentVerticalViewSize=100.0)
+        return SimpleNamespace(CurrentVerticalScrollPercent=100.0 * self.top_index / self.max_top_index,
+                               CurrentVerticalViewSize=100.0 * self.page_size / len(self.items))
+
+    def _live_children(self) -> list:
+        rect = self.props["rect"]
+        visible = []
+        for offset, title in enumerate(self.items[self.top_index:self.top_index + self.page_size]):
+            top = rect.top + offset * self.item_height
+            visible.append(ReplayWrapper({
+                "friendly_class_name": "ListItem", "control_type": "ListItem", "title": title, "name": title,
+                "class_name": "mmui::ChatSessionCell", "auto_id": "", "handle": None,
+                "rect": ReplayRect(rect.left, top, rect.right, top + self.item_height),
+            }, self.backend, self))
+        return visible
+
+    def type_keys(self, keys: str, *args, **kwargs):
+        super().type_keys(keys)
+        moves = {
+            "{PGDN}": self.page_size, "{PGUP}": -self.page_size, "{DOWN}": 1, "{UP}": -1,
+        }
+        if keys in moves:
+            self.top_index = min(self.max_top_index, max(0, self.top_index + moves[keys]))
+        elif keys == "{HOME}" and self.supports_home:
+            self.top_index = 0
+        elif keys == "{END}" and self.supports_home:
+            self.top_index = self.max_top_index
+        return self
+
+
+class ScriptedWindow(ReplayWrapper):
+    """
+    按脚本延迟变化的模拟窗口：schedule([(延迟秒数, 根控件), ...]) 之后，
+    窗口内容在对应时间点依次切换为各阶段根控件的子树，用于测试界面稳定检测
+    """
+    def __init__(self, root: ReplayWrapper):
+        super().__init__(dict(root.props), root.backend)
+        self._stages = [(0.0, root)]
+        self._started = time.perf_counter()
+
+    def schedule(self, stages: list):
+        """从当前时刻开始按 [(delay, root), ...] 切换界面内容"""
+        self._stages = [(0.0, self.current_root())] + sorted(stages, key=lambda stage: stage[0])
+        self._started = time.perf_counter()
+
+    def current_root(self) -> ReplayWrapper:
+        elapsed = time.perf_counter() - self._started
+        current = self._stages[0][1]
+        for delay, root in self._stages:
+            if elapsed >= delay:
+                current = root
+        return current
+
+    def _live_children(self) -> list:
+        return list(self.current_root()._children)
+
+    def rectangle(self) -> ReplayRect:
+        self.backend.call("rectangle")
+        return self.current_root().props["rect"]
+
+    def cached_props(self) -> dict:
+        return dict(self.props, rect=self.current_root().props["rect"])
+
+
+class ReplayDesktop:
+    """
+    模拟桌面：包含若干属于不同进程的顶层窗口。
+    windows() 对应 Desktop(backend="uia").windows()，经由UIA跨进程枚举；
+    find_windows() 对应 findwindows.find_windows(process=...)，只使用进程内的 win32 调用
+    """
+    def __init__(self, backend: ReplayBackend = None):
+        self.backend = backend or ReplayBackend()
+        self._windows = {}  # handle -> ReplayWrapper
+        self._next_handle = 0x10000
+
+    def open_window(self, process_id: int, root: ReplayWrapper = None, title: str = "") -> int:
+        """打开一个顶层窗口，返回句柄"""
+        props = dict(root.props) if root is not None else {
+            "friendly_class_name": "Dialog", "control_type": "Window", "title": title, "name": title,
+            "class_name": "", "auto_id": "", "rect": ReplayRect(),
+        }
+        window = ReplayWrapper(props, self.backend)
+        if root is not None:
+            window._children = root._children
+        return self.add_window(process_id, window)
+
+    def add_window(self, process_id: int, window: ReplayWrapper) -> int:
+        """将已构建的窗口控件登记为顶层窗口，分配句柄并返回"""
+        self._next_handle += 2
+        handle = self._next_handle
+        window.props.update({"handle": handle, "process_id": process_id})
+        self._windows[handle] = window
+        return handle
+
+    def close_window(self, handle: int):
+        self._windows.pop(handle, None)
+
+    def window(self, handle: int) -> ReplayWrapper:
+        return self._windows[handle]
+
+    def windows(self) -> list:
+        """UIA 枚举桌面的所有顶层窗口（每个窗口的包装对象构造需要读取一次控件类型）"""
+        self.backend.call("FindAll")
+        windows = list(self._windows.values())  # 多个应用实例可能在其他线程中同时开关窗口
+        for window in windows:
+            self.backend.call("control_type")
+        return windows
+
+    def find_windows(self, process: int = None, top_level_only: bool = True) -> list:
+        """win32 EnumWindows + GetWindowThreadProcessId 按进程过滤"""
+        self.backend.win32_call("EnumWindows")
+        handles = []
+        for handle, window in list(self._windows.items()):
+            self.backend.win32_call("GetWindowThreadProcessId")
+            if process is None or window.props["process_id"] == process:
+                handles.append(handle)
+        return handles
+
+
+def assign_xpaths(root: ET.Element) -> dict:
+    """按探索器的控件标识规则 (auto_id/title/name 谓词，否则为同类型兄弟中的下标) 计算每个元素的绝对XPath"""
+    xpaths = {root: f"/{root.tag}"}
+    stack = [root]
+    while stack:
+        elem = stack.pop()
+        tag_counts = {}
+        for child in child_elements(elem):
+            tag_index = tag_counts.get(child.tag, 0)
+            tag_counts[child.tag] = tag_index + 1
+            predicate = None
+            for attr in ("auto_id", "title", "name"):
+                val = child.attrib.get(attr, "")
+                if val:
+                    predicate = '@%s="%s"' % (attr, val.replace('"', '\\"'))
+                    break
+            xpaths[child] = xpaths[elem] + (f"/{child.tag}[{predicate}]" if predicate else f"/{child.tag}[{tag_index}]")
+            stack.append(child)
+    return xpaths
+
+
+class ReplayAppWindow(ReplayWrapper):
+    """ReplayApp 的主窗口：内容随应用当前的主界面状态切换"""
+    def __init__(self, app: "ReplayApp"):
+        super().__init__(parse_props(app.states[app.main_state]), app.backend)
+        self.app = app
+
+    def window_text(self) -> str:
+        self.backend.call("window_text")
+        return self.app.states[self.app.main_state].attrib.get("title", "")
+
+    def rectangle(self) -> ReplayRect:
+        self.backend.call("rectangle")
+        return ReplayRect.parse(self.app.states[self.app.main_state].attrib.get("rect", ""))
+
+    def _live_children(self) -> list:
+        return self.app.state_children(self.app.main_state, self)
+
+    def cached_props(self) -> dict:
+        root = self.app.states[self.app.main_state]
+        return dict(self.props, title=root.attrib.get("title", ""), rect=ReplayRect.parse(root.attrib.get("rect", "")))
+
+
+class ReplayApp:
+    """
+    由探索结果目录 (stateN.xml + UTG.yaml) 构建的模拟应用：
+    - 主窗口的内容随 UTG 中记录的跳转切换
+    - 目标状态的根窗口句柄与主窗口不同时，作为同进程的新顶层窗口弹出，close() 后关闭
+    - UTG 中没有记录的动作不改变界面
+    actions 统计执行过的交互次数，action_latency 模拟每次交互后应用的响应时间
+    """
+    def __init__(self, utg_dir: str, backend: ReplayBackend = None, desktop: ReplayDesktop = None,
+                 process_id: int = 4242, initial_state: int = 0, action_latency: float = 0.0):
+        self.backend = backend or ReplayBackend()
+        self.desktop = desktop or ReplayDesktop(self.backend)
+        self.process_id = process_id
+        self.action_latency = action_latency
+        self.states = load_states(utg_dir)  # 完整XML或差量存储的状态
+        with open(os.path.join(utg_dir, "UTG.yaml"), encoding="utf-8") as f:
+            utg = yaml.safe_load(f) or {}
+        self.transitions = {
+            (t["State"], t["Control_Identifier"], t["Action"], str(t["Content"])): t["New_State_Num"]
+            for t in utg.get("transitions") or []
+        }
+        self.initial_state = initial_state
+        self.main_state = initial_state
+        self._main_handle_attr = self.states[initial_state].attrib.get("handle")
+        self._trees = OrderedDict()  # (state_num, id(window)) -> 该窗口下的状态控件树，只保留最近的 MAX_LIVE_TREES 个
+        self.popups = {}    # handle -> state_num
+        self.actions = 0
+        self.window = ReplayAppWindow(self)
+        self.main_handle = self.desktop.add_window(process_id, self.window)
+
+    def is_main_state(self, state_num: int) -> bool:
+        return self.states[state_num].attrib.get("handle") == self._main_handle_attr
+
+    def current_state(self) -> int:
+        """当前前台界面对应的状态：最近弹出的窗口，否则为主窗口状态"""
+        return next(reversed(self.popups.values())) if self.popups else self.main_state
+
+    def state_children(self, state_num: int, window: ReplayWrapper) -> list:
+        """构建 (并缓存) 某状态在指定窗口下的子控件"""
+        key = (state_num, id(window))
+        if key in self._trees:
+            self._trees.move_to_end(key)
+        else:
+            root = self.states[state_num]
+            xpaths = assign_xpaths(root)
+
+            def build(elem: ET.Element, parent):
+                wrapper = ReplayWrapper(parse_props(elem), self.backend, parent)
+                wrapper.props.update({"state": state_num, "xpath": xpaths[elem], "process_id": self.process_id})
+                wrapper.app = self
+                wrapper._children = [build(child, wrapper) for child in child_elements(elem)]
+                return wrapper
+
+            self._trees[key] = [build(child, window) for child in child_elements(root)]
+            if len(self._trees) > MAX_LIVE_TREES:
+                self._trees.popitem(last=False)
+        return list(self._trees[key])
+
+    def handle_action(self, wrapper: ReplayWrapper, action: str, content: str):
+        self.actions += 1
+        if self.action_latency:
+            time.sleep(self.action_latency)
+        target = self.transitions.get((wrapper.props.get("state"), wrapper.props.get("xpath"), action, content))
+        if target is None or target not in self.states:
+            return
+        if self.is_main_state(target):
+            self.main_state = target
+        elif target not in self.popups.values():
+            popup = ReplayWrapper(parse_props(self.states[target]), self.backend)
+            popup.app = self
+            popup._children = self.state_children(target, popup)
+            self.popups[self.desktop.add_window(self.process_id, popup)] = target
+
+    def handle_close(self, wrapper: ReplayWrapper):
+        handle = wrapper.props.get("handle")
+        if handle in self.popups:
+            self.popups.pop(handle)
+            self.desktop.close_window(handle)
+
+    def reset(self):
+        """重启应用：关闭所有弹出窗口并回到初始状态"""
+        for handle in list(self.popups):
+            self.desktop.close_window(handle)
+        self.popups.clear()
+        self.main_state = self.initial_state
+
+
+def generate_synthetic_utg(output_dir: str, n_states: int = 200, fanout: int = 4, cross_edges: float = 0.2,
+                           seed: int = 0, base_xml: str = "doc/utg/state0.xml") -> str:
+    """
+    生成合成的探索结果目录，用于在回放后端上评估大规模、深层界面的探索：
+    每个状态为 base_xml 的主界面加上一个结构唯一的页面面板 (位于主窗口底部)，面板中有 fanout 个入口按钮和一个返回按钮；
+    入口按钮按完全 fanout 叉树指向子页面 (超出 n_states 时按 cross_edges 概率随机指向已有页面)，返回按钮指向父页面
+    """
+    rng = random.Random(seed)
+    os.makedirs(output_dir, exist_ok=True)
+    base = ET.parse(base_xml).getroot()
+    window = ReplayRect.parse(base.attrib.get("rect"))
+    transitions = []
+
+    def button(title: str, class_name: str, depth: int, position: int) -> ET.Element:
+        left = window.left + position * SYNTHETIC_BUTTON_SIZE[0]
+        rect = ReplayRect(left, window.bottom - SYNTHETIC_BUTTON_SIZE[1], left + SYNTHETIC_BUTTON_SIZE[0], window.bottom)
+        return ET.Element("Button", {"title": title, "name": title, "class_name": class_name, "auto_id": "",
+                                     "handle": "None", "rect": str(rect), "depth": str(depth), "path": ""})
+
+    for state_num in range(n_states):
+        root = copy.deepcopy(base)
+        panel = ET.SubElement(root, "GroupBox", {"title": "", "name": "", "class_name": f"synthetic::Page{state_num}",
+                                                 "auto_id": "", "handle": "None",
+                                                 "rect": str(ReplayRect(window.left, window.bottom - SYNTHETIC_BUTTON_SIZE[1],
+                                                                        window.right, window.bottom)),
+                                                 "depth": "1", "path": ""})
+        targets = {}
+        for j in range(fanout):
+            title = f"页面{state_num}-入口{j}"
+            panel.append(button(title, f"synthetic::Entry{j}", 2, j))  # 类名各不相同，不会被归为动态控件组
+            child = state_num * fanout + j + 1
+            if child < n_states:
+                targets[title] = child
+            elif rng.random() < cross_edges:
+                targets[title] = rng.randrange(n_states)
+        if state_num:
+            panel.append(button("返回", "synthetic::Back", 2, fanout))
+            targets["返回"] = (state_num - 1) // fanout
+        xpaths = assign_xpaths(root)
+        for elem in panel:
+            target = targets.get(elem.attrib["title"])
+            if target is not None and target != state_num:
+                transitions.append({"Action": "click", "Content": "null", "Control_Identifier": xpaths[elem],
+                                    "State": state_num, "New_State_Num": target})
+        ET.ElementTree(root).write(os.path.join(output_dir, f"state{state_num}.xml"), encoding="utf-8",
+                                   xml_declaration=True)
+    with open(os.path.join(output_dir, "UTG.yaml"), "w", encoding="utf-8") as f:
+        yaml.safe_dump({"transitions": transitions}, f, allow_unicode=True)
+    return output_dir
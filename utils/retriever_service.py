@@ -0,0 +1,223 @@
+import argparse
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from langchain_core.embeddings import Embeddings
+from utils.data_proc import EMBEDDING_MODEL, EVAL_QUERIES, LazyHuggingFaceEmbeddings, open_vector_store
+
+logger = logging.getLogger()
+
+_shared_embeddings = {}  # model_name -> 已加载的嵌入模型，进程内复用
+_shared_lock = threading.Lock()
+
+def get_shared_embeddings(model_name: str = EMBEDDING_MODEL) -> Embeddings:
+    """获取进程内共享的嵌入模型，首次调用时加载，之后一直保持常驻"""
+    with _shared_lock:
+        if model_name not in _shared_embeddings:
+            embeddings = LazyHuggingFaceEmbeddings(model_name)
+            embeddings.embed_query("warm up")  # 立即加载模型，避免首个查询承担加载时间
+            _shared_embeddings[model_name] = embeddings
+        return _shared_embeddings[model_name]
+
+
+class KnowledgeRetriever:
+    """
+    常驻检索器：
+    - 打开已持久化的向量库，不重新建库
+    - 嵌入模型只加载一次并保持常驻
+    - 并发查询的向量计算在 batch_window 时间窗内合批，一次调用模型完成
+    - 最近查询的向量保存在 LRU 缓存中
+    """
+    def __init__(self, persist_directory: str = './knowledge_base', backend: str = 'chroma', k: int = 4,
+                 embeddings: Embeddings = None, batch_window: float = 0.005, max_batch: int = 32,
+                 cache_size: int = 1024):
+        if not os.path.isdir(persist_directory):
+            raise FileNotFoundError(f"Knowledge base not found: {persist_directory}, "
+                                    f"build it with data_proc.load_documents_to_chroma first")
+        self.embeddings = embeddings or get_shared_embeddings()
+        self.db = open_vector_store(self.embeddings, persist_directory, backend)
+        self.k = k
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.cache_size = cache_size
+        self._cache = OrderedDict()  # query -> vector
+        self._cache_lock = threading.Lock()
+        self._queue = queue.Queue()
+        self.stats = {"queries": 0, "cache_hits": 0, "batches": 0, "embedded": 0}
+        self._worker = threading.Thread(target=self._batch_loop, name="query-embedder", daemon=True)
+        self._worker.start()
+
+    def _batch_loop(self):
+        """后台合批线程：取出第一个请求后，在 batch_window 内继续收集，最多 max_batch 个"""
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.perf_counter() + self.batch_window
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            texts = list(OrderedDict.fromkeys(text for text, _ in batch))  # 同一批内重复的查询只计算一次
+            try:
+                vectors = dict(zip(texts, self.embed_queries(texts)))
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            with self._cache_lock:
+                self.stats["batches"] += 1
+                self.stats["embedded"] += len(texts)
+            for text, future in batch:
+                future.set_result(vectors[text])
+
+    def embed_queries(self, texts: list) -> list:
+        """
+        按查询的编码方式批量计算向量 (E5 等模型的查询与文档编码方式不同，不能用 embed_documents)；
+        嵌入模型提供批量接口 embed_queries 时一次调用完成，否则逐个调用 embed_query
+        """
+        embed_queries = getattr(self.embeddings, "embed_queries", None)
+        if embed_queries is not None:
+            return embed_queries(texts)
+        return [self.embeddings.embed_query(text) for text in texts]
+
+    def get_stats(self) -> dict:
+        with self._cache_lock:
+            return dict(self.stats)
+
+    def embed_query(self, query: str) -> list:
+        """计算查询向量，优先命中LRU缓存，否则交给合批线程"""
+        with self._cache_lock:
+            self.stats["queries"] += 1
+            if query in self._cache:
+                self._cache.move_to_end(query)
+                self.stats["cache_hits"] += 1
+                return self._cache[query]
+        future = Future()
+        self._queue.put((query, future))
+        vector = future.result()
+        with self._cache_lock:
+            self._cache[query] = vector
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return vector
+
+    def invoke(self, query: str, k: int = None, filter: dict = None) -> list:
+        """检索与查询最相关的 k 个文档"""
+        vector = self.embed_query(query)
+        if filter:
+            return self.db.similarity_search_by_vector(vector, k=k or self.k, filter=filter)
+        return self.db.similarity_search_by_vector(vector, k=k or self.k)
+
+    def get_relevant_documents(self, query: str) -> list:
+        """兼容 LangChain retriever 的调用方式"""
+        return self.invoke(query)
+
+
+def benchmark_concurrent_queries(retriever: KnowledgeRetriever, queries: list = None, concurrency: int = 8,
+                                 rounds: int = 20) -> dict:
+    """
+    并发压测：concurrency 个线程共发起 len(queries) * rounds 次查询，统计 p50/p99 延迟
+    """
+    queries = queries or [query for query, _ in EVAL_QUERIES]
+    workload = [f"{query} #{i}" if i % 2 else query for i in range(rounds) for query in queries]  # 一半查询可命中缓存
+
+    def timed(query):
+        start = time.perf_counter()
+        retriever.invoke(query)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = sorted(executor.map(timed, workload))
+    elapsed = time.perf_counter() - start
+    result = {
+        "requests": len(workload),
+        "concurrency": concurrency,
+        "p50_ms": round(1000 * latencies[len(latencies) // 2], 2),
+        "p99_ms": round(1000 * latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))], 2),
+        "qps": round(len(workload) / elapsed, 1),
+        **retriever.get_stats(),
+    }
+    logger.info(f"Concurrent query benchmark: {result}")
+    return result
+
+
+def make_handler(retriever: KnowledgeRetriever):
+    """生成绑定了检索器的 HTTP 请求处理类"""
+    class RetrieverHandler(BaseHTTPRequestHandler):
+        def _send_json(self, status: int, data):
+            body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == '/health':
+                self._send_json(200, {"status": "ok", **retriever.get_stats()})
+            else:
+                self._send_json(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != '/query':
+                self._send_json(404, {"error": "not found"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b'{}')
+                if not isinstance(request, dict) or not isinstance(request.get("query"), str):
+                    raise ValueError('expected {"query": "...", "k": ..., "filter": {...}}')
+                if not isinstance(request.get("k"), (int, type(None))) or not isinstance(request.get("filter"), (dict, type(None))):
+                    raise ValueError('"k" must be an integer and "filter" an object')
+            except ValueError as e:  # 请求格式错误 (含 JSON 解析错误)
+                self._send_json(400, {"error": str(e)})
+                return
+            try:
+                docs = retriever.invoke(request["query"], k=request.get("k"), filter=request.get("filter"))
+            except Exception as e:  # 嵌入模型或向量库的错误
+                logger.exception(f"Query failed: {request['query']}")
+                self._send_json(500, {"error": str(e)})
+                return
+            self._send_json(200, [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in docs])
+
+        def log_message(self, format, *args):
+            logger.debug(f"{self.address_string()} {format % args}")
+
+    return RetrieverHandler
+
+def serve(retriever: KnowledgeRetriever, host: str = '127.0.0.1', port: int = 8765):
+    """启动本地检索服务：POST /query {"query": ..., "k": ..., "filter": {...}}，GET /health"""
+    server = ThreadingHTTPServer((host, port), make_handler(retriever))
+    logger.info(f"Retriever service listening on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="本地知识库检索服务")
+    parser.add_argument("--persist-directory", default="./knowledge_base")
+    parser.add_argument("--backend", default="chroma", choices=["chroma", "numpy"])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--benchmark", action="store_true", help="只运行并发压测，不启动服务")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    knowledge_retriever = KnowledgeRetriever(args.persist_directory, backend=args.backend)
+    if args.benchmark:
+        print(benchmark_concurrent_queries(knowledge_retriever))
+    else:
+        serve(knowledge_retriever, args.host, args.port)
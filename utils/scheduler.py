@@ -0,0 +1,141 @@
+import logging
+from collections import Counter, deque
+
+logger = logging.getLogger()
+
+NOVELTY_BONUS = 3   # 从未在任何状态执行过的控件动作，相当于节省的导航步数
+RESET_COST = 10     # 重启应用的代价，以动作步数计
+STEAL_COST = 2      # 并行探索时执行其他 worker 发现的状态中的动作 (工作窃取) 的额外代价
+
+
+def get_control_key(action_key: tuple) -> tuple:
+    """动作键 (状态, 控件标识, 动作, 内容) 去掉状态后的部分，用于识别跨状态重复出现的控件"""
+    return tuple(action_key[1:])
+
+
+class FrontierScheduler:
+    """
+    探索前沿调度器：维护所有 (状态, 未执行动作) 对与已知的跳转边，
+    每次选择 “导航代价 + 重复度” 最小的动作：
+    - 导航代价为沿已知跳转边从当前状态到达动作所在状态的最短步数，无法到达时加上重启代价 RESET_COST
+    - 控件动作从未在任何状态执行过时获得 NOVELTY_BONUS 奖励；
+      跨状态重复出现的控件 (如导航栏) 每在一个状态中执行过一次，代价加 1，从而延后执行
+    - 并行探索时 next_action 传入 worker：选出的动作被该 worker 认领，直到 record/release 之前不会再分给其他 worker；
+      其他 worker 发现的状态中的动作代价加 STEAL_COST，各 worker 优先探索自己发现的子图
+    - 经 defer 标记的动作 (结果已可由 OutcomeCache 预测) 在前沿中没有其他动作时才执行
+    """
+    def __init__(self, initial_state: int = 0, reset_cost: int = RESET_COST, novelty_bonus: int = NOVELTY_BONUS,
+                 steal_cost: int = STEAL_COST):
+        self.initial_state = initial_state
+        self.reset_cost = reset_cost
+        self.novelty_bonus = novelty_bonus
+        self.steal_cost = steal_cost
+        self.untried = {}            # state -> deque([action_key, ...])
+        self.edges = {}              # state -> {action_key: target_state}
+        self.control_counts = Counter()  # control_key -> 已在多少个状态中执行过
+        self.claimed = {}            # action_key -> 正在执行该动作的 worker
+        self.owners = {}             # state -> 发现该状态的 worker
+        self.deferred = set()        # 延后执行的 action_key
+
+    def add_state(self, state_num: int, action_keys: list, tried: dict = None, owner=None, predicted=()):
+        """
+        登记状态及其规划出的动作；tried 为已执行动作及其到达的状态 (从日志恢复时使用)，其中 predicted 中的动作结果是预测的；
+        owner 为发现该状态的 worker
+        """
+        tried = tried or {}
+        self.untried.setdefault(state_num, deque())
+        if owner is not None:
+            self.owners.setdefault(state_num, owner)
+        self.edges.setdefault(state_num, {})
+        for key in action_keys:
+            if key in tried:
+                self.record(key, tried[key], predicted=key in predicted)
+            else:
+                self.untried[state_num].append(key)
+
+    def record(self, action_key: tuple, target_state: int, predicted: bool = False):
+        """记录动作的执行结果；predicted 表示结果是预测的，未经验证的边不用于导航"""
+        state_num = action_key[0]
+        untried = self.untried.get(state_num)
+        if untried and action_key in untried:
+            untried.remove(action_key)
+        self.edges.setdefault(state_num, {})
+        if not predicted:
+            self.edges[state_num][action_key] = target_state
+        self.control_counts[get_control_key(action_key)] += 1
+        self.claimed.pop(action_key, None)
+        self.deferred.discard(action_key)
+
+    def defer(self, action_key: tuple) -> bool:
+        """将未执行的动作延后到前沿中其他动作之后，返回是否为新延后的动作"""
+        if action_key in self.deferred:
+            return False
+        self.deferred.add(action_key)
+        return True
+
+    def release(self, action_key: tuple):
+        """放弃已认领但未执行的动作 (例如未能导航到其所在状态)，使其可被重新选择"""
+        self.claimed.pop(action_key, None)
+
+    def release_worker(self, worker):
+        """释放某 worker 认领的全部动作 (worker 结束或崩溃时)"""
+        for action_key in [key for key, owner in self.claimed.items() if owner == worker]:
+            del self.claimed[action_key]
+
+    def drop_state(self, state_num: int):
+        """放弃某状态剩余的动作 (例如该状态已无法到达)"""
+        dropped = self.untried.pop(state_num, None)
+        if dropped:
+            for action_key in dropped:
+                self.claimed.pop(action_key, None)
+            logger.info(f"Drop {len(dropped)} untried actions of unreachable state {state_num}")
+
+    def pending(self) -> int:
+        return sum(len(keys) for keys in self.untried.values())
+
+    def shortest_paths(self, source: int) -> dict:
+        """从 source 出发沿已知跳转边的广度优先搜索，返回 state -> 动作键路径"""
+        paths = {source: []}
+        queue = deque([source])
+        while queue:
+            state_num = queue.popleft()
+            for key, target in self.edges.get(state_num, {}).items():
+                if target not in paths:
+                    paths[target] = paths[state_num] + [key]
+                    queue.append(target)
+        return paths
+
+    def next_action(self, current_state, worker=None) -> tuple:
+        """
+        选择下一个动作，返回 (动作键, 导航路径, 是否需要重启)；前沿中没有未被认领的动作时返回 None。
+        需要重启时导航路径从初始状态出发；传入 worker 时选出的动作由该 worker 认领
+        """
+        paths = self.shortest_paths(current_state) if current_state is not None else {}
+        reset_paths = None
+        best = None
+        for state_num in sorted(self.untried):
+            keys = [key for key in self.untried[state_num] if key not in self.claimed]
+            if not keys:
+                continue
+            if state_num in paths:
+                path, reset = paths[state_num], False
+                cost = len(path)
+            else:
+                if reset_paths is None:
+                    reset_paths = self.shortest_paths(self.initial_state)
+                if state_num not in reset_paths:
+                    continue
+                path, reset = reset_paths[state_num], True
+                cost = self.reset_cost + len(path)
+            if worker is not None and self.owners.get(state_num, worker) != worker:
+                cost += self.steal_cost
+            key = min(keys, key=lambda k: (k in self.deferred, self.control_counts[get_control_key(k)]))
+            seen = self.control_counts[get_control_key(key)]
+            score = (key in self.deferred, cost + (seen if seen else -self.novelty_bonus))
+            if best is None or score < best[0]:
+                best = (score, key, path, reset)
+        if best is None:
+            return None
+        if worker is not None:
+            self.claimed[best[1]] = worker
+        return best[1], best[2], best[3]
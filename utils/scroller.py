@@ -0,0 +1,128 @@
+import logging
+import time
+
+from utils.control_snapshot import fetch_children
+
+logger = logging.getLogger()
+
+EDGE_KEYS = {
+    "top": ("{HOME}", "{PGUP}"),     # (直接跳转键, 翻页键)
+    "bottom": ("{END}", "{PGDN}"),
+}
+
+
+def count_overlap(prev_ids: list, cur_ids: list) -> int:
+    """返回 prev_ids 的后缀与 cur_ids 的前缀最长重合的长度，用于定位滚动后新露出的条目"""
+    for size in range(min(len(prev_ids), len(cur_ids)), 0, -1):
+        if prev_ids[-size:] == cur_ids[:size]:
+            return size
+    return 0
+
+
+class ListScroller:
+    """
+    可滚动容器的自适应滚动器：
+    - 通过比较滚动位置与首/尾可见条目的标识判断是否已到达顶部/底部，不再盲目发送固定次数的翻页键
+    - 优先使用 {HOME}/{END} 直接跳转，控件不支持时退化为逐页滚动
+    - 向下滚动时只产出本次新露出的条目，已处理过的条目不再重复解析
+    控件支持 UIA ScrollPattern 时，由滚动百分比换算出视口首行的行号来确定新露出的条目，标题重复的条目不会被丢弃或重复；
+    不支持时退化为按标题对齐前后两页，此时连续两页标题完全相同会被当作已到达底部。
+    stats 记录按键次数、子节点读取次数、采集条目数与耗时
+    """
+    def __init__(self, list_ctrl, max_iter: int = 100):
+        self.list_ctrl = list_ctrl
+        self.max_iter = max_iter
+        self.stats = {"keystrokes": 0, "reads": 0, "items": 0, "seconds": 0.0}
+
+    def visible_items(self) -> list:
+        """读取当前可见的子项，返回 [(标识, 子控件), ...]"""
+        self.stats["reads"] += 1
+        return [(child.window_text(), child) for child in fetch_children(self.list_ctrl)]
+
+    def scroll_position(self):
+        """读取 ScrollPattern 的 (垂直滚动百分比, 视口占内容的百分比)，控件不支持或无法滚动时返回 None"""
+        try:
+            scroll = self.list_ctrl.iface_scroll
+            percent, view_size = scroll.CurrentVerticalScrollPercent, scroll.CurrentVerticalViewSize
+        except Exception:
+            return None
+        if percent < 0 or view_size <= 0:  # UIA_ScrollPatternNoScroll
+            return None
+        return percent, view_size
+
+    @staticmethod
+    def top_row(position: tuple, visible: int) -> int:
+        """由滚动位置换算视口首行在整个列表中的行号"""
+        percent, view_size = position
+        total = visible * 100.0 / view_size
+        return round(percent / 100.0 * max(total - visible, 0))
+
+    def edge_identity(self) -> tuple:
+        """只读取滚动位置与首、尾可见条目的标识，用于低成本地判断视口是否移动"""
+        self.stats["reads"] += 1
+        children = fetch_children(self.list_ctrl)
+        if not children:
+            return ()
+        return self.scroll_position(), children[0].window_text(), children[-1].window_text(), len(children)
+
+    def send_key(self, key: str):
+        self.stats["keystrokes"] += 1
+        self.list_ctrl.type_keys(key)
+
+    def scroll_to_edge(self, edge: str = "top") -> bool:
+        """滚动到顶部或底部，返回是否确认到达边缘"""
+        jump_key, page_key = EDGE_KEYS[edge]
+        try:
+            self.send_key(jump_key)
+            current = self.edge_identity()
+            for _ in range(self.max_iter):
+                self.send_key(page_key)
+                after = self.edge_identity()
+                if after == current:  # 首尾可见条目均未变化，已到达边缘
+                    return True
+                current = after
+        except Exception:
+            logger.debug(f"Failed to scroll to the {edge} of the list control.")
+        return False
+
+    def iter_new_items(self):
+        """从当前位置向下滚动到底部，逐个产出新露出的子控件 (调用方提前结束迭代时同样记录耗时)"""
+        start = time.perf_counter()
+        try:
+            try:
+                items = self.visible_items()
+            except Exception:
+                logger.debug("Failed to retrieve children from the list control.")
+                return
+            prev_ids = [key for key, _ in items]
+            prev_position = self.scroll_position()
+            for _, child in items:
+                self.stats["items"] += 1
+                yield child
+
+            for _ in range(self.max_iter):
+                try:
+                    self.send_key("{PGDN}")
+                    items = self.visible_items()
+                except Exception:
+                    logger.debug("Failed to scroll the list control.")
+                    break
+                cur_ids = [key for key, _ in items]
+                position = self.scroll_position()
+                scrollable = position is not None and prev_position is not None
+                if (position == prev_position) if scrollable else (cur_ids == prev_ids):  # 视口未移动，已滚动到底部
+                    logger.debug("Reached the bottom of the list control.")
+                    break
+                if scrollable:
+                    overlap = self.top_row(prev_position, len(prev_ids)) + len(prev_ids) - self.top_row(position, len(cur_ids))
+                    overlap = min(max(overlap, 0), len(cur_ids))
+                else:
+                    overlap = count_overlap(prev_ids, cur_ids)
+                for _, child in items[overlap:]:
+                    self.stats["items"] += 1
+                    yield child
+                prev_ids, prev_position = cur_ids, position
+        finally:
+            self.stats["seconds"] += time.perf_counter() - start
+            logger.info(f"Collected {self.stats['items']} list items with {self.stats['keystrokes']} keystrokes, "
+                        f"{self.stats['items'] / max(self.stats['seconds'], 1e-9):.1f} items/sec")
@@ -0,0 +1,90 @@
+import logging
+import time
+
+from utils.control_snapshot import snapshot_control
+
+logger = logging.getLogger()
+
+
+def subtree_fingerprint(wrapper, max_nodes: int = 50) -> tuple:
+    """
+    低成本的界面指纹：从 wrapper 开始广度优先读取至多 max_nodes 个节点的 (子节点数, 矩形)，
+    不使用文本等易变属性，界面布局变化时指纹随之变化；子控件的矩形随子控件列表一次批量读取
+    """
+    fingerprint = []
+    try:
+        queue = [snapshot_control(wrapper)]
+    except Exception:
+        return (None,)
+    while queue and len(fingerprint) < max_nodes:
+        node = queue.pop(0)
+        try:
+            children = node.children()
+            rect = str(node.rectangle())
+        except Exception:
+            fingerprint.append(None)  # 节点在采样过程中消失
+            continue
+        fingerprint.append((len(children), rect))
+        queue.extend(children)
+    return tuple(fingerprint)
+
+def window_fingerprint(wrapper, list_windows=None, max_nodes: int = 50) -> tuple:
+    """顶层窗口集合 + 当前窗口子树指纹；list_windows 返回顶层窗口句柄列表，为 None 时只采样子树"""
+    windows = frozenset(list_windows()) if list_windows else frozenset()
+    return windows, subtree_fingerprint(wrapper, max_nodes)
+
+
+class SettleDetector:
+    """
+    界面稳定检测器，替代每次交互后的固定 sleep：
+    以 interval 为间隔轮询界面指纹，连续 stable_samples 次采样一致即认为界面已稳定，
+    最长等待 timeout 秒；每次等待的耗时记录在 samples 中，用于统计稳定时间分布
+    """
+    def __init__(self, timeout: float = 5.0, interval: float = 0.05, stable_samples: int = 2):
+        self.timeout = timeout
+        self.interval = interval
+        self.stable_samples = stable_samples
+        self.samples = []   # 每次等待到稳定所用的秒数
+        self.timeouts = 0   # 达到等待上限仍未稳定的次数
+
+    def wait(self, fingerprint_fn, accept=None) -> tuple:
+        """
+        等待界面稳定，返回 (最后一次采样的指纹, 等待秒数)；
+        accept 为可选的判定函数，某次采样满足时立即返回 (如已到达期望的界面)，不再等待连续一致的采样
+        """
+        start = time.perf_counter()
+        last = fingerprint_fn()
+        matched = self.stable_samples if accept is not None and accept(last) else 1
+        while matched < self.stable_samples:
+            if time.perf_counter() - start >= self.timeout:
+                self.timeouts += 1
+                logger.debug(f"UI did not settle within {self.timeout}s")
+                break
+            time.sleep(self.interval)
+            current = fingerprint_fn()
+            matched = matched + 1 if current == last else 1
+            if accept is not None and accept(current):
+                matched = self.stable_samples
+            last = current
+        elapsed = time.perf_counter() - start
+        self.samples.append(elapsed)
+        return last, elapsed
+
+    def summary(self) -> dict:
+        """稳定时间分布：次数、p50/p90/p99/最大值(秒)与超时次数"""
+        if not self.samples:
+            return {"count": 0, "timeouts": self.timeouts}
+        ordered = sorted(self.samples)
+
+        def percentile(p):
+            return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))], 3)
+
+        return {
+            "count": len(ordered),
+            "p50": percentile(0.5),
+            "p90": percentile(0.9),
+            "p99": percentile(0.99),
+            "max": round(ordered[-1], 3),
+            "total": round(sum(ordered), 3),
+            "timeouts": self.timeouts,
+        }
@@ -0,0 +1,246 @@
+import hashlib
+import logging
+import random
+import sys
+import time
+import xml.etree.ElementTree as ET
+from collections import Counter, defaultdict
+
+import numpy as np
+
+from utils.capture_policy import MAX_RUN, OMITTED_TAG, live_tag
+
+logger = logging.getLogger()
+
+DEFAULT_THRESHOLD = 0.93   # Jaccard 相似度不低于该值的两个状态视为同一状态
+NUM_PERM = 128             # MinHash 签名长度
+SHINGLE_CAP = MAX_RUN      # 同一路径最多计入的次数：重复控件多于该值时不再影响相似度
+RECALL_WEIGHT = 5          # 选择 LSH 分段时漏检相对于误检的权重；候选都经精确校验，误检只多花比较时间
+
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+
+def node_key(elem: ET.Element) -> str:
+    return f"{live_tag(elem)}:{elem.attrib.get('class_name', '')}"
+
+def is_dynamic_run(run: list) -> bool:
+    """连续结构相同的兄弟控件中含有动态控件或占位元素时，视为一个动态控件组"""
+    return len(run) > 1 and any(elem.tag == OMITTED_TAG or elem.attrib.get("is_dynamic") == "True" for elem in run)
+
+def path_counts(elem: ET.Element, prefix: str = "") -> Counter:
+    """
+    子树中每条自根向下的 “控件类型:类名” 路径出现的次数；
+    动态控件组整体只计一次 (各成员路径次数取最大值)，因此列表条目、聊天消息的增减不改变结果
+    """
+    path = f"{prefix}/{node_key(elem)}"
+    counts = Counter({path: 1})
+    children = list(elem)
+    start = 0
+    while start < len(children):
+        end = start + 1
+        while end < len(children) and node_key(children[end]) == node_key(children[start]):
+            end += 1
+        run = children[start:end]
+        if is_dynamic_run(run):
+            group = Counter()
+            for child in run:
+                group |= path_counts(child, path)
+            counts += group
+        else:
+            for child in run:
+                if child.tag != OMITTED_TAG:
+                    counts += path_counts(child, path)
+        start = end
+    return counts
+
+def structure_shingles(root: ET.Element, cap: int = SHINGLE_CAP) -> frozenset:
+    """
+    状态结构的 shingle 集合：路径及其第 k 次出现 (k < cap)，忽略标题、坐标等内容属性；
+    字符串经 intern 后各状态共用，常驻的集合只占引用的内存
+    """
+    return frozenset(sys.intern(f"{path}#{k}") for path, count in path_counts(root).items() for k in range(min(count, cap)))
+
+def jaccard(shingles1: frozenset, shingles2: frozenset) -> float:
+    if not shingles1 and not shingles2:
+        return 1.0
+    return len(shingles1 & shingles2) / len(shingles1 | shingles2)
+
+def shingle_hashes(shingles) -> np.ndarray:
+    return np.array([int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little")
+                     for s in shingles], dtype=np.uint64)
+
+def optimal_bands(threshold: float, num_perm: int, recall_weight: float = RECALL_WEIGHT) -> tuple:
+    """选择 LSH 分段 (段数 b, 每段行数 r)，使阈值两侧误判的面积 (假阳性 + recall_weight * 假阴性) 最小"""
+    xs = np.linspace(0.0, 1.0, 201)
+    step = xs[1] - xs[0]
+    best = None
+    for b in range(1, num_perm + 1):
+        for r in range(1, num_perm // b + 1):
+            probs = 1.0 - (1.0 - xs ** r) ** b  # Jaccard 为 x 的两个集合成为候选的概率
+            error = step * (probs[xs < threshold].sum() + recall_weight * (1.0 - probs[xs >= threshold]).sum())
+            if best is None or error < best[0]:
+                best = (error, b, r)
+    return best[1], best[2]
+
+
+class MinHasher:
+    """MinHash：以 num_perm 个 (a*x+b) mod p 形式的哈希函数近似随机排列，签名逐位相等的比例即 Jaccard 相似度的估计"""
+    def __init__(self, num_perm: int = NUM_PERM, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.a = rng.integers(1, MAX_HASH, num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, MAX_HASH, num_perm, dtype=np.uint64)
+
+    def signature(self, shingles) -> np.ndarray:
+        hashes = shingle_hashes(shingles)
+        if len(hashes) == 0:
+            return np.full(self.num_perm, MAX_HASH, dtype=np.uint64)
+        permuted = (hashes[:, None] * self.a + self.b) % np.uint64(MERSENNE_PRIME) & np.uint64(MAX_HASH)
+        return permuted.min(axis=0)
+
+
+class StateSimilarityIndex:
+    """
+    近似重复状态索引：状态结构的 shingle 集合 (structure_shingles) 计算 MinHash 签名后按段分桶 (LSH)，
+    查询只比较与其至少一段签名相同的候选，再以精确 Jaccard 相似度不低于 threshold 为准，
+    候选数与已登记的状态数基本无关
+    """
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD, num_perm: int = NUM_PERM, seed: int = 1):
+        self.threshold = threshold
+        self.hasher = MinHasher(num_perm, seed)
+        self.bands, self.rows = optimal_bands(threshold, num_perm)
+        self.buckets = [defaultdict(list) for _ in range(self.bands)]
+        self.shingles = {}   # 键 (状态编号) -> shingle 集合
+
+    def __len__(self):
+        return len(self.shingles)
+
+    def band_keys(self, signature: np.ndarray) -> list:
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def add(self, key, shingles: frozenset):
+        if key in self.shingles:
+            return
+        self.shingles[key] = shingles
+        for bucket, band_key in zip(self.buckets, self.band_keys(self.hasher.signature(shingles))):
+            bucket[band_key].append(key)
+
+    def candidates(self, shingles: frozenset) -> set:
+        keys = set()
+        for bucket, band_key in zip(self.buckets, self.band_keys(self.hasher.signature(shingles))):
+            keys.update(bucket.get(band_key, ()))
+        return keys
+
+    def query(self, shingles: frozenset) -> list:
+        """相似度不低于阈值的已登记状态，返回按相似度降序的 [(键, Jaccard), ...]"""
+        matches = [(key, jaccard(shingles, self.shingles[key])) for key in self.candidates(shingles)]
+        return sorted([(key, score) for key, score in matches if score >= self.threshold], key=lambda m: -m[1])
+
+    def best_match(self, shingles: frozenset):
+        """最相似的已登记状态，返回 (键, Jaccard)；没有时返回 None"""
+        matches = self.query(shingles)
+        return matches[0] if matches else None
+
+
+# 人工标注的 doc/utg 近似重复状态：只差一个文本控件的同一页面，以及不同搜索词的同一搜索结果页
+UTG_NEAR_DUPLICATES = [(2, 11), (6, 13), (15, 17)]
+
+
+def perturb_state(root: ET.Element, rng: random.Random, edits: int) -> ET.Element:
+    """随机删除或复制叶子控件，模拟界面内容的小幅变化"""
+    root = ET.fromstring(ET.tostring(root))
+    for _ in range(edits):
+        parents = [(parent, child) for parent in root.iter() for child in parent if len(child) == 0]
+        if not parents:
+            break
+        parent, child = rng.choice(parents)
+        if rng.random() < 0.5:
+            parent.remove(child)
+        else:
+            parent.insert(list(parent).index(child), ET.Element(child.tag, dict(child.attrib)))
+    return root
+
+def evaluate_corpus(utg_dir: str = "doc/utg", thresholds=(0.85, 0.9, 0.93, 0.95), variants: int = 20,
+                    max_edits: int = 3, seed: int = 0) -> dict:
+    """
+    在 doc/utg 上评估近似重复检测的准确率与召回率 (经 LSH 检索并精确校验后的结果)：
+    - 语料中的状态两两比较，UTG_NEAR_DUPLICATES 为正例，其余状态对为负例
+    - 每个状态随机增删 1~max_edits 个控件生成 variants 个变体，查询原语料，命中其来源 (或来源的近似重复状态) 为正确
+    """
+    import glob
+    import os
+    import re
+
+    states = {int(re.search(r"state(\d+)\.xml$", path).group(1)): ET.parse(path).getroot()
+              for path in glob.glob(os.path.join(utg_dir, "state*.xml"))}
+    shingles = {num: structure_shingles(root) for num, root in states.items()}
+    twins = defaultdict(set)
+    for a, b in UTG_NEAR_DUPLICATES:
+        twins[a].add(b)
+        twins[b].add(a)
+    rng = random.Random(seed)
+    queries = [(num, structure_shingles(perturb_state(states[num], rng, rng.randint(1, max_edits))))
+               for num in sorted(states) for _ in range(variants)]
+
+    results = {}
+    for threshold in thresholds:
+        index = StateSimilarityIndex(threshold)
+        tp = fp = fn = 0
+        for num in sorted(states):  # 语料中的状态对：逐个查询后登记
+            found = {key for key, _ in index.query(shingles[num])}
+            expected = {twin for twin in twins[num] if twin in index.shingles}
+            tp, fp, fn = tp + len(found & expected), fp + len(found - expected), fn + len(expected - found)
+            index.add(num, shingles[num])
+        for source, query in queries:
+            found = {key for key, _ in index.query(query)}
+            expected = {source} | twins[source]
+            hit = bool(found & expected)
+            tp, fp, fn = tp + hit, fp + len(found - expected), fn + (not hit)
+        results[threshold] = {"bands": index.bands, "rows": index.rows,
+                              "precision": round(tp / (tp + fp), 3) if tp + fp else 1.0,
+                              "recall": round(tp / (tp + fn), 3) if tp + fn else 1.0}
+    logger.info(f"Near-duplicate detection on {utg_dir} ({len(states)} states, {len(queries)} variants): {results}")
+    return results
+
+def benchmark_lookup(utg_dir: str = "doc/utg", n: int = 10000, n_queries: int = 200, threshold: float = DEFAULT_THRESHOLD,
+                     seed: int = 0) -> dict:
+    """登记 n 个由 doc/utg 状态随机变化得到的状态，比较 LSH 检索与逐个计算 Jaccard 的线性扫描的查询延迟"""
+    import glob
+    import os
+
+    rng = random.Random(seed)
+    roots = [ET.parse(path).getroot() for path in sorted(glob.glob(os.path.join(utg_dir, "state*.xml")))]
+    stored = [structure_shingles(perturb_state(rng.choice(roots), rng, rng.randint(1, 60))) for _ in range(n)]
+    queries = [structure_shingles(perturb_state(rng.choice(roots), rng, rng.randint(1, 3))) for _ in range(n_queries)]
+
+    index = StateSimilarityIndex(threshold)
+    start = time.perf_counter()
+    for key, shingles in enumerate(stored):
+        index.add(key, shingles)
+    insert_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    lsh = [{key for key, _ in index.query(query)} for query in queries]
+    lsh_time = time.perf_counter() - start
+    candidates = sum(len(index.candidates(query)) for query in queries) / n_queries
+    start = time.perf_counter()
+    exact = [{key for key, shingles in enumerate(stored) if jaccard(query, shingles) >= threshold} for query in queries]
+    scan_time = time.perf_counter() - start
+    recall = sum(len(a & e) for a, e in zip(lsh, exact)) / max(1, sum(len(e) for e in exact))
+    results = {
+        "states": n,
+        "insert_ms_per_state": round(1000 * insert_time / n, 3),
+        "lsh_ms_per_query": round(1000 * lsh_time / n_queries, 3),
+        "candidates_per_query": round(candidates, 1),
+        "scan_ms_per_query": round(1000 * scan_time / n_queries, 3),
+        "lsh_recall_vs_scan": round(recall, 3),
+    }
+    logger.info(f"Similarity lookup benchmark: {results}")
+    return results
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(evaluate_corpus())
+    print(benchmark_lookup())
@@ -0,0 +1,415 @@
+import copy
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+from difflib import SequenceMatcher
+
+from utils.action_planner import get_best_attr
+from utils.capture_policy import OMITTED_TAG, live_tag, omitted_count
+from utils.gui_tree_exporter import indent_xml
+from utils.similarity import StateSimilarityIndex, structure_shingles
+
+logger = logging.getLogger()
+
+MAX_CHAIN = 4            # 差量链的最大长度：重建一个状态最多依次应用的编辑脚本数
+MAX_DELTA_RATIO = 0.5    # 编辑脚本超过完整XML的该比例时仍保存完整XML
+BASE_THRESHOLD = 0.3     # 候选基准状态的最低结构 Jaccard 相似度
+MAX_DIFF_PATHS = 10      # 跳转差异摘要中每类子树最多记录的控件标识数
+SUMMARY_ATTRS = ["title", "name", "auto_id"]  # 差异摘要中视为 “内容变化” 的属性，坐标等变化不计入
+DELTA_SUFFIX = ".delta.json"
+STATE_FILE_PATTERN = re.compile(r'^state(\d+)(\.xml|\.delta\.json)$')
+CACHE_BYTES = 64 * 1024 * 1024   # 探索时常驻内存的已解析状态树的默认字节预算
+ELEMENT_BYTES = 300      # 估算解析后树的内存占用：每个元素的固定开销
+ATTR_BYTES = 80          # 每个属性的固定开销 (另计属性值与文本的字节数)
+
+
+############################### 树差分 ###############################
+
+def subtree_digests(root: ET.Element) -> dict:
+    """每个元素的子树摘要 (类型、属性与子树摘要序列的哈希)：摘要相同的子树完全相同"""
+    digests = {}
+    def visit(elem):
+        digest = hashlib.blake2b(digest_size=8)
+        digest.update(elem.tag.encode("utf-8"))
+        for key, value in elem.attrib.items():
+            digest.update(f"\0{key}={value}".encode("utf-8"))
+        for child in elem:
+            digest.update(visit(child))
+        digests[id(elem)] = digest.digest()
+        return digests[id(elem)]
+    visit(root)
+    return digests
+
+def structure_key(elem: ET.Element) -> tuple:
+    return elem.tag, elem.attrib.get("class_name", "")
+
+def append_run(ops: list, kind: str, count: int):
+    if ops and ops[-1][0] == kind:
+        ops[-1][1] += count
+    else:
+        ops.append([kind, count])
+
+def subtree_xml(elem: ET.Element) -> str:
+    elem = copy.deepcopy(elem)
+    for node in elem.iter():
+        node.text = node.tail = None
+    return ET.tostring(elem, encoding="unicode")
+
+def diff_children(old: list, new: list, old_digests: dict, new_digests: dict):
+    """
+    子控件序列的编辑操作：先按子树摘要对齐完全相同的子树，剩余部分再按结构 (类型与类名) 配对递归比较，
+    无法配对的整棵子树删除或插入。操作为 ["keep", n] / ["delete", n] / ["insert", xml] / ["patch", 子脚本]
+    """
+    ops = []
+    matcher = SequenceMatcher(None, [old_digests[id(c)] for c in old], [new_digests[id(c)] for c in new], autojunk=False)
+    for kind, i1, i2, j1, j2 in matcher.get_opcodes():
+        if kind == "equal":
+            append_run(ops, "keep", i2 - i1)
+            continue
+        pairs = SequenceMatcher(None, [structure_key(c) for c in old[i1:i2]], [structure_key(c) for c in new[j1:j2]],
+                                autojunk=False)
+        for pair_kind, p1, p2, q1, q2 in pairs.get_opcodes():
+            if pair_kind == "equal":
+                for offset in range(p2 - p1):
+                    ops.append(["patch", diff_elements(old[i1 + p1 + offset], new[j1 + q1 + offset],
+                                                       old_digests, new_digests)])
+                continue
+            if p2 > p1:
+                append_run(ops, "delete", p2 - p1)
+            ops.extend(["insert", subtree_xml(child)] for child in new[j1 + q1:j1 + q2])
+    return ops
+
+def diff_elements(old: ET.Element, new: ET.Element, old_digests: dict, new_digests: dict) -> dict:
+    """结构相同的两个元素之间的编辑脚本：{"attrib": 变化的属性, "children": 子控件操作}，两者相同时为 {}"""
+    script = {}
+    if old_digests[id(old)] == new_digests[id(new)]:
+        return script
+    if old.attrib != new.attrib:
+        if list(old.attrib) == list(new.attrib):
+            script["attrib"] = {key: value for key, value in new.attrib.items() if old.attrib[key] != value}
+        else:
+            script["attrib_all"] = dict(new.attrib)  # 属性增删时整体替换，保持属性顺序
+    children = diff_children(list(old), list(new), old_digests, new_digests)
+    if any(op[0] != "keep" for op in children):
+        script["children"] = children
+    return script
+
+def diff_trees(old: ET.Element, new: ET.Element) -> dict:
+    """由 old 得到 new 的编辑脚本 (可 JSON 序列化)；两棵树的根结构不同时整体替换"""
+    if structure_key(old) != structure_key(new):
+        return {"replace": subtree_xml(new)}
+    return diff_elements(old, new, subtree_digests(old), subtree_digests(new))
+
+def apply_children(base: ET.Element, elem: ET.Element, ops: list):
+    children = list(base)
+    position = 0
+    for kind, arg in ops:
+        if kind == "keep":
+            elem.extend(copy.deepcopy(child) for child in children[position:position + arg])
+            position += arg
+        elif kind == "delete":
+            position += arg
+        elif kind == "insert":
+            elem.append(ET.fromstring(arg))
+        else:
+            elem.append(apply_element(children[position], arg))
+            position += 1
+    elem.extend(copy.deepcopy(child) for child in children[position:])
+
+def apply_element(base: ET.Element, script: dict) -> ET.Element:
+    if "attrib_all" in script:
+        attrib = dict(script["attrib_all"])
+    else:
+        attrib = dict(base.attrib)
+        attrib.update(script.get("attrib", {}))
+    elem = ET.Element(base.tag, attrib)
+    if "children" in script:
+        apply_children(base, elem, script["children"])
+    else:
+        elem.extend(copy.deepcopy(child) for child in base)
+    return elem
+
+def apply_script(base: ET.Element, script: dict) -> ET.Element:
+    """对 base 应用 diff_trees 得到的编辑脚本，返回重建的新树 (已按导出格式缩进)，base 不变"""
+    root = ET.fromstring(script["replace"]) if "replace" in script else apply_element(base, script)
+    indent_xml(root)
+    return root
+
+
+############################### 跳转差异摘要 ###############################
+
+def element_xpaths(root: ET.Element) -> dict:
+    """元素 id -> 控件标识 (与 plan_actions 规划的 XPath 相同：优先 auto_id/title/name 谓词，否则同类下标)"""
+    xpaths = {id(root): f"/{root.tag}"}
+    stack = [root]
+    while stack:
+        elem = stack.pop()
+        tag_counts = {}
+        for child in elem:
+            index = tag_counts.get(live_tag(child), 0)
+            tag_counts[live_tag(child)] = index + omitted_count(child)
+            if child.tag == OMITTED_TAG:
+                continue
+            best_attr = get_best_attr(child)
+            xpaths[id(child)] = xpaths[id(elem)] + (f"/{child.tag}[{best_attr}]" if best_attr else f"/{child.tag}[{index}]")
+            stack.append(child)
+    return xpaths
+
+def diff_subtrees(old: ET.Element, new: ET.Element) -> dict:
+    """
+    两个状态之间变化的最小子树：{"added": [新树中的元素], "removed": [旧树中的元素], "changed": [(旧元素, 新元素)]}，
+    changed 只包含 SUMMARY_ATTRS 发生变化的控件，占位元素不计入
+    """
+    result = {"added": [], "removed": [], "changed": []}
+    script = diff_trees(old, new)
+    if "replace" in script:
+        result["removed"].append(old)
+        result["added"].append(new)
+        return result
+    stack = [(old, new, script)]
+    while stack:
+        old_elem, new_elem, script = stack.pop()
+        if any(old_elem.attrib.get(attr) != new_elem.attrib.get(attr) for attr in SUMMARY_ATTRS):
+            result["changed"].append((old_elem, new_elem))
+        old_children, new_children = list(old_elem), list(new_elem)
+        i = j = 0
+        for kind, arg in script.get("children", []):
+            if kind == "keep":
+                i, j = i + arg, j + arg
+            elif kind == "delete":
+                result["removed"].extend(child for child in old_children[i:i + arg] if child.tag != OMITTED_TAG)
+                i += arg
+            elif kind == "insert":
+                if new_children[j].tag != OMITTED_TAG:
+                    result["added"].append(new_children[j])
+                j += 1
+            else:
+                stack.append((old_children[i], new_children[j], arg))
+                i, j = i + 1, j + 1
+    return result
+
+def diff_summary(old: ET.Element, new: ET.Element, max_paths: int = MAX_DIFF_PATHS) -> dict:
+    """跳转差异摘要 (记录在UTG边上)：新增、删除与内容变化的子树的控件标识，每类最多 max_paths 个"""
+    subtrees = diff_subtrees(old, new)
+    old_xpaths, new_xpaths = element_xpaths(old), element_xpaths(new)
+    summary = {
+        "added": [new_xpaths[id(elem)] for elem in subtrees["added"]],
+        "removed": [old_xpaths[id(elem)] for elem in subtrees["removed"]],
+        "changed": [new_xpaths[id(elem)] for _, elem in subtrees["changed"]],
+    }
+    return {kind: paths[:max_paths] for kind, paths in summary.items() if paths}
+
+
+############################### 差量存储 ###############################
+
+def state_file_name(state_num: int, delta: bool) -> str:
+    return f"state{state_num}{DELTA_SUFFIX if delta else '.xml'}"
+
+def write_file(path: str, text: str):
+    """先写临时文件再替换，避免中途崩溃留下半个文件"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+def tree_bytes(root: ET.Element) -> int:
+    """估算解析后的树占用的内存字节数 (按 doc/utg 的状态以 tracemalloc 标定，误差约 20%)"""
+    total = 0
+    for elem in root.iter():
+        total += ELEMENT_BYTES + ATTR_BYTES * len(elem.attrib) + len((elem.text or "").encode("utf-8"))
+        total += sum(len(value.encode("utf-8")) for value in elem.attrib.values())
+    return total
+
+
+class TreeCache:
+    """
+    已解析状态树的 LRU 缓存：估算的总字节数超过 max_bytes 时淘汰最久未访问的树 (至少保留最近的一棵)，
+    被淘汰的状态由 StateStore 从磁盘重新读取；max_bytes=None 时不淘汰
+    """
+    def __init__(self, max_bytes: int = None):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()   # 状态编号 -> (根元素, 估算字节数)
+        self.total_bytes = 0
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "peak_bytes": 0}
+
+    def __contains__(self, state_num) -> bool:
+        return state_num in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, state_num: int):
+        entry = self.entries.get(state_num)
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        self.entries.move_to_end(state_num)
+        return entry[0]
+
+    def put(self, state_num: int, root: ET.Element):
+        if state_num in self.entries:
+            if self.entries[state_num][0] is root:
+                self.entries.move_to_end(state_num)
+                return
+            self.total_bytes -= self.entries.pop(state_num)[1]
+        size = tree_bytes(root)
+        self.entries[state_num] = (root, size)
+        self.total_bytes += size
+        self.stats["peak_bytes"] = max(self.stats["peak_bytes"], self.total_bytes)
+        while self.max_bytes is not None and self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            _, (_, evicted) = self.entries.popitem(last=False)
+            self.total_bytes -= evicted
+            self.stats["evictions"] += 1
+
+    def clear(self):
+        self.entries.clear()
+        self.total_bytes = 0
+
+
+class StateStore:
+    """
+    状态的差量存储：新状态保存为相对于最相似的已存状态 (基准) 的编辑脚本 stateN.delta.json，
+    基准由结构相似度索引选出，且其差量链长度须小于 max_chain；编辑脚本不比完整XML小很多时仍保存完整的 stateN.xml。
+    load 沿差量链重建状态，最近访问的状态在 cache_bytes 的字节预算内保留在内存中 (TreeCache，None 为不限)；
+    max_chain=0 时所有状态都保存为完整XML
+    """
+    def __init__(self, directory: str, max_chain: int = MAX_CHAIN, max_delta_ratio: float = MAX_DELTA_RATIO,
+                 cache_bytes: int = None):
+        self.directory = directory
+        self.max_chain = max_chain
+        self.max_delta_ratio = max_delta_ratio
+        self.bases = {}      # 状态编号 -> 基准状态编号，完整保存的状态为 None
+        self.chains = {}     # 状态编号 -> 差量链长度
+        self.index = StateSimilarityIndex(BASE_THRESHOLD)
+        self.cache = TreeCache(cache_bytes)   # 状态编号 -> 重建的根元素
+        for name in os.listdir(directory) if os.path.isdir(directory) else []:
+            match = STATE_FILE_PATTERN.match(name)
+            if match:
+                self.register(int(match.group(1)))
+
+    def path(self, state_num: int) -> str:
+        delta_path = os.path.join(self.directory, state_file_name(state_num, True))
+        return delta_path if os.path.exists(delta_path) else os.path.join(self.directory, state_file_name(state_num, False))
+
+    def register(self, state_num: int):
+        """登记目录中已有的状态文件 (恢复探索或读取已导出的目录时)"""
+        if state_num in self.bases:
+            return
+        path = self.path(state_num)
+        if path.endswith(DELTA_SUFFIX):
+            with open(path, encoding="utf-8") as f:
+                base = json.load(f)["base"]
+            self.register(base)
+            self.bases[state_num], self.chains[state_num] = base, self.chains[base] + 1
+        else:
+            self.bases[state_num], self.chains[state_num] = None, 0
+        if self.max_chain and self.chains[state_num] < self.max_chain:
+            self.index.add(state_num, structure_shingles(self.load(state_num)))
+
+    def choose_base(self, shingles: frozenset):
+        """结构最相似且差量链未满的已存状态，没有时返回 None"""
+        for state_num, _ in self.index.query(shingles):
+            if self.chains[state_num] < self.max_chain:
+                return state_num
+        return None
+
+    def save(self, state_num: int, root: ET.Element, captured_xml: str, shingles: frozenset = None) -> str:
+        """保存导出的状态 (captured_xml 为其完整XML文件)，返回状态文件路径"""
+        base = self.choose_base(shingles if shingles is not None else structure_shingles(root)) if self.max_chain else None
+        path = os.path.join(self.directory, state_file_name(state_num, False))
+        if base is not None:
+            text = json.dumps({"base": base, "script": diff_trees(self.load(base), root)}, ensure_ascii=False,
+                              separators=(",", ":"))
+            if len(text.encode("utf-8")) < self.max_delta_ratio * os.path.getsize(captured_xml):
+                path = os.path.join(self.directory, state_file_name(state_num, True))
+                write_file(path, text)
+                os.remove(captured_xml)
+            else:
+                base = None
+        if base is None:
+            os.replace(captured_xml, path)
+        self.bases[state_num] = base
+        self.chains[state_num] = self.chains[base] + 1 if base is not None else 0
+        if self.max_chain and self.chains[state_num] < self.max_chain:
+            self.index.add(state_num, shingles if shingles is not None else structure_shingles(root))
+        self.cache.put(state_num, root)
+        return path
+
+    def load(self, state_num: int) -> ET.Element:
+        """读取状态的根元素：完整XML直接解析，差量状态先重建基准再应用编辑脚本"""
+        root = self.cache.get(state_num)
+        if root is not None:
+            return root
+        path = self.path(state_num)
+        if path.endswith(DELTA_SUFFIX):
+            with open(path, encoding="utf-8") as f:
+                delta = json.load(f)
+            root = apply_script(self.load(delta["base"]), delta["script"])
+        else:
+            root = ET.parse(path).getroot()
+        self.cache.put(state_num, root)
+        return root
+
+
+
+def load_states(directory: str) -> dict:
+    """读取目录中的全部状态 (完整XML或差量)，返回 {状态编号: 根元素}；无法解析的状态记录错误后跳过"""
+    store = StateStore(directory, max_chain=0)
+    states = {}
+    for state_num in sorted(store.bases):
+        try:
+            states[state_num] = store.load(state_num)
+        except (ET.ParseError, ValueError, KeyError) as e:
+            logger.error(f"无法读取状态 {store.path(state_num)}: {e}")
+    return states
+
+def benchmark_store(utg_dir: str = "doc/utg", max_chain: int = MAX_CHAIN, repeat: int = 20) -> dict:
+    """将 utg_dir 中的状态按编号顺序写入差量存储，比较存储体积，并测量冷读取 (无缓存) 时重建每个状态的延迟"""
+    import shutil
+    import tempfile
+
+    sizes = {"full_bytes": 0, "stored_bytes": 0}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = StateStore(tmp_dir, max_chain=max_chain)
+        for state_num, root in load_states(utg_dir).items():
+            captured_xml = os.path.join(tmp_dir, "captured.xml")
+            shutil.copy(os.path.join(utg_dir, state_file_name(state_num, False)), captured_xml)
+            sizes["full_bytes"] += os.path.getsize(captured_xml)
+            sizes["stored_bytes"] += os.path.getsize(store.save(state_num, root, captured_xml))
+        timings = {}
+        for state_num in store.bases:
+            start = time.perf_counter()
+            for _ in range(repeat):
+                store.cache.clear()
+                store.load(state_num)
+            timings[state_num] = (time.perf_counter() - start) / repeat
+        parse_time = {}
+        for state_num in store.bases:
+            start = time.perf_counter()
+            for _ in range(repeat):
+                ET.parse(os.path.join(utg_dir, state_file_name(state_num, False)))
+            parse_time[state_num] = (time.perf_counter() - start) / repeat
+        deltas = [num for num, base in store.bases.items() if base is not None]
+        results = dict(sizes, **{
+            "states": len(store.bases),
+            "delta_states": len(deltas),
+            "savings": round(1 - sizes["stored_bytes"] / sizes["full_bytes"], 3),
+            "max_chain": max(store.chains.values()),
+            "parse_full_ms": round(1000 * sum(parse_time.values()) / len(parse_time), 2),
+            "load_ms": round(1000 * sum(timings.values()) / len(timings), 2),
+            "load_delta_ms": round(1000 * sum(timings[num] for num in deltas) / max(1, len(deltas)), 2),
+            "load_max_ms": round(1000 * max(timings.values()), 2),
+        })
+    logger.info(f"Delta state store benchmark on {utg_dir}: {results}")
+    return results
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(benchmark_store())
@@ -0,0 +1,462 @@
+import json
+import logging
+import os
+import re
+import time
+import uuid
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+logger = logging.getLogger()
+
+# 支持作为检索过滤条件的 metadata 字段
+FILTER_FIELDS = ("tag", "state", "doc_type")
+
+
+def get_filter_value(metadata: dict, field: str):
+    """读取用于过滤的 metadata 字段，state 缺失时从 stateN.xml 文件名中解析"""
+    value = metadata.get(field)
+    if value is None and field == "state":
+        match = re.search(r'state(\d+)\.xml$', metadata.get("xml_path", ""))
+        value = int(match.group(1)) if match else None
+    return value
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    进程内 NumPy 向量索引，作为 Chroma 的轻量替代：
+    - 向量归一化后以 float16 或 int8(逐行缩放) 矩阵保存，加载时以 mmap 方式映射，冷启动只需读取少量元数据
+    - 查询向量批量与矩阵分块点积，argpartition 取 top-k
+    - 可选的粗聚类(球面 k-means)：查询时只扫描最近的 nprobe 个簇，实现亚线性检索
+    - 支持按 tag / state / doc_type 过滤
+    - 实现 LangChain VectorStore 接口，as_retriever() 与 Chroma 用法一致
+    文本与 metadata 按行存放在 docs.jsonl 中，只在命中时按偏移量读取。
+    """
+    block_size = 65536  # 每次参与点积的矩阵行数，限制临时内存
+
+    def __init__(self, embedding: Embeddings, persist_directory: str = None, dtype: str = "float16",
+                 n_clusters: int = 0, nprobe: int = 8):
+        if dtype not in ("float16", "int8"):
+            raise ValueError(f"Unsupported dtype: {dtype}")
+        self._embedding = embedding
+        self.persist_directory = persist_directory
+        self.dtype = dtype
+        self.n_clusters = n_clusters
+        self.nprobe = nprobe
+
+        self._vectors = None        # (N, D) float16/int8
+        self._scales = None         # (N,) int8 的逐行缩放系数
+        self._codes = {}            # field -> (N,) int32，-1 表示缺失
+        self._vocab = {field: {} for field in FILTER_FIELDS}  # field -> {value: code}
+        self._ids = None            # 文档ID列表，按需加载
+        self._docs = None           # [(text, metadata)]，修改索引时才完整加载
+        self._offsets = None        # docs.jsonl 中每行的偏移量
+        self._centroids = None
+        self._cluster_order = None  # 按簇排序后的行号
+        self._cluster_bounds = None # 每个簇在 _cluster_order 中的起止位置
+        self._dirty = False
+
+        if persist_directory and os.path.exists(os.path.join(persist_directory, "index.json")):
+            self._load()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    def __len__(self) -> int:
+        return 0 if self._vectors is None else self._vectors.shape[0]
+
+    ############################### 持久化 ###############################
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.persist_directory, name)
+
+    def _load(self):
+        """以 mmap 方式打开已持久化的索引"""
+        start = time.perf_counter()
+        with open(self._path("index.json"), "r", encoding="utf-8") as f:
+            info = json.load(f)
+        self.dtype = info["dtype"]
+        self._vocab = {field: {json.loads(k): v for k, v in vocab.items()} for field, vocab in info["vocab"].items()}
+        self._vectors = np.load(self._path("vectors.npy"), mmap_mode="r")
+        if self.dtype == "int8":
+            self._scales = np.load(self._path("scales.npy"), mmap_mode="r")
+        for field in FILTER_FIELDS:
+            self._codes[field] = np.load(self._path(f"codes_{field}.npy"), mmap_mode="r")
+        self._offsets = np.load(self._path("offsets.npy"), mmap_mode="r")
+        if info.get("n_clusters"):
+            self.n_clusters = info["n_clusters"]
+            self._centroids = np.load(self._path("centroids.npy"))
+            self._cluster_order = np.load(self._path("cluster_order.npy"), mmap_mode="r")
+            self._cluster_bounds = np.load(self._path("cluster_bounds.npy"))
+        logger.info(f"Opened numpy vector store with {len(self)} vectors in "
+                    f"{1000 * (time.perf_counter() - start):.1f} ms: {self.persist_directory}")
+
+    def _ensure_docs(self):
+        """修改索引前完整加载文本、metadata和向量到内存"""
+        if self._docs is not None:
+            return
+        self._ids, self._docs = [], []
+        if self._offsets is not None:
+            with open(self._path("docs.jsonl"), "r", encoding="utf-8") as f:
+                for line in f:
+                    record = json.loads(line)
+                    self._ids.append(record["id"])
+                    self._docs.append((record["text"], record["metadata"]))
+        if self._vectors is not None:
+            self._vectors = np.array(self._vectors)
+            self._scales = None if self._scales is None else np.array(self._scales)
+            self._codes = {field: np.array(codes) for field, codes in self._codes.items()}
+
+    def _read_docs(self, rows) -> list:
+        """按行号读取文本和metadata"""
+        if self._docs is not None:
+            return [(self._ids[row], *self._docs[row]) for row in rows]
+        results = []
+        with open(self._path("docs.jsonl"), "rb") as f:
+            for row in rows:
+                f.seek(int(self._offsets[row]))
+                record = json.loads(f.readline())
+                results.append((record["id"], record["text"], record["metadata"]))
+        return results
+
+    def save(self):
+        """将索引写入 persist_directory（先写临时文件再替换，中断时不会损坏已有索引）"""
+        if not self.persist_directory or not self._dirty:
+            return
+        self._ensure_docs()
+        os.makedirs(self.persist_directory, exist_ok=True)
+        if self.n_clusters and len(self) >= self.n_clusters:
+            self._build_clusters()
+
+        def write_npy(name, array):
+            tmp_path = self._path(name + ".tmp")
+            with open(tmp_path, "wb") as f:
+                np.save(f, array)
+            os.replace(tmp_path, self._path(name))
+
+        dim = 0 if self._vectors is None else self._vectors.shape[1]
+        write_npy("vectors.npy", self._vectors if self._vectors is not None else np.zeros((0, dim), self.dtype))
+        if self.dtype == "int8":
+            write_npy("scales.npy", self._scales if self._scales is not None else np.zeros(0, np.float32))
+        for field in FILTER_FIELDS:
+            write_npy(f"codes_{field}.npy", self._codes.get(field, np.zeros(0, np.int32)))
+        offsets = []
+        tmp_path = self._path("docs.jsonl.tmp")
+        with open(tmp_path, "wb") as f:
+            for doc_id, (text, metadata) in zip(self._ids, self._docs):
+                offsets.append(f.tell())
+                record = {"id": doc_id, "text": text, "metadata": metadata}
+                f.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+        os.replace(tmp_path, self._path("docs.jsonl"))
+        self._offsets = np.array(offsets, dtype=np.int64)
+        write_npy("offsets.npy", self._offsets)
+        n_clusters = 0
+        if self._centroids is not None:
+            n_clusters = self._centroids.shape[0]
+            write_npy("centroids.npy", self._centroids)
+            write_npy("cluster_order.npy", self._cluster_order)
+            write_npy("cluster_bounds.npy", self._cluster_bounds)
+        info = {
+            "dtype": self.dtype,
+            "dim": dim,
+            "count": len(self),
+            "n_clusters": n_clusters,
+            "vocab": {field: {json.dumps(k): v for k, v in vocab.items()} for field, vocab in self._vocab.items()},
+        }
+        tmp_path = self._path("index.json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(info, f, ensure_ascii=False)
+        os.replace(tmp_path, self._path("index.json"))
+        self._dirty = False
+        logger.info(f"Saved numpy vector store with {len(self)} vectors to {self.persist_directory}")
+
+    ############################### 写入与删除 ###############################
+
+    def _quantize(self, vectors: np.ndarray):
+        """归一化并量化向量，返回 (矩阵, 缩放系数)"""
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.maximum(norms, 1e-12)
+        if self.dtype == "float16":
+            return vectors.astype(np.float16), None
+        scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127.0
+        return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+    def _encode_field(self, field: str, value) -> int:
+        if value is None:
+            return -1
+        vocab = self._vocab[field]
+        if value not in vocab:
+            vocab[value] = len(vocab)
+        return vocab[value]
+
+    def add_embeddings(self, texts: list, embeddings: list, metadatas: list = None, ids: list = None) -> list:
+        """写入已计算好的向量；ID 已存在时覆盖（upsert）"""
+        self._ensure_docs()
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [uuid.uuid4().hex for _ in texts]  # 删除后行数会减少，不能用行号作默认ID
+        existing = set(self._ids) & set(ids)
+        if existing:
+            self.delete(list(existing))
+        if not texts:
+            return []
+
+        matrix, scales = self._quantize(np.asarray(embeddings, dtype=np.float32))
+        codes = {field: np.array([self._encode_field(field, get_filter_value(m, field)) for m in metadatas],
+                                 dtype=np.int32)
+                 for field in FILTER_FIELDS}
+        if self._vectors is None or len(self) == 0:
+            self._vectors, self._scales, self._codes = matrix, scales, codes
+        else:
+            self._vectors = np.concatenate([self._vectors, matrix])
+            if scales is not None:
+                self._scales = np.concatenate([self._scales, scales])
+            self._codes = {field: np.concatenate([self._codes[field], codes[field]]) for field in FILTER_FIELDS}
+        self._ids.extend(ids)
+        self._docs.extend(zip(texts, metadatas))
+        self._centroids = None  # 索引变化后聚类失效，保存时重建
+        self._dirty = True
+        return list(ids)
+
+    def add_texts(self, texts, metadatas: list = None, *, ids: list = None, **kwargs) -> list:
+        texts = list(texts)
+        embeddings = self._embedding.embed_documents(texts) if texts else []
+        return self.add_embeddings(texts, embeddings, metadatas, ids)
+
+    def delete(self, ids: list = None, **kwargs) -> bool:
+        if not ids:
+            return False
+        self._ensure_docs()
+        to_delete = set(ids)
+        keep = np.array([doc_id not in to_delete for doc_id in self._ids], dtype=bool)
+        if keep.all():
+            return False
+        self._vectors = self._vectors[keep]
+        if self._scales is not None:
+            self._scales = self._scales[keep]
+        self._codes = {field: codes[keep] for field, codes in self._codes.items()}
+        self._ids = [doc_id for doc_id, k in zip(self._ids, keep) if k]
+        self._docs = [doc for doc, k in zip(self._docs, keep) if k]
+        self._prune_vocab()
+        self._centroids = None
+        self._dirty = True
+        return True
+
+    def _prune_vocab(self):
+        """删除不再被任何行使用的过滤取值，并把剩余取值重新编号为连续的 code"""
+        for field in FILTER_FIELDS:
+            vocab, codes = self._vocab[field], self._codes[field]
+            used = np.unique(codes[codes >= 0])
+            if len(used) == len(vocab):
+                continue
+            lookup = np.full(max(vocab.values(), default=-1) + 1, -1, dtype=np.int32)
+            lookup[used] = np.arange(len(used), dtype=np.int32)
+            self._vocab[field] = {value: int(lookup[code]) for value, code in vocab.items() if lookup[code] >= 0}
+            self._codes[field] = np.where(codes >= 0, lookup[np.maximum(codes, 0)], -1).astype(np.int32)
+
+    def get(self, ids: list = None, include: list = None) -> dict:
+        """与 Chroma.get 兼容的读取接口，返回 {"ids": [...], "documents": [...], "metadatas": [...]}"""
+        include = ["documents", "metadatas"] if include is None else include
+        if self._ids is None:
+            self._ids = [record_id for record_id, _, _ in self._read_docs(range(len(self)))] if len(self) else []
+        rows = range(len(self._ids))
+        if ids is not None:
+            wanted = set(ids)
+            rows = [row for row, doc_id in enumerate(self._ids) if doc_id in wanted]
+        result = {"ids": [self._ids[row] for row in rows]}
+        if include:
+            records = self._read_docs(rows)
+            if "documents" in include:
+                result["documents"] = [text for _, text, _ in records]
+            if "metadatas" in include:
+                result["metadatas"] = [metadata for _, _, metadata in records]
+        return result
+
+    ############################### 聚类 ###############################
+
+    def _scores(self, rows, queries: np.ndarray) -> np.ndarray:
+        """计算 rows 对应向量与查询向量的点积，返回 (len(rows), B)"""
+        block = np.asarray(self._vectors[rows], dtype=np.float32)
+        scores = block @ queries.T
+        if self._scales is not None:
+            scores *= np.asarray(self._scales[rows], dtype=np.float32)[:, None]
+        return scores
+
+    def _build_clusters(self, iterations: int = 10, sample_size: int = 50000):
+        """球面 k-means 粗聚类，按簇重排行号用于 nprobe 检索"""
+        n = len(self)
+        rng = np.random.default_rng(0)
+        sample = rng.choice(n, size=min(n, sample_size), replace=False)
+        sample_vectors = np.asarray(self._vectors[np.sort(sample)], dtype=np.float32)
+        if self._scales is not None:
+            sample_vectors *= np.asarray(self._scales[np.sort(sample)], dtype=np.float32)[:, None]
+        centroids = sample_vectors[rng.choice(len(sample_vectors), size=self.n_clusters, replace=False)]
+        for _ in range(iterations):
+            assign = np.argmax(sample_vectors @ centroids.T, axis=1)
+            for c in range(self.n_clusters):
+                members = sample_vectors[assign == c]
+                if len(members):
+                    centroid = members.sum(axis=0)
+                    centroids[c] = centroid / max(np.linalg.norm(centroid), 1e-12)
+
+        assign = np.empty(n, dtype=np.int32)
+        for start in range(0, n, self.block_size):
+            rows = np.arange(start, min(n, start + self.block_size))
+            block = np.asarray(self._vectors[rows], dtype=np.float32)
+            assign[rows] = np.argmax(block @ centroids.T, axis=1)
+        self._centroids = centroids.astype(np.float32)
+        self._cluster_order = np.argsort(assign, kind="stable")
+        self._cluster_bounds = np.searchsorted(assign[self._cluster_order], np.arange(self.n_clusters + 1))
+
+    ############################### 检索 ###############################
+
+    def _filter_mask(self, filter: dict):
+        """根据过滤条件生成行掩码，无过滤条件时返回 None"""
+        if not filter:
+            return None
+        mask = np.ones(len(self), dtype=bool)
+        for field, value in filter.items():
+            if field not in FILTER_FIELDS:
+                raise ValueError(f"Unsupported filter field: {field}, expected one of {FILTER_FIELDS}")
+            code = self._vocab[field].get(value)
+            if code is None:
+                return np.zeros(len(self), dtype=bool)
+            mask &= np.asarray(self._codes[field]) == code
+        return mask
+
+    def _top_k(self, rows: np.ndarray, query: np.ndarray, k: int) -> list:
+        scores = self._scores(rows, query[None, :])[:, 0]
+        if len(scores) > k:
+            top = np.argpartition(-scores, k)[:k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+        return [(int(rows[i]), float(scores[i])) for i in top]
+
+    def search_vectors(self, queries, k: int = 4, filter: dict = None, nprobe: int = None) -> list:
+        """
+        批量检索：queries 为 (B, D) 查询向量，返回每个查询的 [(行号, 余弦相似度), ...]
+        """
+        if not len(self):
+            return [[] for _ in queries]
+        queries = np.asarray(queries, dtype=np.float32)
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        mask = self._filter_mask(filter)
+        if mask is not None and not mask.any():
+            return [[] for _ in queries]
+        nprobe = nprobe or self.nprobe
+
+        if self._centroids is not None and nprobe < self._centroids.shape[0]:
+            results = []
+            probes = np.argsort(-(queries @ self._centroids.T), axis=1)[:, :nprobe]
+            for query, clusters in zip(queries, probes):
+                rows = np.concatenate([self._cluster_order[self._cluster_bounds[c]:self._cluster_bounds[c + 1]]
+                                       for c in clusters])
+                rows = np.sort(rows)
+                if mask is not None:
+                    rows = rows[mask[rows]]
+                results.append(self._top_k(rows, query, k) if len(rows) else [])
+            return results
+
+        # 精确检索：分块批量点积，每块保留 top-k 候选
+        candidate_rows = [[] for _ in queries]
+        candidate_scores = [[] for _ in queries]
+        all_rows = np.arange(len(self)) if mask is None else np.nonzero(mask)[0]
+        for start in range(0, len(all_rows), self.block_size):
+            rows = all_rows[start:start + self.block_size]
+            scores = self._scores(rows if mask is not None else slice(rows[0], rows[-1] + 1), queries)
+            for q in range(len(queries)):
+                column = scores[:, q]
+                top = np.argpartition(-column, k)[:k] if len(column) > k else np.arange(len(column))
+                candidate_rows[q].append(rows[top])
+                candidate_scores[q].append(column[top])
+        results = []
+        for rows, scores in zip(candidate_rows, candidate_scores):
+            rows, scores = np.concatenate(rows), np.concatenate(scores)
+            order = np.argsort(-scores)[:k]
+            results.append([(int(rows[i]), float(scores[i])) for i in order])
+        return results
+
+    def _to_documents(self, hits: list) -> list:
+        records = self._read_docs([row for row, _ in hits])
+        return [(Document(page_content=text, metadata=metadata, id=doc_id), score)
+                for (doc_id, text, metadata), (_, score) in zip(records, hits)]
+
+    def similarity_search_by_vector(self, embedding: list, k: int = 4, filter: dict = None, **kwargs) -> list:
+        hits = self.search_vectors([embedding], k=k, filter=filter, nprobe=kwargs.get("nprobe"))[0]
+        return [doc for doc, _ in self._to_documents(hits)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: dict = None, **kwargs) -> list:
+        embedding = self._embedding.embed_query(query)
+        hits = self.search_vectors([embedding], k=k, filter=filter, nprobe=kwargs.get("nprobe"))[0]
+        return self._to_documents(hits)
+
+    def similarity_search(self, query: str, k: int = 4, filter: dict = None, **kwargs) -> list:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, filter=filter, **kwargs)]
+
+    def batch_similarity_search(self, queries: list, k: int = 4, filter: dict = None, **kwargs) -> list:
+        """批量文本检索，查询向量一次性计算"""
+        embeddings = self._embedding.embed_documents(list(queries))
+        hits = self.search_vectors(embeddings, k=k, filter=filter, nprobe=kwargs.get("nprobe"))
+        return [[doc for doc, _ in self._to_documents(h)] for h in hits]
+
+    def _select_relevance_score_fn(self):
+        return lambda score: score  # 余弦相似度本身即为相关性得分
+
+    @classmethod
+    def from_texts(cls, texts: list, embedding: Embeddings, metadatas: list = None, ids: list = None,
+                   persist_directory: str = None, **kwargs) -> "NumpyVectorStore":
+        store = cls(embedding, persist_directory=persist_directory, **kwargs)
+        store.add_texts(texts, metadatas, ids=ids)
+        store.save()
+        return store
+
+
+def benchmark_numpy_store(n: int = 200000, dim: int = 1024, n_queries: int = 64, k: int = 10,
+                          n_clusters: int = 256, nprobe: int = 16):
+    """
+    在随机向量上评估 NumPy 索引：float16/int8 精确检索与聚类检索的延迟，以及聚类检索相对精确检索的召回率
+    """
+    import tempfile
+
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((n_clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, n_clusters, n)] + 0.5 * rng.standard_normal((n, dim)).astype(np.float32)
+    queries = vectors[rng.choice(n, n_queries, replace=False)] + 0.1 * rng.standard_normal((n_queries, dim)).astype(np.float32)
+    texts = [f"doc {i}" for i in range(n)]
+    ids = [str(i) for i in range(n)]
+
+    results = {}
+    for dtype in ("float16", "int8"):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            store = NumpyVectorStore(None, persist_directory=tmp_dir, dtype=dtype, n_clusters=n_clusters, nprobe=nprobe)
+            store.add_embeddings(texts, vectors, ids=ids)
+            store.save()
+
+            start = time.perf_counter()
+            store = NumpyVectorStore(None, persist_directory=tmp_dir)
+            cold_start = time.perf_counter() - start
+
+            start = time.perf_counter()
+            exact = store.search_vectors(queries, k=k, nprobe=n_clusters)
+            exact_time = time.perf_counter() - start
+            start = time.perf_counter()
+            approx = store.search_vectors(queries, k=k)
+            approx_time = time.perf_counter() - start
+            recall = np.mean([len({r for r, _ in a} & {r for r, _ in e}) / k for a, e in zip(approx, exact)])
+            results[dtype] = {
+                "cold_start_ms": round(1000 * cold_start, 2),
+                "exact_ms_per_query": round(1000 * exact_time / n_queries, 2),
+                "ivf_ms_per_query": round(1000 * approx_time / n_queries, 2),
+                f"ivf_recall@{k}": round(float(recall), 3),
+            }
+    logger.info(f"Numpy vector store benchmark (n={n}, dim={dim}): {results}")
+    return results
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(benchmark_numpy_store())
@@ -0,0 +1,75 @@
+import logging
+import time
+
+from pywinauto import findwindows
+
+logger = logging.getLogger()
+
+
+def list_process_windows(process_ids) -> list:
+    """
+    通过 win32 EnumWindows 枚举指定进程的顶层窗口句柄，
+    只在本进程内调用 user32，不经过跨进程的 UIA 遍历
+    """
+    handles = []
+    for process_id in process_ids:
+        handles.extend(findwindows.find_windows(process=process_id, top_level_only=True))
+    return handles
+
+
+class WindowRegistry:
+    """
+    目标进程的顶层窗口注册表：
+    - 只跟踪 process_ids 中进程的顶层窗口，不再每次枚举整个桌面
+    - 以 diff 形式报告新打开/已关闭的窗口
+    - 在 begin_action/end_action 之间新出现的窗口会记录为由该动作打开 (origins)
+    """
+    def __init__(self, process_ids, list_windows=None):
+        self.process_ids = set(process_ids)
+        self._list_windows = list_windows or (lambda: list_process_windows(self.process_ids))
+        self.windows = set(self._list_windows())
+        self.origins = {}       # handle -> 打开该窗口的动作
+        self._action = None
+        self.stats = {"refreshes": 0, "seconds": 0.0}
+
+    def track_process(self, process_id: int):
+        """追加需要跟踪的进程（例如应用拉起的独立窗口进程）"""
+        self.process_ids.add(process_id)
+
+    def list_windows(self) -> list:
+        """当前跟踪进程的顶层窗口句柄"""
+        return self._list_windows()
+
+    def refresh(self) -> tuple:
+        """重新枚举一次，返回 (新窗口集合, 已关闭窗口集合)"""
+        start = time.perf_counter()
+        current = set(self._list_windows())
+        new_windows = current - self.windows
+        closed_windows = self.windows - current
+        self.windows = current
+        for handle in new_windows:
+            self.origins[handle] = self._action
+        for handle in closed_windows:
+            self.origins.pop(handle, None)
+        self.stats["refreshes"] += 1
+        self.stats["seconds"] += time.perf_counter() - start
+        if new_windows or closed_windows:
+            logger.debug(f"Window diff after {self._action}: new={new_windows}, closed={closed_windows}")
+        return new_windows, closed_windows
+
+    def begin_action(self, action):
+        """标记动作开始，之后出现的新窗口归属于该动作；先同步一次窗口集合，动作之外的变化不计入该动作"""
+        self._action = None
+        self.refresh()
+        self._action = action
+
+    def end_action(self) -> tuple:
+        """动作结束，返回该动作造成的 (新窗口集合, 已关闭窗口集合)"""
+        try:
+            return self.refresh()
+        finally:
+            self._action = None
+
+    def opened_by(self, handle):
+        """查询窗口是由哪个动作打开的"""
+        return self.origins.get(handle)